@@ -0,0 +1,133 @@
+"""
+Module for the TemperatureIndex class, which matches timestamps (such as those of sweeps) with the
+temperatures measured around them.
+"""
+
+import os
+import warnings
+
+import numpy as np
+
+
+# Alignment modes.
+NEAREST = 'nearest'
+LINEAR = 'linear'
+WINDOW = 'window'
+MODES = (NEAREST, LINEAR, WINDOW)
+
+# Seconds a temperature may be away from the timestamp it is matched with.
+DEFAULT_MAX_GAP = 30
+
+# Seconds of temperatures averaged in window mode, centered on the timestamp.
+DEFAULT_WINDOW = 30
+
+
+class TemperatureIndex:
+    """
+    Temperatures sorted by time, so any number of timestamps can be aligned with them at once with
+    a binary search.
+    """
+
+    def __init__(self, times: np.ndarray, temps: np.ndarray):
+        """
+        :param times: Timestamps of the temperature samples.
+        :param temps: Temperatures, one row per sample and one column per sensor.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        temps = np.asarray(temps, dtype=np.float64)
+        if len(times):
+            temps = temps.reshape(len(times), -1)
+        else:
+            # The number of sensors of an empty array can't be inferred by reshape().
+            temps = temps.reshape(0, temps.shape[1] if temps.ndim == 2 else 0)
+        if np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable')
+            times, temps = times[order], temps[order]
+        self.times = times
+        self.temps = temps
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'TemperatureIndex':
+        """
+        Load the temperatures of an experiment.
+
+        :param path: Path of temperatures.csv.
+        """
+        if os.path.getsize(path) == 0:
+            return cls(np.empty(0), np.empty((0, 2)))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            data = np.loadtxt(path, delimiter=',', ndmin=2)
+        if data.size == 0:
+            # Only blank lines, such as when the ESP32 was never connected.
+            return cls(np.empty(0), np.empty((0, 2)))
+        return cls(data[:, 0], data[:, 1:])
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def align(self, ts, mode: str = NEAREST, max_gap: float = DEFAULT_MAX_GAP,
+              window: float = DEFAULT_WINDOW) -> np.ndarray:
+        """
+        Find the temperatures at the given timestamps.
+
+        * nearest: the sample closest in time, if it is at most max_gap seconds away.
+        * linear: interpolated between the samples before and after, if both are at most max_gap
+          seconds away. The single sample on one side is used at the ends of the data.
+        * window: the mean of the samples within window/2 seconds on either side.
+
+        :param ts: Timestamps to align.
+        :param mode: One of MODES.
+        :param max_gap: Largest distance to a sample, in seconds, for nearest and linear modes.
+        :param window: Width of the window, in seconds, for window mode.
+        :raises ValueError: If the mode is unknown.
+        :return: Temperatures, one row per timestamp and one column per sensor. NaN where no sample
+        matches.
+        """
+        if mode not in MODES:
+            raise ValueError(f'Unknown alignment mode: {mode!r}')
+
+        ts = np.asarray(ts, dtype=np.float64)
+        out = np.full((len(ts), self.temps.shape[1]), np.nan)
+        if len(self.times) == 0 or len(ts) == 0:
+            return out
+
+        if mode == WINDOW:
+            return self._window(ts, window)
+
+        # Samples on either side of each timestamp, clipped to the ends of the data.
+        right = np.searchsorted(self.times, ts, side='left')
+        left = np.clip(right - 1, 0, len(self.times) - 1)
+        right = np.clip(right, 0, len(self.times) - 1)
+        gap_left = np.abs(ts - self.times[left])
+        gap_right = np.abs(self.times[right] - ts)
+
+        if mode == NEAREST:
+            nearest = np.where(gap_left <= gap_right, left, right)
+            ok = np.minimum(gap_left, gap_right) <= max_gap
+            out[ok] = self.temps[nearest[ok]]
+            return out
+
+        span = self.times[right] - self.times[left]
+        weight = np.divide(ts - self.times[left], span, out=np.zeros_like(ts), where=span > 0)
+        weight = np.clip(weight, 0, 1)[:, None]
+        interpolated = self.temps[left] * (1 - weight) + self.temps[right] * weight
+        # A timestamp outside the data has the same sample on both sides, and one that falls on a
+        # sample doesn't need the sample before it.
+        ok = ((gap_left <= max_gap) & (gap_right <= max_gap)) | (gap_right == 0)
+        out[ok] = interpolated[ok]
+        return out
+
+    def _window(self, ts: np.ndarray, window: float) -> np.ndarray:
+        lo = np.searchsorted(self.times, ts - window / 2, side='left')
+        hi = np.searchsorted(self.times, ts + window / 2, side='right')
+
+        # Sums over any range of samples from cumulative sums, skipping NaN readings.
+        valid = np.isfinite(self.temps)
+        zero = np.zeros((1, self.temps.shape[1]))
+        sums = np.concatenate([zero, np.cumsum(np.where(valid, self.temps, 0), axis=0)])
+        counts = np.concatenate([zero, np.cumsum(valid, axis=0)])
+
+        total = sums[hi] - sums[lo]
+        n = counts[hi] - counts[lo]
+        return np.divide(total, n, out=np.full(total.shape, np.nan), where=n > 0)
@@ -2,21 +2,54 @@
 Module for the AppThread class.
 """
 
-from datetime import datetime
 import logging
 import os
-import queue
-import socket
-from threading import Thread
+from threading import Lock, Thread
 import time
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
 
 import serial
 
+from broker import Broker
+from catalog import Catalog
 from config import Config
+from instruments import InstrumentManager, NotConnected, VNASession
 from metadata import Metadata
-# from vna import build_cmd
-from vna_funcs import ping_vna, vna_csv, vna_s2p
+from metrics import Counter, Histogram
+from scheduler import Scheduler
+from store import ExperimentStore
+from sweep import Sweep
+from temp_stream import Sample, TemperatureStream
+from timeseries import TimeSeries
+from tracing import TRACER
+from utils import timestamp_name
+from vna_funcs import vna_binary, vna_csv, vna_s2p
+from writer import Writer
+
+
+# Seconds between temperature readings.
+TEMPERATURE_PERIOD = 15
+
+# Seconds between VNA keepalive pings.
+KEEPALIVE_PERIOD = 15
+
+# Seconds before trying a failed sweep again, doubling with each attempt.
+RETRY_DELAY = 1
+
+# Most attempts at a failed sweep before waiting for the next period.
+MAX_RETRIES = 5
+
+# Number of temperature samples kept in memory (a week at one sample every 15 seconds).
+HISTORY_CAPACITY = 7 * 24 * 60 * 4
+
+SERIAL_READ_SECONDS = Histogram('cryo_serial_read_seconds', 'Seconds the microcontroller took to answer GET TEMP.')
+SERIAL_TIMEOUTS = Counter('cryo_serial_timeouts_total', 'GET TEMP requests the microcontroller did not answer in time.')
+VNA_TRANSFER_SECONDS = Histogram('cryo_vna_transfer_seconds', 'Seconds taken by a transfer from a VNA.', ['vna', 'kind'])
+VNA_TRANSFER_BYTES = Counter('cryo_vna_transfer_bytes_total', 'Bytes transferred from a VNA.', ['vna', 'kind'])
+VNA_RETRIES = Counter('cryo_vna_retries_total', 'Sweeps of a VNA that had to be tried again.', ['vna'])
+CYCLE_SECONDS = Histogram('cryo_cycle_duration_seconds', 'Seconds taken by an acquisition cycle.')
 
 
 class AppThread(Thread):
@@ -36,275 +69,439 @@ class AppThread(Thread):
         # Whether an experiment has been selected.
         self.experiment_selected = False
 
+        # Scheduler for the sweeps, temperature readings and VNA keepalive.
+        self.scheduler = Scheduler()
+
         # Whether or not the experiment is running.
-        self.running = False
+        self._running = False
 
-        # Serial connection to microcontroller.
-        self.con: Optional[serial.Serial] = None
+        # Connections to the microcontroller and the VNAs.
+        self.instruments = InstrumentManager()
 
-        # VNA connections.
-        self.vna_con1: Optional[socket.socket] = None
-        self.vna_con2: Optional[socket.socket] = None
+        # Reader of the samples pushed by the microcontroller, when streaming.
+        self.stream: Optional[TemperatureStream] = None
 
-        # Temperature data collected by the experiment.
-        self.data = []
+        # Held while starting or stopping the stream, which the HTTP handlers also do.
+        self._stream_lock = Lock()
 
-        # Collection of queues used for data streaming.
-        self.queue_pool: List[queue.Queue] = []
+        # Broker sending the temperature data to the data streams.
+        self.broker = Broker()
 
         # Directory to store data in.
         self.dir: Optional[str] = None
 
+        # Writer saving the data to disk, so acquisition doesn't wait on the disk.
+        self.writer = Writer(self.config)
+        self.writer.start()
+
+        # Temperature data collected by the experiment, spilling to disk on the writer.
+        self.data = TimeSeries(HISTORY_CAPACITY, writer=self.writer)
+
+        # File the temperature samples are appended to, None while the experiment isn't running.
+        self.temperature_path: Optional[str] = None
+
+        # Binary store of the running experiment's data.
+        self.store: Optional[ExperimentStore] = None
+
+        # Index of the experiments, kept up to date as data is saved.
+        self.catalog = Catalog()
+
         # Wether or not the application has been killed.
         self.killed = False
 
+    @property
+    def running(self) -> bool:
+        """
+        Whether or not the experiment is running.
+        """
+        return self._running
+
+    @running.setter
+    def running(self, value: bool):
+        self._running = value
+        # Start or stop right away instead of at the next deadline.
+        self.scheduler.wake()
+
     def run(self):
         """
         Function that is run when the thread is started.
         """
-        # Run forever as long as the thread has not been killed.
-        while not self.killed:
-
-            last_reading = 0
-
-            # If the experiment is running.
-            if self.running:
-                path = os.path.join('experiments', self.dir, 'temperatures.csv')
-                # Open the file for saving temperature data.
-                with open(path, 'w+', encoding='utf-8') as wf:
-                    # We loop here so check again if the experiment is running and the
-                    # application is alive.
-                    while self.running and not self.killed:
-
-                        # Whether we need to try again at taking data due to an error.
-                        retry = False
-
-                        # Get the current time.
-                        t = time.time()
-
-                        # If we have a USB connection.
-                        if self.con:
-                            try:
-                                temp1, temp2 = self._read_temp_data()
-                                
-                                data = {
-                                    'time': t,
-                                    'temp1': temp1,
-                                    'temp2': temp2,
-                                }
-
-                                # Store data points in memory.
-                                self.data.append(data)
-                                # Write to the CSV file.
-                                wf.write(f'{t},{temp1},{temp2}\n')
-                                wf.flush()
-
-                                last_reading = t
-
-                                # Send data to every queue in the pool.
-                                for q in self.queue_pool:
-                                    q.put(data)
-
-                            except serial.serialutil.SerialException:
-                                msg = 'Encountered an error while communicating with the ESP32.' \
-                                      'Closing connection.'
-                                logging.exception(msg)
-                                try:
-                                    self.con.close()
-                                except:
-                                    logging.exception('Error closing connection.')
-                                self.con = None
-                            except:
-                                logging.exception('Exception encountered in app thread.')
-
-                        # If we are connected to VNA 1.
-                        if self.vna_con1:
-                            print('VNA1')
-                            try:
-                                dt = datetime.fromtimestamp(t)
-                                name = f'{dt.year}_{dt.month:02d}_{dt.day:02d}_{dt.hour:02d}_{dt.minute:02d}_{dt.second:02d}'
-                                
-                                f_name = f'{name}_vna1.csv'
-                                fpath = os.path.join('experiments', self.dir, f_name)
-                                result = vna_csv(self.vna_con1, fpath)
-                                if not result:
-                                    retry = True
-                                    continue
-                                
-                                f_name = f'{name}_vna1.s2p'
-                                fpath = os.path.join('experiments', self.dir, f_name)
-                                result = vna_s2p(self.vna_con1, 201, fpath)
-                                if not result:
-                                    retry = True
-                                    continue
-                            except:
-                                logging.exception('Error.')
-                                try:
-                                    self.vna_con1.close()
-                                except:
-                                    logging.exception('Error closing connection.')
-                                self.vna_con1 = None
-
-                        # If we are connected to VNA 2.
-                        if self.vna_con2:
-                            print('VNA2')
-                            try:
-                                dt = datetime.fromtimestamp(t)
-                                name = f'{dt.year}_{dt.month:02d}_{dt.day:02d}_{dt.hour:02d}_{dt.minute:02d}_{dt.second:02d}'
-                                
-                                f_name = f'{name}_vna2.csv'
-                                fpath = os.path.join('experiments', self.dir, f_name)
-                                result = vna_csv(self.vna_con2, fpath)
-                                if not result:
-                                    retry = True
-                                    continue
-                                
-                                f_name = f'{name}_vna2.s2p'
-                                fpath = os.path.join('experiments', self.dir, f_name)
-                                result = vna_s2p(self.vna_con2, 201, fpath)
-                                if not result:
-                                    retry = True
-                                    continue
-                            except:
-                                logging.exception('Error.')
-                                try:
-                                    self.vna_con2.close()
-                                except:
-                                    logging.exception('Error closing connection.')
-                                self.vna_con2 = None
-                        
+        # Deadline of the last sweep, the next sweep is due one period later.
+        sweep_base: Optional[float] = None
+
+        # VNAs whose transfer needs to be tried again due to an error, how many times it was tried
+        # again so far and when to try next.
+        retry: List[str] = []
+        attempts = 0
+        retry_at = 0.0
+
+        now = time.monotonic()
+        self.scheduler.schedule('temperature', now)
+        self.scheduler.schedule('keepalive', now + KEEPALIVE_PERIOD)
+
+        try:
+            # Run forever as long as the thread has not been killed.
+            while not self.killed:
+                now = time.monotonic()
+
+                if self.running:
+                    if self.temperature_path is None:
+                        path = os.path.join('experiments', self.dir, 'temperatures.csv')
+                        # Empty the file for saving temperature data, and wait for it so that the
+                        # catalog counts from an empty file.
+                        self.writer.write_file(path, b'')
+                        self.writer.sync()
+                        # Move the oldest samples to disk once the history is full, starting from an
+                        # empty file rather than the previous experiment's.
+                        self.data.reset_spill(os.path.join('experiments', self.dir, 'history.bin'))
+                        self.store = ExperimentStore(os.path.join('experiments', self.dir, 'store'))
+                        # The file was just emptied, so start counting over.
+                        self.catalog.rescan([self.dir])
+                        sweep_base = None
+                        retry = []
+                        attempts = 0
+                        # Samples are saved from here on.
+                        self.temperature_path = path
+                    # Take the first sweep right away, then once per period.
+                    if retry:
+                        self.scheduler.schedule('sweep', retry_at)
+                    elif sweep_base is None:
+                        self.scheduler.schedule('sweep', now)
+                    else:
+                        self.scheduler.schedule('sweep', sweep_base + self.config.period)
+                elif self.temperature_path is not None:
+                    self.writer.close_file(self.temperature_path)
+                    self.temperature_path = None
+                    # After the appends already queued.
+                    self.writer.call(self.store.close)
+                    self.store = None
+                    self.scheduler.cancel('sweep')
+
+                due = self.scheduler.due(now)
+
+                if 'sweep' in due:
+                    deadline = self.scheduler.deadline('sweep')
+
+                    # Get the current time.
+                    t = time.time()
+
+                    with TRACER.span('cycle', 'cycle', retry=list(retry)):
+                        # A retry only captures the VNAs again, the temperature was read with the
+                        # first attempt.
                         if not retry:
-                            # Sleep until it's time to collect the next data point.
-                            start_time = t
-                            while self.running and not self.killed and time.time() < start_time + self.config.period:
-                                t = time.time()
-                                if self.con and t >= last_reading + 15:
-
-                                    try:
-                                        temp1, temp2 = self._read_temp_data()
-                                        data = {
-                                            'time': t,
-                                            'temp1': temp1,
-                                            'temp2': temp2,
-                                        }
-
-                                        # Store data points in memory.
-                                        self.data.append(data)
-
-                                        # Send data to every queue in the pool.
-                                        for q in self.queue_pool:
-                                            q.put(data)
-                                    
-                                    except serial.serialutil.SerialException:
-                                        msg = 'Encountered an error while communicating with the ESP32.' \
-                                            'Closing connection.'
-                                        logging.exception(msg)
-                                        try:
-                                            self.con.close()
-                                        except:
-                                            logging.exception('Error closing connection.')
-                                        self.con = None
-                                    except:
-                                        logging.exception('Exception encountered in app thread.')
-
-                                    if self.vna_con1:
-                                        # Ping VNA 1 to see if it's still connected.
-                                        if not ping_vna(self.vna_con1):
-                                            self.vna_con1 = None
-
-                                    if self.vna_con2:
-                                        # Ping VNA 2 to see if it's still connected.
-                                        if not ping_vna(self.vna_con2):
-                                            self.vna_con2 = None
-                                    
-                                    last_reading = t
-                                    
-                                # Sleep to avoid wasting CPU resources.
-                                time.sleep(0.001)
-
-            while not self.running and not self.killed:
-                t = time.time()
-                if self.con and t >= last_reading + 15:
-                    try:
-                        temp1, temp2 = self._read_temp_data()
-                        data = {
-                            'time': t,
-                            'temp1': temp1,
-                            'temp2': temp2,
-                        }
-
-                        # Store data points in memory.
-                        self.data.append(data)
-
-                        # Send data to every queue in the pool.
-                        for q in self.queue_pool:
-                            q.put(data)
-                    except serial.serialutil.SerialException:
-                        msg = 'Encountered an error while communicating with the ESP32.' \
-                                'Closing connection.'
-                        logging.exception(msg)
-                        try:
-                            self.con.close()
-                        except:
-                            logging.exception('Error closing connection.')
-                        self.con = None
-                    except:
-                        logging.exception('Exception encountered in app thread.')
-
-                    if self.vna_con1:
-                        # Ping VNA 1 to see if it's still connected.
-                        if not ping_vna(self.vna_con1):
-                            self.vna_con1 = None
-
-                    if self.vna_con2:
-                        # Ping VNA 2 to see if it's still connected.
-                        if not ping_vna(self.vna_con2):
-                            self.vna_con2 = None
-
-                    last_reading = t
-                # Sleep to avoid wasting CPU resources.
-                time.sleep(0.001)
-
-    def get_queue(self) -> queue.Queue:
+                            with TRACER.span('temperature', 'cycle'):
+                                taken = self._take_temperature(t)
+                            if taken:
+                                self.scheduler.schedule('temperature', now + TEMPERATURE_PERIOD)
+
+                        with TRACER.span('sweep', 'cycle'):
+                            retry = self._sweep(t, retry or None)
+                        # Commit the catalog after the sweep's files are written.
+                        self.writer.call(self.catalog.flush)
+                        if self.store:
+                            self.writer.call(self.store.flush)
+
+                    finished = time.monotonic()
+                    self.scheduler.record_cycle(deadline, now, finished, self.config.period)
+                    CYCLE_SECONDS.observe(finished - now)
+                    if retry:
+                        attempts += 1
+                        if attempts > MAX_RETRIES:
+                            logging.warning(f'Giving up on the sweep of {", ".join(retry)} after {MAX_RETRIES} retries.')
+                            retry = []
+                        else:
+                            retry_at = finished + RETRY_DELAY * 2 ** (attempts - 1)
+                    if not retry:
+                        attempts = 0
+                        next_deadline = self.scheduler.next_deadline(deadline, self.config.period, finished)
+                        sweep_base = next_deadline - self.config.period
+                    # Don't run the other tasks against a stale clock.
+                    continue
+
+                if 'temperature' in due:
+                    with TRACER.span('temperature', 'cycle'):
+                        self._take_temperature(time.time())
+                    self.scheduler.schedule('temperature', now + TEMPERATURE_PERIOD)
+
+                if 'keepalive' in due:
+                    with TRACER.span('keepalive', 'cycle'):
+                        self._keepalive()
+                    self.scheduler.schedule('keepalive', now + KEEPALIVE_PERIOD)
+
+                # Sleep until the next deadline or until we are woken up.
+                self.scheduler.wait()
+        finally:
+            if self.temperature_path is not None:
+                self.writer.close_file(self.temperature_path)
+                self.temperature_path = None
+            if self.store:
+                self.writer.call(self.store.close)
+                self.store = None
+
+    def _take_temperature(self, t: float) -> Optional[Dict]:
+        """
+        Read the temperatures, store them in memory and send them to the data streams.
+
+        :param t: Timestamp of the reading.
+        :return: The data point, None if there is no connection or the reading failed.
+        """
+        if self.config.stream_period > 0:
+            # Restart the stream if it stopped after an error.
+            stream = self.configure_stream(restart=False)
+            return self._stream_reading(stream) if stream else None
+
+        try:
+            with self.instruments.temperature.acquire() as con:
+                temps = self._read_temp_data(con)
+        except NotConnected:
+            return None
+        except serial.serialutil.SerialException:
+            logging.exception('Encountered an error while communicating with the ESP32. Reconnecting.')
+            return None
+        except:
+            logging.exception('Exception encountered in app thread.')
+            return None
+
+        # The history and the plots hold the first two channels.
+        temp1, temp2 = (temps + [np.nan, np.nan])[:2]
+        data = {
+            'time': t,
+            'temp1': temp1,
+            'temp2': temp2,
+        }
+
+        # Store data points in memory and save them.
+        seq = self.data.append(t, temp1, temp2)
+        self._save_temperature(t, temps)
+
+        # Send data to the data streams.
+        self.broker.publish('temperature', data, seq)
+
+        return {**data, 'temps': temps}
+
+    def configure_stream(self, restart: bool = True) -> Optional[TemperatureStream]:
+        """
+        Start or stop the temperature stream to match the configuration. Safe to call from any
+        thread; the old stream is stopped before a new one is started on the same connection.
+
+        :param restart: Whether to restart a running stream so that it picks up a new period or
+        connection, rather than keeping it.
+        :return: The running stream, None if not streaming.
+        """
+        with self._stream_lock:
+            if self.stream and not restart:
+                return self.stream
+
+            if self.stream:
+                self.stream.stop()
+                self.stream = None
+
+            if self.config.stream_period > 0:
+                try:
+                    con = self.instruments.temperature.connection()
+                except NotConnected:
+                    return None
+                self.stream = TemperatureStream(con, self.config.stream_period, self._on_sample)
+                self.stream.start()
+            return self.stream
+
+    def stop_stream(self) -> None:
         """
-        Get a new queue for the data stream.
+        Stop the temperature stream, if running, so that its connection can be replaced.
+        """
+        with self._stream_lock:
+            if self.stream:
+                self.stream.stop()
+                self.stream = None
+
+    def _on_sample(self, sample: Sample) -> None:
+        """
+        Store a sample pushed by the microcontroller and send it to the data streams. Called on
+        the stream's thread.
+        """
+        data = {
+            'time': sample.time,
+            'temp1': sample.temp1,
+            'temp2': sample.temp2,
+        }
+        seq = self.data.append(sample.time, sample.temp1, sample.temp2)
+        self._save_temperature(sample.time, [sample.temp1, sample.temp2])
+        self.broker.publish('temperature', data, seq)
+
+    def _save_temperature(self, t: float, temps: List[float]) -> None:
+        """
+        Queue a temperature sample to be appended to temperatures.csv and the experiment's store,
+        if the experiment is running.
+
+        :param t: Timestamp of the sample.
+        :param temps: Temperature of every channel, the store holds the first two.
+        """
+        path, store = self.temperature_path, self.store
+        if path is None:
+            return
+
+        # Write every channel to the CSV file.
+        line = (','.join(str(x) for x in [t] + temps) + '\n').encode('utf-8')
+        self.writer.append(path, line)
+        self.catalog.record_temperature(self.dir, t, len(line))
+
+        if store:
+            temp1, temp2 = (temps + [np.nan, np.nan])[:2]
+            self.writer.call(store.append_temperature, t, temp1, temp2)
+
+    def _stream_reading(self, stream: TemperatureStream) -> Optional[Dict]:
+        """
+        :return: The latest sample pushed by the microcontroller, None if there is none.
+        """
+        if stream.error:
+            logging.error('Encountered an error while communicating with the ESP32. Reconnecting.')
+            with self._stream_lock:
+                # Unless a handler already replaced it.
+                if self.stream is not stream:
+                    return None
+                self.stream = None
+                self.instruments.temperature.drop()
+            return None
+
+        sample = stream.latest
+        if sample is None:
+            return None
+        return {
+            'time': sample.time,
+            'temp1': sample.temp1,
+            'temp2': sample.temp2,
+            'temps': [sample.temp1, sample.temp2],
+        }
+
+    def _sweep(self, t: float, vnas: Optional[List[str]] = None) -> List[str]:
+        """
+        Save a sweep from each connected VNA. The VNAs are captured in parallel under the same
+        timestamp, so the sweep takes as long as the slowest VNA.
+
+        :param t: Timestamp of the sweep.
+        :param vnas: Ids of the VNAs to capture, defaults to all of them.
+        :return: Ids of the VNAs whose transfer failed and needs to be retried.
+        """
+        # Start a capture for each VNA that was connected, it is reconnected if it dropped.
+        futures = {}
+        for vna, session in self.instruments.vnas.items():
+            if session.target and (vnas is None or vna in vnas):
+                try:
+                    futures[vna] = self.instruments.submit(self._capture_vna, vna, session, t)
+                except NotConnected:
+                    # Stopping, the remaining VNAs are not captured.
+                    break
+
+        # Wait for every capture to finish.
+        failed = [vna for vna, future in futures.items() if not future.result()]
+        for vna in failed:
+            VNA_RETRIES.labels(vna).inc()
+        return failed
+
+    def _capture_vna(self, vna: str, session: VNASession, t: float) -> bool:
+        """
+        Save the .csv and .s2p files of a sweep from one VNA.
+
+        :param vna: Id of the VNA, such as 'vna1'.
+        :param session: Session of the VNA.
+        :param t: Timestamp of the sweep.
+        :return: False if the transfer failed and needs to be retried, True otherwise.
+        """
+        logging.debug(f'Capturing {session.name}.')
+        try:
+            with TRACER.span('capture', 'vna', vna=vna), session.acquire() as con:
+                name = timestamp_name(t)
+                csv_path = os.path.join('experiments', self.dir, f'{name}_{vna}.csv')
+                s2p_path = os.path.join('experiments', self.dir, f'{name}_{vna}.s2p')
+
+                if self.config.binary_transfer:
+                    # Pull the traces in binary, then leave storing them and writing the files
+                    # locally to the writer.
+                    sweep = self._transfer(vna, 'binary', vna_binary, con)
+                    store = self.store
+                    if store:
+                        self.writer.call(store.append_sweep, vna, t, sweep, size=sweep.nbytes)
+                    if self.config.sweep_files:
+                        self.writer.call(sweep.write_csv, csv_path, size=sweep.nbytes)
+                        self.writer.call(sweep.write_s2p, s2p_path)
+                        self.writer.call(self._record_sweep, vna, csv_path, s2p_path)
+                    return True
+
+                # A bad transfer raises, which drops the connection and counts toward the
+                # session's backoff.
+                csv = self._transfer(vna, 'csv', vna_csv, con)
+                if not csv:
+                    raise ValueError(f'{session.name} returned an empty .csv file.')
+                s2p = self._transfer(vna, 's2p', vna_s2p, con)
+
+                self.writer.write_file(csv_path, csv)
+                self.writer.write_file(s2p_path, s2p)
+                self.catalog.record_sweep(self.dir, vna, len(csv) + len(s2p))
+        except NotConnected:
+            pass
+        except:
+            logging.exception(f'Error capturing {session.name}.')
+            # Try again once on a new connection, then wait for the session's backoff.
+            return session.failures > 1
+        return True
+
+    def _transfer(self, vna: str, kind: str, fn: Callable, *args):
+        """
+        Call a transfer function, counting the time it took and the bytes it returned in the
+        metrics.
 
-        :return: A queue containing all data up to this point.
+        :param vna: Id of the VNA, such as 'vna1'.
+        :param kind: Kind of transfer, such as 'csv'.
+        :return: What the function returned.
         """
-        # Create a new queue.
-        q = queue.Queue()
+        with VNA_TRANSFER_SECONDS.labels(vna, kind).time():
+            result = fn(*args)
+        if result is not None:
+            VNA_TRANSFER_BYTES.labels(vna, kind).inc(result.nbytes if isinstance(result, Sweep) else len(result))
+        return result
 
-        # Add previous data to the queue.
-        for item in self.data:
-            q.put(item)
+    def _record_sweep(self, vna: str, *paths: str) -> None:
+        """
+        Count a saved sweep in the catalog.
 
-        # Add the queue to the queue pool.
-        self.queue_pool.append(q)
+        :param vna: Id of the VNA, such as 'vna1'.
+        :param paths: Files of the sweep.
+        """
+        size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        self.catalog.record_sweep(self.dir, vna, size)
 
-        return q
+    def _keepalive(self) -> None:
+        """
+        Ping the VNAs to see if they're still connected, and reconnect the ones that dropped.
+        """
+        self.instruments.keepalive()
 
     def stop(self):
         """
         Stop the thread.
         """
         self.killed = True
+        self.scheduler.wake()
+        self.stop_stream()
         # Close all connections.
-        if self.con:
-            self.con.close()
-        if self.vna_con1:
-            self.vna_con1.close()
-        if self.vna_con2:
-            self.vna_con2.close()
-
-    def _read_temp_data(self):
-        # Request temperature from ESP32
-        self.con.write('GET TEMP\n'.encode('utf-8'))
-        self.con.flush()
-
-        # Read until the newline character, decode to utf-8,
-        # and remove the ending newline character.
-        data = self.con.readline().decode('utf-8').rstrip()
+        self.instruments.close()
+        # Write out everything queued before committing the catalog.
+        self.writer.stop()
+        self.catalog.flush()
+
+    def _read_temp_data(self, con: serial.Serial) -> List[float]:
+        with TRACER.span('GET TEMP', 'serial'):
+            # Request the temperature of every channel from the ESP32 at once.
+            con.write('GET TEMP\n'.encode('utf-8'))
+            con.flush()
+
+            # Read until the newline character, decode to utf-8,
+            # and remove the ending newline character.
+            with SERIAL_READ_SECONDS.time():
+                line = con.readline()
+        if not line.endswith(b'\n'):
+            # readline() gave up after the timeout, the parsing below fails.
+            SERIAL_TIMEOUTS.inc()
+        data = line.decode('utf-8').rstrip()
         # Get temperatures from the string.
-        temp1, temp2 = [float(x) for x in data.split(',')]
-
-        return temp1, temp2
+        return [float(x) for x in data.split(',')]
@@ -0,0 +1,193 @@
+"""
+Module for the AsyncServer class.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http.client import parse_headers
+import io
+import logging
+from typing import Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from app_thread import AppThread
+from handler import STREAM_KEEPALIVE, build_history_event, parse_stream_params
+
+
+# Maximum size of a request's line and headers.
+MAX_HEADER_SIZE = 64 * 1024
+
+
+class _Request:
+    """
+    A buffered request handed to the response handler in place of a socket.
+    """
+
+    def __init__(self, raw: bytes):
+        self.rfile = io.BytesIO(raw)
+        self.wfile = io.BytesIO()
+
+
+class AsyncServer:
+    """
+    HTTP server running on a single asyncio event loop. Data streams are served on the loop itself,
+    so an open dashboard costs a file descriptor instead of a thread. Every other route is served by
+    the regular response handler on a small thread pool, since those requests are short.
+    """
+
+    def __init__(self, app_thread: AppThread, handler_class, workers: int = 4):
+        """
+        :param app_thread: AppThread that will run application operations concurrent to server
+        operations.
+        :param handler_class: Response handler from build_response_handler().
+        :param workers: Number of threads serving the other routes.
+        """
+        self.app_thread = app_thread
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+
+        class BufferedHandler(handler_class):
+            """
+            Response handler reading from and writing to memory instead of a socket.
+            """
+
+            def setup(self):
+                self.rfile = self.request.rfile
+                self.wfile = self.request.wfile
+
+            def finish(self):
+                pass
+
+        self.handler_class = BufferedHandler
+
+        # Events of the data streams waiting for data.
+        self._waiters: Set[asyncio.Event] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def serve_forever(self, server_address: Tuple[str, int]) -> None:
+        """
+        Run the server until it is interrupted.
+        """
+        asyncio.run(self.serve(server_address))
+
+    async def serve(self, server_address: Tuple[str, int]) -> None:
+        """
+        Accept connections until the task is cancelled.
+        """
+        self._loop = asyncio.get_running_loop()
+        # Wake up the data streams when the app thread publishes data.
+        self.app_thread.broker.add_listener(self._on_publish)
+        try:
+            host, port = server_address
+            server = await asyncio.start_server(self.handle_connection, host or None, port, limit=MAX_HEADER_SIZE)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.app_thread.broker.remove_listener(self._on_publish)
+            self.pool.shutdown(wait=False)
+
+    def _on_publish(self) -> None:
+        # Called on the app thread, hand off to the event loop.
+        self._loop.call_soon_threadsafe(self._wake_streams)
+
+    def _wake_streams(self) -> None:
+        for event in self._waiters:
+            event.set()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve a single request on a connection, then close it.
+        """
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+
+            request_line, _, header_bytes = head.partition(b'\r\n')
+            try:
+                method, target, _ = request_line.decode('iso-8859-1').split(' ', 2)
+            except ValueError:
+                writer.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
+                return
+            headers = parse_headers(io.BytesIO(header_bytes))
+            parsed = urlparse(target)
+
+            if method == 'GET' and parsed.path == '/api/stream_data':
+                await self.stream_data(writer, parse_qs(parsed.query), headers)
+                return
+
+            # The GUI sends the body's length in a 'length' header, browsers add Content-Length.
+            length = headers.get('Content-Length') or headers.get('length') or 0
+            try:
+                body = await reader.readexactly(int(length))
+            except (ValueError, asyncio.IncompleteReadError):
+                writer.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
+                return
+
+            response = await self._loop.run_in_executor(self.pool, self.dispatch, head + body,
+                                                        writer.get_extra_info('peername'))
+            writer.write(response)
+            await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        except:
+            logging.exception('Error serving request.')
+        finally:
+            writer.close()
+
+    def dispatch(self, raw: bytes, client_address) -> bytes:
+        """
+        Serve a buffered request with the response handler.
+
+        :param raw: The request's line, headers and body.
+        :param client_address: Address of the client.
+        :return: The response.
+        """
+        request = _Request(raw)
+        self.handler_class(request, client_address, self)
+        return request.wfile.getvalue()
+
+    async def stream_data(self, writer: asyncio.StreamWriter, query, headers) -> None:
+        """
+        Send a stream of JSON events for the temperature data until the connection is closed.
+        Works like ResponseHandler.stream_data.
+        """
+        try:
+            max_points, last_event_id = parse_stream_params(query, headers)
+        except ValueError:
+            writer.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
+            return
+
+        writer.write(b'HTTP/1.0 200 OK\r\n'
+                     b'Content-type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n\r\n')
+
+        event = asyncio.Event()
+        self._waiters.add(event)
+        # Subscribe before reading the history so no data point is missed in between.
+        sub = self.app_thread.broker.subscribe()
+        try:
+            history, last = build_history_event(self.app_thread, last_event_id, max_points)
+            writer.write(history)
+            await writer.drain()
+
+            # Run until the connection is closed.
+            while True:
+                try:
+                    await asyncio.wait_for(event.wait(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Write a comment so that closed connections are noticed.
+                    writer.write(b': keepalive\n\n')
+                    await writer.drain()
+                    continue
+
+                event.clear()
+                events = sub.get(timeout=0)
+                if events:
+                    # Skip data points that were already sent with the history.
+                    writer.write(b''.join(payload for event_id, payload in events if event_id > last))
+                    last = max(last, events[-1][0])
+                    await writer.drain()
+        finally:
+            sub.close()
+            self._waiters.discard(event)
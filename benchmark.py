@@ -0,0 +1,156 @@
+"""
+Benchmark of the VNA acquisition path against local simulated VNAs (see vna_sim.py).
+
+Run it with: python benchmark.py [--cycles 20] [--points 201] [--latency 0.0] ...
+"""
+
+import argparse
+import contextlib
+from dataclasses import dataclass
+import io
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+from app_thread import AppThread
+from vna_sim import SimConfig, VNASimulator
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Dataclass for storing the results of a benchmark scenario.
+    """
+    name: str
+    sweeps: int  # sweeps captured successfully, counting each VNA
+    elapsed: float  # seconds
+    bytes_sent: int  # bytes sent by the simulated VNAs
+    retries: int  # VNA transfers that had to be tried again
+    reconnects: int  # connections that were dropped and reopened
+    latencies: List[float]  # seconds per cycle, including retries
+
+    @property
+    def sweeps_per_minute(self) -> float:
+        return self.sweeps / self.elapsed * 60
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_sent / self.elapsed
+
+
+def run_scenario(name: str, vnas: int, cycles: int, binary: bool, sim_config: SimConfig) -> BenchmarkResult:
+    """
+    Capture sweeps from simulated VNAs the same way AppThread does.
+
+    :param name: Name of the scenario.
+    :param vnas: Number of VNAs.
+    :param cycles: Number of cycles to run.
+    :param binary: Whether to use the binary transfer mode.
+    :param sim_config: Behavior of the simulated VNAs.
+    :return: Results of the scenario.
+    """
+    sims = [VNASimulator(port=0, config=sim_config) for _ in range(vnas)]
+    for sim in sims:
+        sim.start()
+
+    app = AppThread()
+    app.config.binary_transfer = binary
+    app.dir = 'benchmark'
+
+    ids = [f'vna{index}' for index in range(1, vnas + 1)]
+    app.instruments.declare(ids)
+    sessions = [app.instruments.vnas[vna] for vna in ids]
+    for session, sim in zip(sessions, sims):
+        session.open('127.0.0.1', sim.port)
+
+    retries = 0
+    lost = 0
+    latencies: List[float] = []
+
+    # Silence the progress prints of the acquisition path.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(cycles):
+            cycle_start = time.perf_counter()
+            failed = app._sweep(time.time())
+            while failed:
+                retries += len(failed)
+                failed = app._sweep(time.time(), failed)
+            latencies.append(time.perf_counter() - cycle_start)
+            # A VNA that failed twice in a row lost its sweep, reopen it like a user would
+            # instead of waiting for the session's backoff.
+            for session in sessions:
+                if not session.connected:
+                    lost += 1
+                    session.open(*session.target)
+        elapsed = time.perf_counter() - start
+
+    app.stop()
+    for sim in sims:
+        sim.stop()
+
+    return BenchmarkResult(name=name,
+                           sweeps=cycles * vnas - lost,
+                           elapsed=elapsed,
+                           bytes_sent=sum(sim.bytes_sent for sim in sims),
+                           retries=retries,
+                           reconnects=sum(session.reconnects for session in sessions) + lost,
+                           latencies=latencies)
+
+
+def print_results(results: List[BenchmarkResult]) -> None:
+    """
+    Print the results as a table.
+    """
+    header = f'{"scenario":<16}{"sweeps/min":>12}{"MB/s":>10}{"retries":>9}{"reconn":>8}' \
+             f'{"mean ms":>10}{"p95 ms":>10}{"max ms":>10}'
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        latencies = sorted(r.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f'{r.name:<16}{r.sweeps_per_minute:>12.1f}{r.bytes_per_second / 1e6:>10.2f}'
+              f'{r.retries:>9}{r.reconnects:>8}{statistics.mean(latencies) * 1000:>10.1f}'
+              f'{p95 * 1000:>10.1f}{latencies[-1] * 1000:>10.1f}')
+
+
+def main():
+    """
+    Main function.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the VNA acquisition path against simulated VNAs.')
+    parser.add_argument('--cycles', type=int, default=20, help='cycles per scenario')
+    parser.add_argument('--points', type=int, default=201, help='points per sweep')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each reply')
+    parser.add_argument('--fragment', type=int, default=0, help='bytes per send() call')
+    parser.add_argument('--fragment-delay', type=float, default=0.0, help='seconds between fragments')
+    parser.add_argument('--truncate', type=float, default=0.0, help='probability of cutting a transfer short')
+    args = parser.parse_args()
+
+    sim_config = SimConfig(points=args.points,
+                           latency=args.latency,
+                           fragment=args.fragment,
+                           fragment_delay=args.fragment_delay,
+                           truncate=args.truncate)
+
+    results: List[BenchmarkResult] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # AppThread writes sweeps to experiments/<dir>/ relative to the working directory.
+        cwd = os.getcwd()
+        os.makedirs(os.path.join(tmp, 'experiments', 'benchmark'))
+        os.chdir(tmp)
+        try:
+            for vnas in [1, 2, 4]:
+                for binary in [False, True]:
+                    name = f'{vnas} VNA {"binary" if binary else "file"}'
+                    results.append(run_scenario(name, vnas, args.cycles, binary, sim_config))
+        finally:
+            os.chdir(cwd)
+
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
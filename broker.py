@@ -0,0 +1,169 @@
+"""
+Module for the Broker class.
+"""
+
+from collections import deque
+from itertools import islice
+import json
+from threading import Condition
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+
+def format_event(event: str, data, event_id: Optional[int] = None) -> bytes:
+    """
+    Format a server-sent event.
+
+    :param event: Name of the event.
+    :param data: Data that can be serialized to JSON.
+    :param event_id: ID of the event, sent as the event's id field.
+    :return: The encoded event.
+    """
+    s = f'event: {event}\ndata: {json.dumps(data)}\n\n'
+    if event_id is not None:
+        s = f'id: {event_id}\n' + s
+    return s.encode('utf-8')
+
+
+class Subscription:
+    """
+    A subscriber's position in the broker's backlog.
+    """
+
+    def __init__(self, broker: 'Broker', cursor: int):
+        self._broker = broker
+
+        # Position of the next event to read.
+        self.cursor = cursor
+
+        # Number of events skipped because the subscriber fell behind the backlog.
+        self.dropped = 0
+
+        # Whether the subscription was closed.
+        self.closed = False
+
+    def get(self, timeout: Optional[float] = None) -> List[Tuple[int, bytes]]:
+        """
+        Block until events are available and return all of them.
+
+        :param timeout: Seconds to wait for, defaults to waiting forever.
+        :return: List of (event ID, encoded event), empty if the timeout expired.
+        """
+        return self._broker._read(self, timeout)
+
+    def close(self) -> None:
+        """
+        Unsubscribe from the broker.
+        """
+        self._broker.unsubscribe(self)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Broker:
+    """
+    Fans events out to any number of subscribers. Each event is encoded once and kept in a bounded
+    backlog shared by all subscribers, which only hold a cursor into it. Publishing doesn't depend on
+    the number of subscribers, and a subscriber that falls more than the backlog behind skips the
+    events it missed instead of growing memory.
+    """
+
+    def __init__(self, backlog: int = 1024):
+        """
+        :param backlog: Number of events kept for subscribers to read.
+        """
+        # Recent events as (event ID, encoded event).
+        self._events: Deque[Tuple[int, bytes]] = deque(maxlen=backlog)
+
+        # Position of the next event to be published.
+        self._next = 0
+
+        self._cond = Condition()
+        self._subscribers: Set[Subscription] = set()
+
+        # Functions called after each event is published, used to wake up event loops.
+        self._listeners: List[Callable[[], None]] = []
+
+    def publish(self, event: str, data: Dict, event_id: int) -> None:
+        """
+        Encode an event and send it to all subscribers.
+
+        :param event: Name of the event.
+        :param data: Data that can be serialized to JSON.
+        :param event_id: ID of the event.
+        """
+        payload = format_event(event, data, event_id)
+        with self._cond:
+            self._events.append((event_id, payload))
+            self._next += 1
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def subscribe(self) -> Subscription:
+        """
+        Subscribe to events published from now on.
+        """
+        with self._cond:
+            sub = Subscription(self, self._next)
+            self._subscribers.add(sub)
+            return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        """
+        Remove a subscriber and wake it up if it is waiting.
+        """
+        with self._cond:
+            sub.closed = True
+            self._subscribers.discard(sub)
+            self._cond.notify_all()
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Call a function after each event is published. It runs on the publishing thread, so it
+        should only hand off to another thread or event loop.
+        """
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Stop calling a function added with add_listener().
+        """
+        with self._cond:
+            self._listeners.remove(listener)
+
+    @property
+    def subscribers(self) -> int:
+        """
+        Number of subscribers.
+        """
+        with self._cond:
+            return len(self._subscribers)
+
+    def backlog(self) -> List[int]:
+        """
+        :return: Number of unread events of each subscriber.
+        """
+        with self._cond:
+            return [self._next - sub.cursor for sub in self._subscribers]
+
+    def _read(self, sub: Subscription, timeout: Optional[float]) -> List[Tuple[int, bytes]]:
+        with self._cond:
+            self._cond.wait_for(lambda: sub.closed or sub.cursor < self._next, timeout)
+            if sub.closed:
+                return []
+
+            oldest = self._next - len(self._events)
+            if sub.cursor < oldest:
+                # The subscriber fell behind, skip to the oldest event still available.
+                sub.dropped += oldest - sub.cursor
+                sub.cursor = oldest
+
+            events = list(islice(self._events, sub.cursor - oldest, None))
+            sub.cursor = self._next
+            return events
@@ -0,0 +1,389 @@
+"""
+Module for the Catalog class, an SQLite index of the experiments.
+
+Usage: python catalog.py [--root experiments] [experiment ...]
+
+Rescans the given experiments, or all of them, and repairs their entries.
+"""
+
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import sqlite3
+from threading import Lock
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metadata import INSTRUMENT_ID, Metadata, instrument_key
+
+
+# Columns the experiments can be sorted by.
+SORT_COLUMNS = ('name', 'title', 'person', 'cpa', 'date', 'created', 'first_time', 'last_time',
+                'temperatures', 'sweeps', 'size')
+
+# Version of the schema, kept in PRAGMA user_version. The catalog only holds data read from the
+# experiment directories, so an older catalog is dropped and rebuilt rather than migrated.
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS experiments (
+    name TEXT PRIMARY KEY,      -- directory name
+    title TEXT,
+    person TEXT,                -- name of the person running the experiment
+    cpa TEXT,
+    date TEXT,
+    created REAL,               -- creation time of the directory
+    first_time REAL,            -- time of the first temperature reading
+    last_time REAL,             -- time of the last temperature reading
+    temperatures INTEGER NOT NULL DEFAULT 0,
+    sweeps INTEGER NOT NULL DEFAULT 0,  -- sweeps of all the VNAs
+    size INTEGER NOT NULL DEFAULT 0,  -- bytes on disk
+    scanned REAL                -- time of the last rescan
+);
+CREATE INDEX IF NOT EXISTS experiments_created ON experiments (created);
+CREATE INDEX IF NOT EXISTS experiments_cpa ON experiments (cpa);
+CREATE TABLE IF NOT EXISTS vna_sweeps (
+    name TEXT NOT NULL,         -- experiment
+    vna TEXT NOT NULL,          -- id of the VNA, such as vna3
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, vna)
+);
+'''
+
+# Columns of the experiments table, in order.
+COLUMNS = ('name', 'title', 'person', 'cpa', 'date', 'created', 'first_time', 'last_time', 'temperatures',
+           'sweeps', 'size', 'scanned')
+
+
+@dataclass
+class Experiment:
+    """
+    Dataclass for storing the catalog entry of an experiment.
+    """
+    name: str
+    title: Optional[str]
+    person: Optional[str]
+    cpa: Optional[str]
+    date: Optional[str]
+    created: Optional[float]
+    first_time: Optional[float]
+    last_time: Optional[float]
+    temperatures: int
+    sweeps: int  # sweeps of all the VNAs
+    size: int
+    vna_sweeps: Dict[str, int] = field(default_factory=dict)  # sweeps by VNA id
+
+
+class Catalog:
+    """
+    Keeps one row per experiment with its metadata, time span, counts and size, so the experiments
+    can be listed without touching their directories. Acquisition updates are batched in memory
+    and written by flush().
+    """
+
+    def __init__(self, root: str = 'experiments', path: Optional[str] = None):
+        """
+        :param root: Directory of the experiments.
+        :param path: Path of the database, defaults to catalog.db in the experiments directory.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(path or os.path.join(root, 'catalog.db'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            # Rebuilt from the directories by sync().
+            with self._db:
+                self._db.execute('DROP TABLE IF EXISTS experiments')
+                self._db.execute('DROP TABLE IF EXISTS vna_sweeps')
+            self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._db.executescript(SCHEMA)
+        self._lock = Lock()
+
+        # Changes waiting for flush(), by experiment.
+        self._pending: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+        # Sweeps waiting for flush(), by experiment and VNA id.
+        self._pending_sweeps: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def add(self, name: str, metadata: Metadata) -> None:
+        """
+        Add a new experiment, or update the metadata of an existing one.
+        """
+        path = os.path.join(self.root, name)
+        created = os.stat(path).st_ctime if os.path.exists(path) else time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT INTO experiments (name, title, person, cpa, date, created) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET title=excluded.title, person=excluded.person, '
+                'cpa=excluded.cpa, date=excluded.date',
+                (name, metadata.title, metadata.name, metadata.cpa, metadata.date, created))
+
+    def record_temperature(self, name: str, t: float, size: int) -> None:
+        """
+        Count a temperature reading written to temperatures.csv.
+
+        :param size: Bytes written.
+        """
+        with self._lock:
+            pending = self._pending[name]
+            pending['temperatures'] += 1
+            pending['size'] += size
+            pending['first_time'] = min(pending.get('first_time', t), t)
+            pending['last_time'] = max(pending.get('last_time', t), t)
+
+    def record_sweep(self, name: str, vna: str, size: int) -> None:
+        """
+        Count a sweep saved by a VNA.
+
+        :param vna: Id of the VNA, such as 'vna3'.
+        :param size: Bytes written.
+        """
+        with self._lock:
+            pending = self._pending[name]
+            pending['sweeps'] += 1
+            pending['size'] += size
+            self._pending_sweeps[name][vna] += 1
+
+    def flush(self) -> None:
+        """
+        Write the recorded readings and sweeps in a single transaction.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(float))
+            sweeps, self._pending_sweeps = self._pending_sweeps, defaultdict(lambda: defaultdict(int))
+            if not pending:
+                return
+            with self._db:
+                for name, p in pending.items():
+                    self._db.execute('INSERT OR IGNORE INTO experiments (name, created) VALUES (?, ?)', (name, time.time()))
+                    self._db.execute(
+                        'UPDATE experiments SET temperatures = temperatures + ?, sweeps = sweeps + ?, size = size + ?, '
+                        'first_time = COALESCE(MIN(first_time, ?), first_time, ?), '
+                        'last_time = COALESCE(MAX(last_time, ?), last_time, ?) WHERE name = ?',
+                        (int(p['temperatures']), int(p['sweeps']), int(p['size']),
+                         p.get('first_time'), p.get('first_time'), p.get('last_time'), p.get('last_time'), name))
+                    self._db.executemany(
+                        'INSERT INTO vna_sweeps (name, vna, count) VALUES (?, ?, ?) '
+                        'ON CONFLICT (name, vna) DO UPDATE SET count = count + excluded.count',
+                        [(name, vna, count) for vna, count in sweeps.get(name, {}).items()])
+
+    def get(self, name: str) -> Optional[Experiment]:
+        """
+        :return: The entry of the experiment, None if there is none.
+        """
+        experiments, _ = self.query(name=name)
+        return experiments[0] if experiments else None
+
+    def query(self, name: Optional[str] = None, search: Optional[str] = None, cpa: Optional[str] = None,
+              person: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+              sort: str = 'created', descending: bool = True, limit: Optional[int] = None,
+              offset: int = 0) -> Tuple[List[Experiment], int]:
+        """
+        List experiments.
+
+        :param name: Only the experiment with this name.
+        :param search: Only experiments with this text in their name, title, person or CPA.
+        :param cpa: Only experiments with this CPA.
+        :param person: Only experiments run by this person.
+        :param date_from: Only experiments dated on or after this date, as entered in the metadata.
+        :param date_to: Only experiments dated on or before this date.
+        :param sort: Column to sort by, one of SORT_COLUMNS.
+        :param descending: Whether to sort in descending order.
+        :param limit: Maximum number of experiments to return, all of them if None.
+        :param offset: Number of experiments to skip.
+        :raises ValueError: If the sort column is unknown.
+        :return: The experiments, and the number of experiments matching the filters.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'Unknown sort column: {sort!r}')
+
+        where, params = [], []
+        for column, value in [('name', name), ('cpa', cpa), ('person', person)]:
+            if value is not None:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if search:
+            where.append("(name LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\' OR person LIKE ? ESCAPE '\\' OR cpa LIKE ? ESCAPE '\\')")
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            params.extend([pattern] * 4)
+        if date_from is not None:
+            where.append('date >= ?')
+            params.append(date_from)
+        if date_to is not None:
+            where.append('date <= ?')
+            params.append(date_to)
+        clause = f" WHERE {' AND '.join(where)}" if where else ''
+
+        columns = ', '.join(COLUMNS[:-1])
+        order = 'DESC' if descending else 'ASC'
+        with self._lock:
+            total = self._db.execute(f'SELECT COUNT(*) FROM experiments{clause}', params).fetchone()[0]
+            rows = self._db.execute(
+                f'SELECT {columns} FROM experiments{clause} ORDER BY {sort} {order}, name LIMIT ? OFFSET ?',
+                params + [-1 if limit is None else limit, offset]).fetchall()
+            experiments = [Experiment(*row) for row in rows]
+            by_name = {e.name: e for e in experiments}
+            if by_name:
+                marks = ', '.join('?' * len(by_name))
+                for name, vna, count in self._db.execute(
+                        f'SELECT name, vna, count FROM vna_sweeps WHERE name IN ({marks}) ORDER BY name, vna',
+                        list(by_name)):
+                    by_name[name].vna_sweeps[vna] = count
+        return experiments, total
+
+    def names(self) -> List[str]:
+        """
+        :return: Names of all the experiments.
+        """
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT name FROM experiments ORDER BY name')]
+
+    def sync(self) -> None:
+        """
+        Add the experiment directories missing from the catalog, and remove the entries of
+        directories that are gone. Existing entries are left alone, see rescan.
+        """
+        directories = set(next(os.walk(self.root))[1])
+        known = set(self.names())
+        with self._lock, self._db:
+            gone = [(name,) for name in known - directories]
+            self._db.executemany('DELETE FROM experiments WHERE name = ?', gone)
+            self._db.executemany('DELETE FROM vna_sweeps WHERE name = ?', gone)
+        self.rescan(sorted(directories - known))
+
+    def rescan(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        Rebuild the entries of experiments from their directories.
+
+        :param names: Experiments to rescan, defaults to all the experiment directories.
+        """
+        if names is None:
+            names = sorted(next(os.walk(self.root))[1])
+        for name in names:
+            try:
+                row = scan_experiment(os.path.join(self.root, name))
+            except FileNotFoundError:
+                with self._lock, self._db:
+                    self._db.execute('DELETE FROM experiments WHERE name = ?', (name,))
+                    self._db.execute('DELETE FROM vna_sweeps WHERE name = ?', (name,))
+                continue
+            except Exception:
+                logging.exception(f'Unable to scan experiment {name}.')
+                continue
+            with self._lock, self._db:
+                # Readings recorded before the scan are part of it.
+                self._pending.pop(name, None)
+                self._pending_sweeps.pop(name, None)
+                *row, sweeps = row
+                self._db.execute(f"INSERT OR REPLACE INTO experiments ({', '.join(COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                                 (name, *row, time.time()))
+                self._db.execute('DELETE FROM vna_sweeps WHERE name = ?', (name,))
+                self._db.executemany('INSERT INTO vna_sweeps (name, vna, count) VALUES (?, ?, ?)',
+                                     [(name, vna, count) for vna, count in sweeps.items()])
+
+
+def scan_experiment(path: str) -> Tuple:
+    """
+    Read the catalog entry of an experiment from its directory.
+
+    :return: The values of the columns after the name and before 'scanned', followed by the
+    number of sweeps of each VNA.
+    """
+    created = os.stat(path).st_ctime
+
+    metadata = {}
+    try:
+        with open(os.path.join(path, 'metadata.json'), encoding='utf-8') as f:
+            metadata = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    sweeps: Dict[str, int] = {}
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+            if root == path and file.endswith('.csv'):
+                vna = file.removesuffix('.csv').rsplit('_', 1)[-1]
+                match = INSTRUMENT_ID.fullmatch(vna)
+                if match and match.group(1) == 'vna':
+                    sweeps[vna] = sweeps.get(vna, 0) + 1
+
+    temperatures, first_time, last_time = scan_temperatures(os.path.join(path, 'temperatures.csv'))
+    return (metadata.get('title'), metadata.get('name'), metadata.get('cpa'), metadata.get('date'),
+            created, first_time, last_time, temperatures, sum(sweeps.values()), size,
+            dict(sorted(sweeps.items(), key=lambda item: instrument_key(item[0]))))
+
+
+def scan_temperatures(path: str) -> Tuple[int, Optional[float], Optional[float]]:
+    """
+    Count the readings of temperatures.csv and find the times of the first and last ones, reading
+    the file in blocks rather than parsing it.
+
+    :return: Number of readings, time of the first and time of the last reading.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0, None, None
+
+    with f:
+        count = 0
+        last_byte = b'\n'
+        first_line = f.readline()
+        f.seek(0)
+        for block in iter(lambda: f.read(1 << 20), b''):
+            count += block.count(b'\n')
+            last_byte = block[-1:]
+        if last_byte != b'\n':
+            count += 1
+
+        # Read back from the end of the file to the start of the last line.
+        end = f.seek(0, os.SEEK_END)
+        f.seek(max(end - 4096, 0))
+        lines = f.read().splitlines()
+        last_line = lines[-1] if lines else b''
+
+    def time_of(line: bytes) -> Optional[float]:
+        try:
+            return float(line.split(b',')[0])
+        except ValueError:
+            return None
+
+    return count, time_of(first_line), time_of(last_line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rescan experiments and repair their catalog entries.')
+    parser.add_argument('experiments', nargs='*', help='experiments to rescan (default: all of them)')
+    parser.add_argument('--root', default='experiments', help='directory of the experiments')
+    args = parser.parse_args()
+
+    catalog = Catalog(args.root)
+    if args.experiments:
+        catalog.rescan(args.experiments)
+    else:
+        # Also drop the entries of experiments that were deleted.
+        catalog.sync()
+        catalog.rescan()
+    experiments, total = catalog.query()
+    for e in experiments:
+        print(f'{e.name}: {e.temperatures} temperatures, {e.sweeps} sweeps, {e.size / 1e6:.1f} MB')
+    print(f'{total} experiments.')
+    catalog.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,3 +11,10 @@ class Config:
     Dataclass for storing the application's runtime configuration.
     """
     period: int  # period in seconds
+    binary_transfer: bool = False  # transfer sweeps in binary instead of through files on the VNA
+    sweep_files: bool = True  # write .csv/.s2p files for binary sweeps, which are always stored in store/
+    stream_period: float = 0  # seconds between samples pushed by the ESP32, 0 to poll instead
+    flush_count: int = 100  # writes appended to data files before they are flushed
+    flush_interval: float = 1.0  # most seconds an appended write waits to be flushed
+    fsync: bool = False  # also fsync data files when they are flushed, so they survive a power loss
+    tracing: bool = False  # record spans of the acquisition, dumped with /api/trace
@@ -0,0 +1,138 @@
+"""
+Module for the DeviceDiscovery class.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import logging
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import serial
+from serial.tools import list_ports
+
+from temp_stream import USB_BAUD_RATE
+
+
+# Seconds to wait for a device to answer *IDN?.
+PROBE_TIMEOUT = 2
+
+# Reply of the temperature measurement firmware to *IDN?.
+ESP32_IDN = 'ESP32'
+
+
+@dataclass
+class Device:
+    """
+    Dataclass for storing a serial device found on the system.
+    """
+    port: str
+    description: str
+    vid: Optional[int]  # USB vendor ID, None for non-USB ports
+    pid: Optional[int]  # USB product ID
+    serial_number: Optional[str]
+    idn: Optional[str] = None  # reply to *IDN?, None if the device didn't answer
+
+    @property
+    def key(self) -> Tuple:
+        """
+        Identifies the physical device plugged into the port.
+        """
+        return (self.port, self.vid, self.pid, self.serial_number)
+
+    @property
+    def is_esp32(self) -> bool:
+        return self.idn == ESP32_IDN
+
+
+def probe(port: str, timeout: float = PROBE_TIMEOUT) -> Optional[str]:
+    """
+    Ask the device on a port to identify itself.
+
+    :return: The device's reply to *IDN?, None if it didn't answer.
+    """
+    s = serial.Serial()
+    s.port = port
+    s.baudrate = USB_BAUD_RATE
+    s.timeout = timeout
+    s.write_timeout = timeout
+    # Don't toggle DTR/RTS on open, which resets many USB serial boards.
+    s.dtr = False
+    s.rts = False
+    try:
+        s.open()
+        s.reset_input_buffer()
+        s.write(b'*IDN?\n')
+        s.flush()
+        reply = s.readline().decode('utf-8', errors='replace').strip()
+        return reply or None
+    except Exception:
+        logging.debug(f'Unable to probe {port}.', exc_info=True)
+        return None
+    finally:
+        s.close()
+
+
+class DeviceDiscovery:
+    """
+    Lists serial devices from the operating system's port metadata, without opening them. USB
+    devices are probed with *IDN? in parallel the first time they are seen, and the results are
+    cached until the device is unplugged or replaced.
+    """
+
+    def __init__(self, workers: int = 8):
+        """
+        :param workers: Number of devices probed at the same time.
+        """
+        self.workers = workers
+
+        # Probe results by device key.
+        self._cache: Dict[Tuple, Optional[str]] = {}
+        self._lock = Lock()
+
+    def devices(self, exclude: Iterable[str] = (), probe_new: bool = True) -> List[Device]:
+        """
+        List the serial devices, ESP32s first.
+
+        :param exclude: Ports not to probe, such as ports that are already open.
+        :param probe_new: Whether to probe devices that haven't been seen before.
+        :return: The devices found.
+        """
+        exclude = set(exclude)
+        found = [Device(port=p.device,
+                        description=p.description,
+                        vid=p.vid,
+                        pid=p.pid,
+                        serial_number=p.serial_number) for p in list_ports.comports()]
+
+        with self._lock:
+            # Forget devices that were unplugged.
+            keys = {d.key for d in found}
+            for key in list(self._cache):
+                if key not in keys:
+                    del self._cache[key]
+
+            # Probe the USB devices we haven't seen before.
+            new = [d for d in found if d.vid is not None and d.key not in self._cache and d.port not in exclude]
+            if new and probe_new:
+                with ThreadPoolExecutor(max_workers=min(self.workers, len(new))) as pool:
+                    for d, idn in zip(new, pool.map(probe, [d.port for d in new])):
+                        self._cache[d.key] = idn
+
+            for d in found:
+                d.idn = self._cache.get(d.key)
+
+        return sorted(found, key=lambda d: (not d.is_esp32, d.vid is None, d.port))
+
+    def ports(self, exclude: Iterable[str] = (), probe_new: bool = True) -> List[str]:
+        """
+        :return: Names of the serial ports, ESP32s first.
+        """
+        return [d.port for d in self.devices(exclude, probe_new)]
+
+    def invalidate(self) -> None:
+        """
+        Forget all probe results, so every device is probed again.
+        """
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,41 @@
+"""
+Functions for reducing the number of points in a time series before plotting it.
+"""
+
+import numpy as np
+
+
+def minmax(samples: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Downsample by splitting the samples into buckets and keeping the samples with the minimum and
+    maximum value of each series in every bucket. Peaks survive, unlike with plain decimation.
+
+    :param samples: Array of shape (columns, n), the first row being time and the rest series.
+    :param max_points: Maximum number of samples to return.
+    :return: Array of shape (columns, m) in time order, m is at most max_points unless max_points is
+    smaller than a single bucket.
+    """
+    n = samples.shape[1]
+    if n <= max_points:
+        return samples
+
+    # Every bucket contributes a minimum and a maximum for each series.
+    per_bucket = 2 * (samples.shape[0] - 1)
+    buckets = max(max_points // per_bucket, 1)
+    size = -(-n // buckets)
+    offsets = np.arange(buckets) * size
+
+    indices = []
+    for values in samples[1:]:
+        # Pad to whole buckets, and make sure missing values are never picked.
+        low = np.full(buckets * size, np.inf)
+        low[:n] = np.where(np.isnan(values), np.inf, values)
+        high = np.full(buckets * size, -np.inf)
+        high[:n] = np.where(np.isnan(values), -np.inf, values)
+
+        indices.append(np.argmin(low.reshape(buckets, size), axis=1) + offsets)
+        indices.append(np.argmax(high.reshape(buckets, size), axis=1) + offsets)
+
+    keep = np.unique(np.concatenate(indices))
+    keep = keep[keep < n]
+    return samples[:, keep]
@@ -269,15 +269,27 @@ function ExpFrmHandler(event) {
 // }
 
 function displayData() {
-    var evtSource = new EventSource("api/stream_data");
+    // The browser sends the ID of the last event when it reconnects, so only missed data is resent.
+    var evtSource = new EventSource("api/stream_data?max_points=2000");
+    evtSource.addEventListener('history', (event) => {
+        const data = JSON.parse(event.data);
+
+        // Create Date objects using the timestamps.
+        const t = data.time.map(x => new Date(x * 1000));
+
+        if (data.reset) {
+            Plotly.restyle('temp_plot', {x: [t, t], y: [data.temp1, data.temp2]}, [0, 1]);
+        } else if (t.length > 0) {
+            Plotly.extendTraces('temp_plot', {x: [t, t], y: [data.temp1, data.temp2]}, [0, 1]);
+        }
+    });
     evtSource.addEventListener('temperature', (event) => {
         const data = JSON.parse(event.data);
         
         // Create a Date object using the timestamp.
         const t = new Date(data.time * 1000);
 
-        Plotly.extendTraces('temp_plot', {x: [[t]], y: [[data.temp1]]}, [0]);
-        Plotly.extendTraces('temp_plot', {x: [[t]], y: [[data.temp2]]}, [1]);
+        Plotly.extendTraces('temp_plot', {x: [[t], [t]], y: [[data.temp1], [data.temp2]]}, [0, 1]);
     });
 }
 
@@ -1,118 +1,333 @@
+"""
+Combine the data of an experiment into a single Excel workbook.
 
+Usage: python generate_excel.py <experiment directory> [--workers N] [--align MODE] [--max-gap S] [--window S]
+
+The rows of each sweep file are rendered once, in a process pool, to an XML fragment cached in
+exports/cache/ of the experiment directory. A manifest records the size and modification time of the
+file each fragment was made from, so later exports only render new or changed files and copy the
+rest of the workbook from the cache. Memory use doesn't grow with the length of the experiment.
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 import datetime
 import json
+import multiprocessing
 import os
-import sys
 import time
-from typing import Dict, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+from align import DEFAULT_MAX_GAP, DEFAULT_WINDOW, MODES, NEAREST, TemperatureIndex
+from metadata import INSTRUMENT_ID
+from xlsx import render_rows, WorkbookWriter
+
+
+# Sweep files parsed ahead of the writer, per worker.
+PREFETCH_PER_WORKER = 4
+
+# Directory of the cached fragments, relative to the experiment directory.
+CACHE_DIR = os.path.join('exports', 'cache')
 
-from openpyxl import Workbook
+# Bump when the fragments change, so older ones are rendered again.
+CACHE_VERSION = 1
 
+# Row of a sweep sheet that the sweep file's first line goes to.
+FIRST_SWEEP_ROW = 3
 
-# Path to folder to combine data for.
-target_dir: str = sys.argv[1]
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 1
 
-# Read the metadata from metadata.json.
-metadata_path = os.path.join(target_dir, 'metadata.json')
-with open(metadata_path, encoding='utf-8') as mdata_file:
-    metadata: Dict = json.load(mdata_file)
 
-# Dictionary storing an integer timestamp and the corresponding temperatures (t1 and t2) as floats.
-temps: Dict[int, Tuple[float, float]] = {}
+@dataclass
+class SweepFile:
+    """
+    Dataclass for storing a sweep file to add to the workbook.
+    """
+    name: str  # file name, such as 2023_04_01_12_00_00_vna1.csv
+    path: str
+    ts: int  # integer timestamp from the file name
+    vna: str  # id of the VNA, such as 'vna1'
+    sheet_name: str
+    size: int  # size of the file in bytes
+    mtime_ns: int  # modification time of the file
 
-# Read the temperatures from the csv file.
-csv_path = os.path.join(target_dir, 'temperatures.csv')
-with open(csv_path, encoding='utf-8') as csv_file:
-    for line in csv_file.readlines():
-        ts, t1, t2 = [float(x) for x in line.split(',')]
-        temps[int(ts)] = t1,t2
 
-# Create a excel workbook object.
-wb = Workbook()
+def find_sweep_files(target_dir: str) -> List[SweepFile]:
+    """
+    List the sweep .csv files of an experiment in order, and name their sheets.
+    """
+    files = []
+    counts: Dict[str, int] = {}
+    for file in sorted(os.listdir(target_dir)):
 
-# Access the active worksheet.
-ws = wb.active
+        # Check if the file is a .csv (and not the temperatures.csv file)
+        if not file.endswith('.csv') or file == 'temperatures.csv':
+            continue
 
-# Store metadata into the first sheet in the workbook.
-for i,(key,value) in enumerate(metadata.items()):
-    row = i + 1
-    ws[f'A{row}'] = key
-    ws[f'B{row}'] = value
+        x = file.removesuffix('.csv').split('_')
 
-# Variables to keep track of the vna index.
-vna1_count = 0
-vna2_count = 0
+        # Create integer timestamp from the file name.
+        try:
+            ts = int(time.mktime(datetime.datetime(int(x[0]), int(x[1]), int(x[2]), int(x[3]), int(x[4]), int(x[5])).timetuple()))
+        except (IndexError, ValueError):
+            print(f'WARNING: Encountered a .csv file with an invalid name: {file}')
+            continue
 
-# Iterate through data files in directory.
-for file in sorted(os.listdir(target_dir)):
+        vna = x[-1]
+        match = INSTRUMENT_ID.fullmatch(vna)
+        if not match or match.group(1) != 'vna':
+            print(f'WARNING: Encountered a .csv file with an invalid name: {file}')
+            continue
 
-    # Check if the file is a .csv (and not the temperatures.csv file)
-    if not file.endswith('.csv') or file == 'temperatures.csv':
-        continue
+        # Build name for the new sheet.
+        counts[vna] = counts.get(vna, 0) + 1
+        path = os.path.join(target_dir, file)
+        st = os.stat(path)
+        files.append(SweepFile(name=file,
+                               path=path,
+                               ts=ts,
+                               vna=vna,
+                               sheet_name=f'v{match.group(2)}_{counts[vna]}',
+                               size=st.st_size,
+                               mtime_ns=st.st_mtime_ns))
+    return files
 
-    x = file.removesuffix('.csv').split('_')
 
-    # Create integer timestamp from the file name.
+def parse_value(value: str) -> Union[float, str]:
+    """
+    :return: The value as a number if it is one, so it is written as a number rather than a string.
+    """
     try:
-        ts = int(time.mktime(datetime.datetime(int(x[0]), int(x[1]), int(x[2]), int(x[3]), int(x[4]), int(x[5])).timetuple()))
-    except (IndexError, ValueError):
-        print(f'WARNING: Encountered a .csv file with an invalid name: {file}')
-        continue
-
-    vna = x[-1]
-
-    # Build name for the new sheet.
-    if vna == 'vna1':
-        vna1_count += 1
-        sheet_name = f'v1_{vna1_count}'
-        temp_sensor = metadata.get('vna1_temp')
-    elif vna == 'vna2':
-        vna2_count += 1
-        sheet_name = f'v2_{vna2_count}'
-        temp_sensor = metadata.get('vna2_temp')
-    else:
-        print(f'WARNING: Encountered a .csv file with an invalid name: {file}')
-        continue
-    
-    # Create new sheet.
-    wb.create_sheet(sheet_name)
-    # Access the new sheet.
-    ws = wb[sheet_name]
-
-    # Add temperature at the top.
-    ws['A1'] = 'Temperature (degC):'
-
-    # Find the temperature that corresponds to the current timestamp.
-    temp: Tuple[float, float] = temps.get(ts)
-
-    # Check if temperature readings actually existed at this time.
-    if temp is None:
-        print(f'WARNING: Unable to find corresponding temperature for {sheet_name}.')
-    else:
-        if temp_sensor == 'temp1':
-            ws['B1'] = temp[0]
-        elif temp_sensor == 'temp2':
-            ws['B1'] = temp[1]
-        else:
-            ws['B1'] = None
-
-    # Add CSV below temperature.
-    fpath = os.path.join(target_dir, file)
-    with open(fpath, encoding='utf-8') as dataf:
-        for lino, line in enumerate(dataf.readlines()):
-            if ',' in line:
-                a,b = line.split(',')
-                ws[f'A{3+lino}'] = a
-                ws[f'B{3+lino}'] = b
-            else:
-                ws[f'A{3+lino}'] = line
-
-
-# Build path to save to.
-wb_path = os.path.join(target_dir, 'combined_data.xlsx')
-
-# Save the workbook.
-wb.save(wb_path)
-
-# Let the user know that we're done.
-print('Done!')
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_sweep(path: str) -> List[List[Union[float, str]]]:
+    """
+    Read the rows of a sweep .csv file.
+
+    :return: One list of cells per line.
+    """
+    rows = []
+    with open(path, encoding='utf-8') as dataf:
+        for line in dataf:
+            rows.append([parse_value(cell.strip()) for cell in line.split(',')])
+    return rows
+
+
+def render_sweep(path: str, fragment_path: str) -> None:
+    """
+    Parse a sweep .csv file and save its rows as a worksheet XML fragment.
+
+    :param path: Path of the sweep file.
+    :param fragment_path: Path to save the fragment to.
+    """
+    xml = render_rows(parse_sweep(path), first_row=FIRST_SWEEP_ROW)
+    tmp = fragment_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(xml)
+    os.replace(tmp, fragment_path)
+
+
+def lower_priority() -> None:
+    """
+    Lower the CPU (and, on Linux, IO) priority of the current process, where the OS supports it.
+    """
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def load_manifest(cache_dir: str) -> Dict[str, List[int]]:
+    """
+    :return: Size and modification time of the sweep file each cached fragment was rendered from,
+    by file name.
+    """
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get('version') != CACHE_VERSION:
+        return {}
+    return manifest['files']
+
+
+def save_manifest(cache_dir: str, files: Dict[str, List[int]]) -> None:
+    """
+    Save the manifest of the cached fragments.
+    """
+    path = os.path.join(cache_dir, 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'files': files}, f)
+    os.replace(path + '.tmp', path)
+
+
+def render_sweeps(files: List[SweepFile], cache_dir: str, manifest: Dict[str, List[int]],
+                  workers: Optional[int], low_priority: bool = False) -> Iterator[str]:
+    """
+    Make sure every sweep file has an up to date fragment in the cache, rendering the new and
+    changed ones in a process pool a few files ahead of the caller. The manifest is updated as
+    fragments are rendered.
+
+    :param manifest: Manifest of the cache, see load_manifest.
+    :param low_priority: Whether to run the workers at a lower priority.
+    :return: Iterator of the fragments' paths, in the same order as the files.
+    """
+    stale = {f.name for f in files if manifest.get(f.name) != [f.size, f.mtime_ns]}
+    if not stale:
+        for f in files:
+            yield os.path.join(cache_dir, f.name + '.xml')
+        return
+
+    workers = workers or os.cpu_count() or 1
+    initializer = lower_priority if low_priority else None
+    # Exports run on a thread of the server, and forking while other threads hold locks (logging,
+    # the broker, the writer) can deadlock the children, so the workers are spawned instead.
+    with ProcessPoolExecutor(max_workers=min(workers, len(stale)), initializer=initializer,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+
+        def finish(f: SweepFile, future) -> str:
+            if future is not None:
+                future.result()
+                manifest[f.name] = [f.size, f.mtime_ns]
+            return os.path.join(cache_dir, f.name + '.xml')
+
+        window = workers * PREFETCH_PER_WORKER
+        pending = deque()
+        for f in files:
+            future = None
+            if f.name in stale:
+                future = pool.submit(render_sweep, f.path, os.path.join(cache_dir, f.name + '.xml'))
+            pending.append((f, future))
+            if len(pending) >= window:
+                yield finish(*pending.popleft())
+        while pending:
+            yield finish(*pending.popleft())
+
+
+def export(target_dir: str, wb_path: Optional[str] = None, workers: Optional[int] = None,
+           progress: Optional[Callable[[int, int, int, int], None]] = None, low_priority: bool = False,
+           align: str = NEAREST, max_gap: float = DEFAULT_MAX_GAP, window: float = DEFAULT_WINDOW) -> str:
+    """
+    Write the metadata, and every sweep with its temperature, to an Excel workbook.
+
+    :param target_dir: Directory of the experiment.
+    :param wb_path: Path of the workbook, defaults to combined_data.xlsx in the experiment directory.
+    :param workers: Number of processes parsing sweep files, defaults to the number of CPUs.
+    :param progress: Called with (sheets done, total sheets, bytes read, total bytes) after each sheet.
+    :param low_priority: Whether to parse the sweep files at a lower priority.
+    :param align: How sweeps are matched with temperatures, see TemperatureIndex.align.
+    :param max_gap: Largest distance between a sweep and its temperature, in seconds.
+    :param window: Width of the averaging window in window mode, in seconds.
+    :return: Path of the workbook.
+    """
+    if wb_path is None:
+        wb_path = os.path.join(target_dir, 'combined_data.xlsx')
+
+    # Read the metadata from metadata.json.
+    metadata_path = os.path.join(target_dir, 'metadata.json')
+    with open(metadata_path, encoding='utf-8') as mdata_file:
+        metadata: Dict = json.load(mdata_file)
+
+    files = find_sweep_files(target_dir)
+    total_bytes = sum(f.size for f in files)
+
+    # Find the temperatures of all the sweeps at once.
+    index = TemperatureIndex.from_csv(os.path.join(target_dir, 'temperatures.csv'))
+    temps = index.align(np.array([f.ts for f in files], dtype=np.float64), align, max_gap, window)
+
+    cache_dir = os.path.join(target_dir, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    reused = sum(1 for f in files if manifest.get(f.name) == [f.size, f.mtime_ns])
+
+    # Forget the fragments of files that are gone.
+    names = {f.name for f in files}
+    for name in [name for name in manifest if name not in names]:
+        del manifest[name]
+        try:
+            os.remove(os.path.join(cache_dir, name + '.xml'))
+        except FileNotFoundError:
+            pass
+
+    try:
+        with WorkbookWriter(wb_path) as wb:
+            # Store metadata into the first sheet in the workbook.
+            wb.add_sheet('Sheet', render_rows([key, json.dumps(value) if isinstance(value, dict) else value]
+                                              for key, value in metadata.items()))
+
+            done_bytes = 0
+            fragments = render_sweeps(files, cache_dir, manifest, workers, low_priority)
+            for i, (f, fragment_path) in enumerate(zip(files, fragments)):
+                # Pick the temperature of the sensor associated with this VNA.
+                temp_sensor = metadata.get(f'{f.vna}_temp') or metadata.get('instruments', {}).get(f.vna, {}).get('temp')
+                match = INSTRUMENT_ID.fullmatch(temp_sensor or '')
+                value = None
+                if match and match.group(1) == 'temp' and int(match.group(2)) <= temps.shape[1]:
+                    value = float(temps[i, int(match.group(2)) - 1])
+                    # Check if temperature readings actually existed around this time.
+                    if np.isnan(value):
+                        print(f'WARNING: Unable to find corresponding temperature for {f.sheet_name}.')
+                        value = None
+
+                # Add temperature at the top, and the CSV below it.
+                with open(fragment_path, 'rb') as fragment:
+                    wb.add_sheet(f.sheet_name, render_rows([['Temperature (degC):', value]]), [fragment])
+
+                done_bytes += f.size
+                if progress:
+                    progress(i + 1, len(files), done_bytes, total_bytes)
+    finally:
+        # Keep track of the fragments rendered so far, even if the export failed.
+        save_manifest(cache_dir, manifest)
+
+    print(f'Rendered {len(files) - reused} new or changed sweeps, reused {reused} from the cache.')
+    return wb_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Combine the data of an experiment into an Excel workbook.')
+    parser.add_argument('target_dir', help='path to the experiment directory')
+    parser.add_argument('--workers', type=int, default=None, help='processes parsing sweep files (default: number of CPUs)')
+    parser.add_argument('--align', choices=MODES, default=NEAREST, help='how sweeps are matched with temperatures (default: nearest)')
+    parser.add_argument('--max-gap', type=float, default=DEFAULT_MAX_GAP, help=f'largest distance between a sweep and its temperature in seconds (default: {DEFAULT_MAX_GAP})')
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW, help=f'width of the averaging window in seconds for --align window (default: {DEFAULT_WINDOW})')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    last_report = 0.0
+
+    def report(done: int, total: int, done_bytes: int, total_bytes: int):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < PROGRESS_INTERVAL and done < total:
+            return
+        last_report = now
+        elapsed = max(now - start, 1e-9)
+        print(f'{done}/{total} sheets, {done / elapsed:.1f} sheets/s, {done_bytes / elapsed / 1e6:.1f} MB/s')
+
+    # Write to a temporary file first so a failed export never replaces a good workbook.
+    wb_path = os.path.join(args.target_dir, 'combined_data.xlsx')
+    tmp = wb_path.removesuffix('.xlsx') + '.tmp.xlsx'
+    try:
+        export(args.target_dir, tmp, workers=args.workers, progress=report,
+               align=args.align, max_gap=args.max_gap, window=args.window)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, wb_path)
+    print(f'Wrote {wb_path} in {time.monotonic() - start:.1f} s')
+
+    # Let the user know that we're done.
+    print('Done!')
+
+
+if __name__ == '__main__':
+    main()
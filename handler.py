@@ -3,20 +3,291 @@ from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler
 import json
 import logging
+import math
 import os
-import socket
-from typing import Dict
-from urllib.parse import urlparse
+import shutil
+from threading import Lock
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
 
-import serial
+import numpy as np
 
 from app_thread import AppThread
-from metadata import Metadata
-from utils import EnhancedJSONEncoder, find_available_devices, find_previous_experiments
-from vna import build_cmd, VNA_PORT
+from broker import format_event
+from discovery import DeviceDiscovery
+from downsample import minmax
+from generate_excel import find_sweep_files
+from jobs import ExportJobs
+from metadata import INSTRUMENT_ID, Metadata
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram, Metric, counter, gauge, render
+from static import StaticAssets
+from store import ExperimentStore
+from timeseries import to_lists
+from touchstone import DB, RI, SweepCache
+from tracing import TRACER
+from utils import EnhancedJSONEncoder, timestamp_name
 
 
-USB_BAUD_RATE = 9600
+# Seconds between keepalive comments on idle data streams.
+STREAM_KEEPALIVE = 15
+
+# Number of data points sent to a new data stream client if it doesn't ask for a number.
+DEFAULT_MAX_POINTS = 2000
+
+HTTP_REQUEST_SECONDS = Histogram('cryo_http_request_seconds', 'Seconds taken to serve an HTTP request.',
+                                 ['method', 'route', 'status'])
+
+
+def parse_stream_params(query: Dict[str, List[str]], headers) -> Tuple[int, Optional[int]]:
+    """
+    Parse the parameters of a data stream request.
+
+    :param query: Query parameters of the request.
+    :param headers: Headers of the request.
+    :raises ValueError: If the parameters are not integers.
+    :return: The maximum number of points to send with the history, and the ID of the last event
+    received by the client (None for a new client).
+    """
+    max_points = int(query.get('max_points', [DEFAULT_MAX_POINTS])[0])
+    last_event_id = headers.get('Last-Event-ID')
+    if last_event_id is not None:
+        last_event_id = int(last_event_id)
+    return max_points, last_event_id
+
+
+def build_history_event(app_thread: AppThread, last_event_id: Optional[int], max_points: int) -> Tuple[bytes, int]:
+    """
+    Build the data stream event carrying the data collected so far.
+
+    :param app_thread: AppThread holding the data.
+    :param last_event_id: ID of the last event the client received, None for a new client.
+    :param max_points: Maximum number of data points to send.
+    :return: The encoded 'history' event and the ID of the last data point it covers. The event's
+    'reset' field tells the client whether to replace its data or append to it.
+    """
+    samples = None
+    if last_event_id is not None and app_thread.data.first_seq <= last_event_id + 1 <= app_thread.data.total:
+        # Only send the data points the client missed.
+        samples = app_thread.data.since(last_event_id + 1)
+        last = last_event_id + samples.shape[1]
+        if samples.shape[1] > max_points:
+            samples = None
+
+    resume = samples is not None
+    if not resume:
+        samples, last = app_thread.data.snapshot()
+        samples = minmax(samples, max_points)
+
+    data = to_lists(samples)
+    data['reset'] = not resume
+    return format_event('history', data, last if last >= 0 else None), last
+
+
+def parse_catalog_params(query: Dict[str, List[str]]) -> Dict:
+    """
+    Parse the parameters of a request for the list of experiments.
+
+    :param query: Query parameters of the request.
+    :raises ValueError: If a parameter is invalid.
+    :return: Keyword arguments for Catalog.query.
+    """
+    params = {}
+    for key in ['search', 'cpa', 'person', 'date_from', 'date_to', 'sort']:
+        if key in query:
+            params[key] = query[key][0]
+
+    order = query.get('order', ['desc'])[0]
+    if order not in ('asc', 'desc'):
+        raise ValueError("'order' must be 'asc' or 'desc'.")
+    params['descending'] = order == 'desc'
+
+    try:
+        if 'limit' in query:
+            params['limit'] = int(query['limit'][0])
+        params['offset'] = int(query.get('offset', [0])[0])
+    except ValueError:
+        raise ValueError("'limit' and 'offset' must be integers.")
+    if params.get('limit', 0) < 0 or params['offset'] < 0:
+        raise ValueError("'limit' and 'offset' must not be negative.")
+    return params
+
+
+# Held while a store is filled from an older experiment's temperatures.csv.
+_import_lock = Lock()
+
+
+def open_experiment_store(app_thread: AppThread, experiment: str) -> ExperimentStore:
+    """
+    Open the store of an experiment. The running experiment's store is shared with the app
+    thread, and the store of an experiment recorded before stores existed is filled from its
+    temperatures.csv the first time.
+
+    :param experiment: Name of the experiment directory.
+    """
+    store = app_thread.store
+    if store is not None and experiment == app_thread.dir:
+        return store
+
+    directory = os.path.join('experiments', experiment)
+    with _import_lock:
+        store = ExperimentStore(os.path.join(directory, 'store'))
+        csv_path = os.path.join(directory, 'temperatures.csv')
+        # An empty file, such as from a VNA-only run, leaves the series empty.
+        if len(store.temperatures) == 0 and os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+            logging.info(f'Indexing the temperatures of {experiment}.')
+            store.import_temperatures(csv_path)
+    return store
+
+
+def parse_range_params(query: Dict[str, List[str]]) -> Tuple[Optional[float], Optional[float], int]:
+    """
+    Parse the parameters of a time range request.
+
+    :param query: Query parameters of the request.
+    :raises ValueError: If the parameters are not numbers.
+    :return: Start and end of the range (None for unbounded), and the maximum number of points.
+    """
+    start = float(query['start'][0]) if 'start' in query else None
+    end = float(query['end'][0]) if 'end' in query else None
+    max_points = int(query.get('max_points', [DEFAULT_MAX_POINTS])[0])
+    if max_points <= 0:
+        raise ValueError
+    return start, end, max_points
+
+
+def parse_sweep_params(query: Dict[str, List[str]]) -> Tuple[str, str, str]:
+    """
+    Parse the parameters of a sweep request.
+
+    :param query: Query parameters of the request.
+    :raises ValueError: If a parameter has an unknown value.
+    :return: The VNA id (such as 'vna1'), the encoding ('json' or 'binary') and the units of the
+    S-parameters (RI or DB).
+    """
+    vna = query.get('vna', ['1'])[0]
+    encoding = query.get('format', ['json'])[0]
+    units = query.get('units', [RI])[0]
+    if not INSTRUMENT_ID.fullmatch(f'vna{vna}') or encoding not in ('json', 'binary') or units not in (RI, DB):
+        raise ValueError
+    return f'vna{vna}', encoding, units
+
+
+def finite_list(values: np.ndarray) -> List[Optional[float]]:
+    """
+    :return: The values as a list, with None in place of NaN and infinities, which JSON can't hold.
+    """
+    if np.all(np.isfinite(values)):
+        return values.tolist()
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+
+def parse_instruments(value) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Parse the instruments an experiment declares besides VNAs 1 and 2 and sensors 1 and 2.
+
+    :param value: Dictionary of instruments by id, such as {"vna3": {"label": "...", "temp": "temp5"},
+    "temp5": {"label": "..."}}, or None.
+    :raises ValueError: If an id or a field is invalid, with a message for the client.
+    """
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError("'instruments' was not a dictionary.")
+
+    instruments = {}
+    for instrument_id, spec in value.items():
+        if not INSTRUMENT_ID.fullmatch(instrument_id) or instrument_id in ('vna1', 'vna2', 'temp1', 'temp2'):
+            raise ValueError(f"Invalid instrument id '{instrument_id}'.")
+        if not isinstance(spec, dict) or not all(v is None or isinstance(v, str) for v in spec.values()):
+            raise ValueError(f"The fields of instrument '{instrument_id}' were not strings.")
+        instruments[instrument_id] = {'label': spec.get('label') or instrument_id}
+        if instrument_id.startswith('vna'):
+            instruments[instrument_id]['temp'] = spec.get('temp') or None
+    return instruments
+
+
+def list_instruments(app_thread: AppThread) -> List[Dict]:
+    """
+    :return: The registered instruments with their connection state.
+    """
+    instruments = []
+    for instrument_id, session in app_thread.instruments.sessions().items():
+        # VNAs are connected to by host name, on the default port.
+        target = session.target[0] if isinstance(session.target, tuple) else session.target
+        instruments.append({'id': instrument_id,
+                            'name': session.name,
+                            'target': target,
+                            'connected': session.connected,
+                            'failures': session.failures,
+                            'reconnects': session.reconnects})
+    return instruments
+
+
+def route_label(path: str, status: int) -> str:
+    """
+    :return: Route of a request for the metrics, with the ids in the path replaced so that the
+    number of routes stays bounded.
+    """
+    if status == HTTPStatus.NOT_FOUND:
+        return 'not_found'
+    if not path.startswith('/api/'):
+        return path if path == '/metrics' else 'static'
+
+    parts = path.split('/')[:6]
+    # /api/experiments/<id>/..., /api/jobs/<id>/... and /api/instruments/<id>/connect
+    if len(parts) > 3 and parts[2] in ['experiments', 'jobs', 'instruments']:
+        parts[3] = '<id>'
+    # /api/experiments/<id>/sweeps/<index>
+    if len(parts) > 5 and parts[2] == 'experiments':
+        parts[5] = '<index>'
+    return '/'.join(parts)
+
+
+def app_metrics(app_thread: AppThread) -> List[Metric]:
+    """
+    :return: Metrics read from the state of the application when /metrics is served.
+    """
+    cycles = app_thread.scheduler.stats
+    writer = app_thread.writer.stats
+    backlog = app_thread.broker.backlog()
+
+    connected = Gauge('cryo_instrument_connected', 'Whether an instrument is connected.', ['instrument'], registry=None)
+    failures = Gauge('cryo_instrument_failures', 'Errors since the connection to an instrument last worked.',
+                     ['instrument'], registry=None)
+    reconnects = Counter('cryo_instrument_reconnects_total', 'Times the connection to an instrument was reopened.',
+                         ['instrument'], registry=None)
+    for instrument_id, session in app_thread.instruments.sessions().items():
+        connected.labels(instrument_id).set(session.connected)
+        failures.labels(instrument_id).set(session.failures)
+        reconnects.labels(instrument_id).inc(session.reconnects)
+
+    return [
+        gauge('cryo_running', 'Whether the experiment is running.', app_thread.running),
+        gauge('cryo_cycle_period_seconds', 'Configured seconds between sweeps.', app_thread.config.period),
+        gauge('cryo_cycle_last_duration_seconds', 'Seconds taken by the last acquisition cycle.', cycles.last_duration),
+        gauge('cryo_cycle_last_jitter_seconds', 'Seconds between the deadline and the start of the last cycle.',
+              cycles.last_jitter),
+        counter('cryo_cycles_total', 'Acquisition cycles run.', cycles.cycles),
+        counter('cryo_cycle_overruns_total', 'Cycles that took longer than the period.', cycles.overruns),
+        counter('cryo_cycle_missed_total', 'Deadlines skipped because a cycle overran.', cycles.missed),
+        connected,
+        failures,
+        reconnects,
+        gauge('cryo_stream_subscribers', 'Open data streams.', len(backlog)),
+        gauge('cryo_stream_max_unread_events', 'Events the furthest behind data stream has yet to send.',
+              max(backlog, default=0)),
+        gauge('cryo_writer_queued', 'Writes waiting in the writer queue.', writer.queued),
+        gauge('cryo_writer_queued_bytes', 'Bytes waiting in the writer queue.', writer.queued_bytes),
+        gauge('cryo_writer_last_latency_seconds', 'Seconds the oldest write of the last batch waited in the queue.',
+              writer.last_latency),
+        counter('cryo_writer_written_total', 'Writes carried out by the writer.', writer.written),
+        counter('cryo_writer_bytes_written_total', 'Bytes written by the writer.', writer.bytes_written),
+        counter('cryo_writer_blocked_total', 'Writes that had to wait for room in the writer queue.', writer.blocked),
+        counter('cryo_writer_blocked_seconds_total', 'Seconds spent waiting for room in the writer queue.',
+                writer.blocked_time),
+        counter('cryo_writer_errors_total', 'Writes that failed.', writer.errors),
+    ]
 
 
 def build_response_handler(app_thread: AppThread):
@@ -28,12 +299,44 @@ def build_response_handler(app_thread: AppThread):
 
     :return: ResponseHandler class that extends BaseHTTPRequestHandler.
     """
+    # Files served by the GUI, loaded once.
+    assets = StaticAssets('fetch')
+
+    # Serial device discovery, caching which devices are ESP32s.
+    discovery = DeviceDiscovery()
+
+    # Background exports, slowed down while data is being collected.
+    export_jobs = ExportJobs(throttle=lambda: app_thread.running)
+
+    # Sweeps parsed for the sweep endpoint.
+    sweep_cache = SweepCache()
 
     class ResponseHandler(BaseHTTPRequestHandler):
         """
         Handles responding to HTTP requests.
         """
 
+        def handle_one_request(self):
+            """
+            Serve a request, timing it for the metrics.
+            """
+            self.status: Optional[int] = None
+            start = time.perf_counter()
+            super().handle_one_request()
+            if self.status is None:
+                return
+            duration = time.perf_counter() - start
+            path = urlparse(getattr(self, 'path', '')).path
+            route = route_label(path, self.status)
+            TRACER.record(f'{self.command} {route}', 'http', start, duration, {'path': path, 'status': self.status})
+            # Data streams stay open until the client leaves, so their duration isn't a latency.
+            if path != '/api/stream_data':
+                HTTP_REQUEST_SECONDS.labels(self.command or '', route, self.status).observe(duration)
+
+        def send_response_only(self, code, message=None):
+            self.status = int(code)
+            super().send_response_only(code, message)
+
         def do_GET(self):
             """
             Handle HTTP GET requests.
@@ -43,25 +346,9 @@ def build_response_handler(app_thread: AppThread):
 
             # Serve this request depending on the requested path.
             if parsed.path in ['/', '/index', '/index.html']:
-                self.send_file_response('fetch/index.html')
-            elif parsed.path == '/index.js':
-                self.send_file_response('fetch/index.js', 'application/javascript')
-            elif parsed.path == '/index.css':
-                self.send_file_response('fetch/index.css', 'text/css')
-            elif parsed.path == '/plotly-2.19.1.min.js':
-                self.send_file_response('fetch/plotly-2.19.1.min.js', content_type='application/javascript')
-            elif parsed.path == '/favicon-16x16.png':
-                self.send_response(HTTPStatus.OK)
-                self.send_header('Content-Type', 'image/png')
-                self.end_headers()
-                with open('fetch/favicon-16x16.png', 'rb') as f:
-                    self.wfile.write(f.read())
-            elif parsed.path == '/favicon-32x32.png':
-                self.send_response(HTTPStatus.OK)
-                self.send_header('Content-Type', 'image/png')
-                self.end_headers()
-                with open('fetch/favicon-32x32.png', 'rb') as f:
-                    self.wfile.write(f.read())
+                self.send_static_response('index.html')
+            elif parsed.path.lstrip('/') in assets.assets:
+                self.send_static_response(parsed.path.lstrip('/'))
             elif parsed.path == '/api/metadata':
                 self.send_response(HTTPStatus.OK)
                 self.send_header('Content-type', 'application/json')
@@ -73,25 +360,52 @@ def build_response_handler(app_thread: AppThread):
                 self.end_headers()
                 self.wfile.write(json.dumps(app_thread.config, cls=EnhancedJSONEncoder).encode('utf-8'))
             elif parsed.path == '/api/devices':
-                devices = find_available_devices()
-                self.send_json_response(devices)
+                # Don't probe the port we are connected to.
+                temperature = app_thread.instruments.temperature
+                exclude = [temperature.port] if temperature.connected else []
+                devices = discovery.devices(exclude)
+                if parse_qs(parsed.query).get('details') == ['true']:
+                    self.send_json_response(devices, cls=EnhancedJSONEncoder)
+                else:
+                    self.send_json_response([d.port for d in devices])
             elif parsed.path == '/api/stream_data':
-                self.stream_data()
+                self.stream_data(parse_qs(parsed.query))
             elif parsed.path == '/api/running':
                 self.send_json_response(app_thread.running)
             elif parsed.path == '/api/previous_experiments':
-                self.send_json_response(find_previous_experiments())
+                self.previous_experiments(parse_qs(parsed.query))
+            elif parsed.path.startswith('/api/experiments/'):
+                self.send_experiment_data(parsed.path.removeprefix('/api/experiments/'), parse_qs(parsed.query))
             elif parsed.path == '/api/experiment_selected':
                 self.send_json_response(app_thread.experiment_selected)
             elif parsed.path == '/api/devices_connected':
                 # these checks are not perfect
                 # a failure in the appthread has to occur for the connection to be set to None
-                data = {
-                    'temperature': (app_thread.con is not None),
-                    'vna1': (app_thread.vna_con1 is not None),
-                    'vna2': (app_thread.vna_con2 is not None),
-                }
+                data = {instrument_id: session.connected
+                        for instrument_id, session in app_thread.instruments.sessions().items()}
                 self.send_json_response(data)
+            elif parsed.path == '/api/instruments':
+                self.send_json_response(list_instruments(app_thread))
+            elif parsed.path == '/api/jobs':
+                self.send_json_response(export_jobs.jobs(), cls=EnhancedJSONEncoder)
+            elif parsed.path.startswith('/api/jobs/'):
+                self.send_job(parsed.path.removeprefix('/api/jobs/'))
+            elif parsed.path == '/api/cycle_stats':
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps(app_thread.scheduler.stats, cls=EnhancedJSONEncoder).encode('utf-8'))
+            elif parsed.path == '/api/writer_stats':
+                self.send_json_response(app_thread.writer.stats, cls=EnhancedJSONEncoder)
+            elif parsed.path == '/api/trace':
+                self.send_trace(parse_qs(parsed.query))
+            elif parsed.path == '/metrics':
+                data = render(REGISTRY.metrics() + app_metrics(app_thread))
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
             else:
                 self.send_response_only(HTTPStatus.NOT_FOUND)
                 self.end_headers()
@@ -107,9 +421,7 @@ def build_response_handler(app_thread: AppThread):
             if parsed.path == '/api/config':
                 self.update_config()
             elif parsed.path == '/api/generate_combined_csv':
-                # TODO: implement this last (once we have some data to work with)
-                self.send_response_only(HTTPStatus.NOT_IMPLEMENTED)
-                self.end_headers()
+                self.generate_combined()
             elif parsed.path == '/api/start':
                 self.start()
             elif parsed.path == '/api/stop':
@@ -118,64 +430,272 @@ def build_response_handler(app_thread: AppThread):
             elif parsed.path == '/api/create_experiment':
                 self.create_experiment()
             elif parsed.path == '/api/connect':
-                self.connect()
-            elif parsed.path == '/api/connect_vna1':
-                self.connect_vna1()
-            elif parsed.path == '/api/connect_vna2':
-                self.connect_vna2()
+                self.connect_instrument('temperature')
+            elif parsed.path in ['/api/connect_vna1', '/api/connect_vna2']:
+                self.connect_instrument(parsed.path.removeprefix('/api/connect_'))
+            elif parsed.path.startswith('/api/instruments/') and parsed.path.endswith('/connect'):
+                self.connect_instrument(parsed.path.removeprefix('/api/instruments/').removesuffix('/connect'))
             else:
                 self.send_response_only(HTTPStatus.NOT_FOUND)
                 self.end_headers()
 
-        def send_file_response(self, path: str, content_type='text/html') -> None:
+        def send_static_response(self, name: str) -> None:
             """
-            Respond with the contents of the file at the provided path.
+            Respond with a file from the fetch/ directory, compressed if the client accepts it.
+            Answers with 304 Not Modified if the client's cached copy is still current.
 
-            :param path: Path of the file to be read.
-            :param content_type: Content type of the file, defaults to 'text/html'
+            :param name: Name of the file.
             """
+            asset = assets.get(name)
+            coding, data, etag = asset.select(self.headers.get('Accept-Encoding'))
+
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match and (if_none_match.strip() == '*' or etag in [x.strip() for x in if_none_match.split(',')]):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', asset.cache_control)
+                self.end_headers()
+                return
+
             self.send_response(HTTPStatus.OK)
-            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Type', asset.content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', asset.cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            if coding != 'identity':
+                self.send_header('Content-Encoding', coding)
             self.end_headers()
-            with open(path, encoding='utf-8') as f:
-                self.wfile.write(f.read().encode('utf-8'))
-        
-        def send_json_response(self, data, status=HTTPStatus.OK) -> None:
+            self.wfile.write(data)
+
+        def send_json_response(self, data, status=HTTPStatus.OK, cls=None) -> None:
             """
             Respond with JSON content.
 
             :data: Data that can be serialized to json.
             :status: HTTPStatus to respond with, defaults to HTTPStatus.OK
+            :cls: JSONEncoder to serialize with, defaults to the standard one.
             """
             self.send_response(status)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps(data).encode('utf-8'))
+            self.wfile.write(json.dumps(data, cls=cls).encode('utf-8'))
 
-        def stream_data(self) -> None:
+        def stream_data(self, query: Dict[str, List[str]]) -> None:
             """
             Send a stream of JSON events for the temperature data until the connection is closed.
+
+            The data collected so far is sent first as a single 'history' event, downsampled to
+            'max_points' points. A client reconnecting with a Last-Event-ID header only gets the data
+            points it missed.
+
+            :param query: Query parameters of the request.
             """
+            try:
+                max_points, last_event_id = parse_stream_params(query, self.headers)
+            except ValueError:
+                self.send_json_response("'max_points' and 'Last-Event-ID' must be integers.", status=HTTPStatus.BAD_REQUEST)
+                return
+
             self.send_response(HTTPStatus.OK)
             self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+
+            # Subscribe before reading the history so no data point is missed in between.
+            with app_thread.broker.subscribe() as sub:
+                try:
+                    history, last = build_history_event(app_thread, last_event_id, max_points)
+                    self.wfile.write(history)
+
+                    # Run until the connection is closed.
+                    while True:
+                        # Block until data is available.
+                        events = sub.get(timeout=STREAM_KEEPALIVE)
+                        if events:
+                            # Skip data points that were already sent with the history.
+                            self.wfile.write(b''.join(payload for event_id, payload in events if event_id > last))
+                            last = max(last, events[-1][0])
+                        else:
+                            # Write a comment so that closed connections are noticed.
+                            self.wfile.write(b': keepalive\n\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    logging.info('Data stream closed by the client.')
+                except:
+                    logging.exception('An error occured while serving stream data.')
+
+        def previous_experiments(self, query: Dict[str, List[str]]) -> None:
+            """
+            Respond with the experiments in the catalog, filtered, sorted and paginated according
+            to the query parameters.
+
+            :param query: Query parameters of the request.
+            """
+            try:
+                params = parse_catalog_params(query)
+                experiments, total = app_thread.catalog.query(**params)
+            except ValueError as e:
+                self.send_json_response(str(e), status=HTTPStatus.BAD_REQUEST)
+                return
+
+            if query.get('details') == ['true']:
+                self.send_json_response({'total': total, 'experiments': experiments}, cls=EnhancedJSONEncoder)
+            else:
+                self.send_json_response([e.name for e in experiments])
+
+        def send_experiment_data(self, path: str, query: Dict[str, List[str]]) -> None:
+            """
+            Respond with data of an experiment.
+
+            :param path: Part of the path after /api/experiments/, such as '<id>/temperatures' or
+            '<id>/sweeps/<n>'.
+            :param query: Query parameters of the request.
+            """
+            experiment, _, resource = path.partition('/')
+            if app_thread.catalog.get(experiment) is not None:
+                if resource == 'temperatures':
+                    self.send_temperatures(experiment, query)
+                    return
+                if resource.startswith('sweeps/'):
+                    self.send_sweep(experiment, resource.removeprefix('sweeps/'), query)
+                    return
+            self.send_response_only(HTTPStatus.NOT_FOUND)
+            self.end_headers()
+
+        def send_temperatures(self, experiment: str, query: Dict[str, List[str]]) -> None:
+            """
+            Respond with the temperatures of an experiment over a time range.
+            """
+            try:
+                start, end, max_points = parse_range_params(query)
+            except ValueError:
+                self.send_json_response("'start' and 'end' must be numbers and 'max_points' a positive integer.",
+                                        status=HTTPStatus.BAD_REQUEST)
+                return
+
+            try:
+                store = open_experiment_store(app_thread, experiment)
+                samples, level = store.query_temperatures(start, end, max_points)
+            except:
+                msg = 'Error reading the temperatures.'
+                logging.exception(msg)
+                self.send_json_response(msg, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+                return
+
+            data = to_lists(samples)
+            data['level'] = level
+            self.send_json_response(data)
+
+        def send_sweep(self, experiment: str, index: str, query: Dict[str, List[str]]) -> None:
+            """
+            Respond with a sweep of an experiment, parsed from its .s2p and .csv files.
+
+            :param index: Index of the sweep among the VNA's sweeps, negative to count from the last.
+            """
+            try:
+                n = int(index)
+                vna, encoding, units = parse_sweep_params(query)
+            except ValueError:
+                self.send_json_response("'vna' must be a VNA number, 'format' json or binary and 'units' ri or db.",
+                                        status=HTTPStatus.BAD_REQUEST)
+                return
+
+            files = [f for f in find_sweep_files(os.path.join('experiments', experiment)) if f.vna == vna]
+            if not -len(files) <= n < len(files):
+                self.send_response_only(HTTPStatus.NOT_FOUND)
+                self.end_headers()
+                return
+            file = files[n]
+
+            try:
+                sweep = sweep_cache.get(file.path, file.path.removesuffix('.csv') + '.s2p')
+            except FileNotFoundError:
+                self.send_response_only(HTTPStatus.NOT_FOUND)
+                self.end_headers()
+                return
+            except:
+                msg = 'Error reading the sweep.'
+                logging.exception(msg)
+                self.send_json_response(msg, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+                return
+
+            columns = sweep.columns(units)
+            if encoding == 'json':
+                data = {name: finite_list(values) for name, values in columns.items()}
+                self.send_json_response({'name': file.name, 'time': file.ts, 'vna': vna, 'columns': data})
+                return
+
+            # One little-endian float64 row per column, named in order by a header.
+            body = np.stack(list(columns.values())).astype('<f8').tobytes()
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-Sweep-Name', file.name)
+            self.send_header('X-Sweep-Time', str(file.ts))
+            self.send_header('X-Sweep-Columns', ','.join(columns))
+            self.send_header('X-Sweep-Points', str(len(sweep.freq)))
             self.end_headers()
+            self.wfile.write(body)
+
+        def generate_combined(self) -> None:
+            """
+            Start exporting an experiment's data to an Excel workbook in the background.
+            """
+            # The experiment name is optional, the current experiment is exported by default.
+            experiment = app_thread.dir
+            length = self.headers.get('length')
+            if length is not None:
+                try:
+                    content = self.rfile.read(int(length)).decode('utf-8')
+                    experiment = json.loads(content).get('experiment', experiment)
+                except:
+                    self.send_json_response('Error reading JSON contents.', status=HTTPStatus.BAD_REQUEST)
+                    return
 
-            # Get a queue from the app thread for the temperature data.
-            queue = app_thread.get_queue()
+            if experiment is None or app_thread.catalog.get(experiment) is None:
+                self.send_json_response('No such experiment.', status=HTTPStatus.BAD_REQUEST)
+                return
 
             try:
-                # Run until the connection is closed.
-                while True:
-                    # Block until data is available.
-                    data: Dict = queue.get()
-                    # String formatted for event.
-                    s = 'event: temperature\ndata: ' + json.dumps(data) + '\n\n'
-                    # Write to stream.
-                    self.wfile.write(s.encode('utf-8'))
+                job = export_jobs.submit(experiment)
             except:
-                # An exception occured and the connection is closed, remove the queue from the pool.
-                app_thread.queue_pool.remove(queue)
-                logging.exception('An error occured while serving stream data.')
+                msg = 'Error starting the export.'
+                logging.exception(msg)
+                self.send_json_response(msg, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+                return
+
+            status = HTTPStatus.OK if job.state == 'done' else HTTPStatus.ACCEPTED
+            self.send_json_response(job, status=status, cls=EnhancedJSONEncoder)
+
+        def send_job(self, path: str) -> None:
+            """
+            Respond with the status of an export job, or with its result for '<id>/result'.
+
+            :param path: Part of the path after /api/jobs/.
+            """
+            job_id, _, rest = path.partition('/')
+            job = export_jobs.get(job_id)
+            if job is None or rest not in ('', 'result'):
+                self.send_response_only(HTTPStatus.NOT_FOUND)
+                self.end_headers()
+                return
+
+            if rest == '':
+                self.send_json_response(job, cls=EnhancedJSONEncoder)
+                return
+
+            if job.state != 'done':
+                self.send_json_response('The export has not finished.', status=HTTPStatus.CONFLICT)
+                return
+
+            with open(job.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                self.send_header('Content-Length', str(size))
+                self.send_header('Content-Disposition', f'attachment; filename="{job.experiment}.xlsx"')
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile)
 
         def update_config(self) -> None:
             """
@@ -210,12 +730,94 @@ def build_response_handler(app_thread: AppThread):
                 self.send_json_response("'period' was not an integer.", status=HTTPStatus.BAD_REQUEST)
                 return
 
+            binary_transfer = config.get('binary_transfer', app_thread.config.binary_transfer)
+
+            if type(binary_transfer) != bool:
+                self.send_json_response("'binary_transfer' was not a boolean.", status=HTTPStatus.BAD_REQUEST)
+                return
+
+            sweep_files = config.get('sweep_files', app_thread.config.sweep_files)
+
+            if type(sweep_files) != bool:
+                self.send_json_response("'sweep_files' was not a boolean.", status=HTTPStatus.BAD_REQUEST)
+                return
+
+            stream_period = config.get('stream_period', app_thread.config.stream_period)
+
+            if type(stream_period) not in (int, float) or stream_period < 0:
+                self.send_json_response("'stream_period' was not a non-negative number.", status=HTTPStatus.BAD_REQUEST)
+                return
+
+            flush_count = config.get('flush_count', app_thread.config.flush_count)
+
+            if type(flush_count) != int or flush_count < 1:
+                self.send_json_response("'flush_count' was not a positive integer.", status=HTTPStatus.BAD_REQUEST)
+                return
+
+            flush_interval = config.get('flush_interval', app_thread.config.flush_interval)
+
+            if type(flush_interval) not in (int, float) or flush_interval < 0:
+                self.send_json_response("'flush_interval' was not a non-negative number.", status=HTTPStatus.BAD_REQUEST)
+                return
+
+            fsync = config.get('fsync', app_thread.config.fsync)
+
+            if type(fsync) != bool:
+                self.send_json_response("'fsync' was not a boolean.", status=HTTPStatus.BAD_REQUEST)
+                return
+
+            tracing = config.get('tracing', app_thread.config.tracing)
+
+            if type(tracing) != bool:
+                self.send_json_response("'tracing' was not a boolean.", status=HTTPStatus.BAD_REQUEST)
+                return
+
             app_thread.config.period = period
+            app_thread.config.binary_transfer = binary_transfer
+            app_thread.config.sweep_files = sweep_files
+            # Picked up by the writer at its next flush.
+            app_thread.config.flush_count = flush_count
+            app_thread.config.flush_interval = flush_interval
+            app_thread.config.fsync = fsync
+            app_thread.config.tracing = tracing
+            TRACER.enabled = tracing
+            # Reschedule the next sweep with the new period.
+            app_thread.scheduler.wake()
+
+            if stream_period != app_thread.config.stream_period:
+                app_thread.config.stream_period = stream_period
+                app_thread.configure_stream()
 
             self.send_json_response({
-                "period": app_thread.config.period
+                "period": app_thread.config.period,
+                "binary_transfer": app_thread.config.binary_transfer,
+                "sweep_files": app_thread.config.sweep_files,
+                "stream_period": app_thread.config.stream_period,
+                "flush_count": app_thread.config.flush_count,
+                "flush_interval": app_thread.config.flush_interval,
+                "fsync": app_thread.config.fsync,
+                "tracing": app_thread.config.tracing,
             })
 
+        def send_trace(self, query: Dict[str, List[str]]) -> None:
+            """
+            Respond with the recorded spans as a Chrome Trace Event file, optionally limited to the
+            time range given by the start and end parameters.
+            """
+            try:
+                start, end, _ = parse_range_params(query)
+            except ValueError:
+                self.send_json_response('Invalid time range.', status=HTTPStatus.BAD_REQUEST)
+                return
+
+            data = json.dumps(TRACER.dump(start, end)).encode('utf-8')
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Content-Disposition', f'attachment; filename="trace_{timestamp_name(time.time())}.json"')
+            self.end_headers()
+            self.wfile.write(data)
+
         def start(self) -> None:
             """
             Start collecting data if an experiment has been selected.
@@ -229,66 +831,29 @@ def build_response_handler(app_thread: AppThread):
                 logging.warning(msg)
                 self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 
-        def connect(self) -> None:
+        def connect_instrument(self, instrument_id: str) -> None:
             """
-            Connect to microcontroller for temperature measurement.
+            Connect to an instrument: the USB device with the provided port for 'temperature', or
+            the VNA at the provided IP address.
+
+            :param instrument_id: Id of the instrument, such as 'temperature' or 'vna1'.
             """
-            # Check if a temperature sensor was selected
-            if app_thread.metadata.temp1 is None and app_thread.metadata.temp2 is None:
-                msg = 'No temperature sensor was selected for this experiment.'
-                self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
-                return
-            
-            try:
-                length = int(self.headers.get('length'))
-            except TypeError:
-                self.send_json_response("'length' was not an integer.", status=HTTPStatus.BAD_REQUEST)
-                return
-            
-            try:
-                port = json.loads(self.rfile.read(length).decode('utf-8'))
-            except:
-                self.send_json_response('Error reading JSON contents.', status=HTTPStatus.BAD_REQUEST)
+            session = app_thread.instruments.get(instrument_id)
+            if session is None:
+                self.send_response_only(HTTPStatus.NOT_FOUND)
+                self.end_headers()
                 return
 
-            # Check if there's an existing connection that we need to close.
-            if app_thread.con:
-                try:
-                    logging.info('Closing existing serial connection.')
-                    app_thread.con.close()
-                except:
-                    logging.exception('An error occured while closing the existing connection.')
-            
-            # Find available ports
-            available = find_available_devices()
-
-            # Check if the requested  port is one the available ports
-            if port not in available:
-                msg = f"The requested port '{port}' is not available."
-                logging.warning(msg)
-                self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
+            # Check if the instrument was selected for this experiment.
+            if app_thread.metadata is None:
+                self.send_json_response('No experiment selected.', status=HTTPStatus.BAD_REQUEST)
                 return
-            
-            timeout = 5
-
-            try:
-                app_thread.con = serial.Serial(port=port, baudrate=USB_BAUD_RATE, timeout=timeout)
-            except:
-                msg = f"Unable to open port '{port}'"
-                logging.exception(msg)
+            if instrument_id == 'temperature' and not app_thread.metadata.sensors():
+                msg = 'No temperature sensor was selected for this experiment.'
                 self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 return
-
-            logging.info(f'Connected to USB device at {port}')
-            self.send_json_response('Connection successful.')
-        
-        def connect_vna1(self) -> None:
-            """
-            Connect to the VNA at the provided IP address.
-            """
-            # Check if VNA 1 has been selected
-            if app_thread.metadata.vna1 is None:
-                msg = 'VNA 1 was not selected for this experiment.'
+            if instrument_id != 'temperature' and instrument_id not in app_thread.metadata.vnas():
+                msg = f'{session.name} was not selected for this experiment.'
                 self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 return
 
@@ -299,96 +864,61 @@ def build_response_handler(app_thread: AppThread):
                 self.send_json_response("'length' was not an integer.", status=HTTPStatus.BAD_REQUEST)
                 return
 
-            # Read the VNA IP address from the requests contents.
+            # Read the port or IP address from the requests contents.
             try:
-                host = json.loads(self.rfile.read(length).decode('utf-8'))
+                address = json.loads(self.rfile.read(length).decode('utf-8'))
             except:
                 self.send_json_response('Error reading JSON contents.', status=HTTPStatus.BAD_REQUEST)
                 return
 
-            # Check if the connection to the VNA already exists.
-            if app_thread.vna_con1:
-                # Try closing the socket connection.
-                try:
-                    logging.info('Closing existing socket connection.')
-                    app_thread.vna_con1.close()
-                except:
-                    logging.exception('Error closing socket connection.') 
+            if instrument_id == 'temperature':
+                self.connect_serial(address)
+                return
 
+            # The session closes the existing connection, waiting for a capture in progress.
             try:
-                # Create socket object.
-                app_thread.vna_con1 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                # Connect to that socket.
-                app_thread.vna_con1.connect((host, VNA_PORT))
-                # Send the identify command to the VNA.
-                app_thread.vna_con1.send(build_cmd('*IDN?'))
-                # Read the VNA's reply.
-                recv = app_thread.vna_con1.recv(2048)
-                logging.info(f"Connected to {recv.decode('utf-8')}")
+                idn = session.open(address)
+                logging.info(f'Connected to {idn}')
             except:
-                # Set the connection to None.
-                app_thread.vna_con1 = None
                 msg = 'Error occured while connecting to VNA.'
                 logging.exception(msg)
                 self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 return
 
             # Everything was good, respond with OK.
-            self.send_json_response('Successfully connected to VNA 1.', HTTPStatus.OK)
-        
-        def connect_vna2(self) -> None:
+            self.send_json_response(f'Successfully connected to {session.name}.', HTTPStatus.OK)
+
+        def connect_serial(self, port: str) -> None:
             """
-            Connect to the VNA at the provided IP address.
+            Connect to microcontroller for temperature measurement.
+
+            :param port: Serial port of the microcontroller.
             """
-            # Check if VNA 2 has been selected
-            if app_thread.metadata.vna2 is None:
-                msg = 'VNA 2 was not selected for this experiment.'
-                self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
-                return
-            
-            # Get the length of the request's contents.
-            try:
-                length = int(self.headers.get('length'))
-            except TypeError:
-                self.send_json_response("'length' was not an integer.", status=HTTPStatus.BAD_REQUEST)
-                return
+            # Find available ports, no need to probe them since the user picked one.
+            available = discovery.ports(probe_new=False)
 
-            # Read the VNA IP address from the requests contents.
-            try:
-                host = json.loads(self.rfile.read(length).decode('utf-8'))
-            except:
-                self.send_json_response('Error reading JSON contents.', status=HTTPStatus.BAD_REQUEST)
+            # Check if the requested  port is one the available ports
+            if port not in available:
+                msg = f"The requested port '{port}' is not available."
+                logging.warning(msg)
+                self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 return
 
-            # Check if the connection to the VNA already exists.
-            if app_thread.vna_con2:
-                # Try closing the socket connection.
-                try:
-                    logging.info('Closing existing socket connection.')
-                    app_thread.vna_con2.close()
-                except:
-                    logging.exception('Error closing socket connection.') 
-
+            # The stream reads from the current connection, so stop it before replacing it.
+            app_thread.stop_stream()
             try:
-                # Create socket object.
-                app_thread.vna_con2 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                # Connect to that socket.
-                app_thread.vna_con2.connect((host, VNA_PORT))
-                # Send the identify command to the VNA.
-                app_thread.vna_con2.send(build_cmd('*IDN?'))
-                # Read the VNA's reply.
-                recv = app_thread.vna_con2.recv(2048)
-                logging.info(f"Connected to {recv.decode('utf-8')}")
+                app_thread.instruments.temperature.open(port)
             except:
-                # Set the connection to None.
-                app_thread.vna_con2 = None
-                msg = 'Error occured while connecting to VNA.'
+                msg = f"Unable to open port '{port}'"
                 logging.exception(msg)
                 self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 return
 
-            # Everything was good, respond with OK.
-            self.send_json_response('Successfully connected to VNA 2.', HTTPStatus.OK)
+            # Start the temperature stream if it is enabled.
+            app_thread.configure_stream()
+
+            logging.info(f'Connected to USB device at {port}')
+            self.send_json_response('Connection successful.')
 
         def create_experiment(self) -> None:
             """
@@ -484,20 +1014,40 @@ def build_response_handler(app_thread: AppThread):
                 self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
                 return
 
-            app_thread.metadata = Metadata(title=title,
-                                           name=name,
-                                           cpa=cpa,
-                                           date=date,
-                                           temp1=temp1,
-                                           temp2=temp2,
-                                           vna1=vna1,
-                                           vna2=vna2,
-                                           vna1_temp=vna1_temp,
-                                           vna2_temp=vna2_temp)
+            try:
+                instruments = parse_instruments(metadata.get('instruments'))
+            except ValueError as e:
+                self.send_json_response(str(e), status=HTTPStatus.BAD_REQUEST)
+                return
+
+            experiment = Metadata(title=title,
+                                  name=name,
+                                  cpa=cpa,
+                                  date=date,
+                                  temp1=temp1,
+                                  temp2=temp2,
+                                  vna1=vna1,
+                                  vna2=vna2,
+                                  vna1_temp=vna1_temp,
+                                  vna2_temp=vna2_temp,
+                                  instruments=instruments)
+
+            # Check that the sensors associated with the other VNAs were selected too.
+            sensors = experiment.sensors()
+            for vna, sensor in experiment.vnas().items():
+                if sensor is not None and sensor not in sensors:
+                    msg = f'The temperature sensor associated with {vna} was not selected.'
+                    logging.warning(msg)
+                    self.send_json_response(msg, status=HTTPStatus.BAD_REQUEST)
+                    return
+
+            app_thread.metadata = experiment
+            app_thread.instruments.declare(experiment.vnas())
             app_thread.dir = directory
             app_thread.experiment_selected = True
 
             self.save_metadata()
+            app_thread.catalog.add(directory, app_thread.metadata)
             self.send_response_only(HTTPStatus.OK)
             self.end_headers()
 
@@ -0,0 +1,357 @@
+"""
+Module for the instrument registry and sessions, which own the connections to the VNAs and the
+temperature microcontroller.
+
+Each session serializes access to its connection with a lock, and reopens the connection on its own
+after an error: right away the first time, then with an exponential backoff while the instrument
+stays unreachable.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import logging
+import socket
+from threading import Lock
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import serial
+
+from metadata import instrument_key
+from temp_stream import USB_BAUD_RATE
+from tracing import TRACER
+from vna import VNA_PORT, query
+from vna_funcs import ping_vna
+
+
+# Seconds to wait for a VNA to accept a connection.
+CONNECT_TIMEOUT = 5
+
+# Seconds a VNA may take to answer a query, including MMEM:STOR;*OPC? on a slow instrument.
+IO_TIMEOUT = 30
+
+# Seconds of TCP idle time before the OS starts probing a VNA connection.
+TCP_KEEPIDLE = 60
+
+# Seconds to wait for the microcontroller to answer a reading.
+SERIAL_TIMEOUT = 5
+
+# Seconds between reconnection attempts, doubling from the first to the last.
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+
+# Number of instruments driven at the same time.
+MAX_WORKERS = 8
+
+# VNAs registered before an experiment declares its own.
+DEFAULT_VNAS = ('vna1', 'vna2')
+
+
+class NotConnected(Exception):
+    """
+    Raised when an instrument has no connection and can't be reconnected yet.
+    """
+
+
+class Session:
+    """
+    Connection to an instrument, opened with open() and reopened automatically after an error.
+    """
+
+    # Errors raised while using the connection that mean it should be reopened.
+    drop_on: Tuple[Type[BaseException], ...] = (Exception,)
+
+    def __init__(self, name: str):
+        """
+        :param name: Name of the instrument, for logs.
+        """
+        self.name = name
+
+        # Address of the instrument, None until open() is called or after close().
+        self.target: Any = None
+
+        # Number of errors since the connection last worked.
+        self.failures = 0
+
+        # Number of times the connection was reopened automatically.
+        self.reconnects = 0
+
+        self._conn: Any = None
+        self._retry_at = 0.0
+        self._lock = Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    def open(self, target) -> str:
+        """
+        Connect to an instrument, closing the current connection first.
+
+        :param target: Address of the instrument.
+        :raises Exception: If the connection can't be opened.
+        :return: Identification of the instrument.
+        """
+        with self._lock:
+            self._close()
+            self.target = target
+            self.failures = 0
+            try:
+                self._conn = self._connect(target)
+                return self._identify(self._conn)
+            except:
+                # Don't keep reconnecting to an address that never worked.
+                self._close()
+                self.target = None
+                raise
+
+    def close(self) -> None:
+        """
+        Close the connection and stop reconnecting.
+        """
+        with self._lock:
+            self._close()
+            self.target = None
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """
+        Hold the connection, reconnecting first if needed. An error in the with block listed in
+        drop_on closes the connection, and the next use reopens it.
+
+        :raises NotConnected: If there is no connection and it can't be reopened yet.
+        """
+        with self._lock:
+            self._ensure()
+            try:
+                yield self._conn
+            except self.drop_on:
+                self._drop()
+                raise
+            self.failures = 0
+
+    def connection(self) -> Any:
+        """
+        :raises NotConnected: If there is no connection and it can't be reopened yet.
+        :return: The connection, for a user that doesn't need the lock such as a stream reader.
+        """
+        with self._lock:
+            self._ensure()
+            return self._conn
+
+    def drop(self) -> None:
+        """
+        Close the connection after an error found by a user of connection().
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._drop()
+
+    def keepalive(self) -> None:
+        """
+        Check that the instrument still answers, or try to reconnect if it is due. Skipped if the
+        connection is in use, which shows it is alive anyway.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._ensure()
+            self._ping(self._conn)
+            self.failures = 0
+        except NotConnected:
+            pass
+        except:
+            logging.exception(f'{self.name} did not answer the keepalive.')
+            self._drop()
+        finally:
+            self._lock.release()
+
+    def _ensure(self) -> None:
+        """
+        Reconnect if there is no connection. Called with the lock held.
+        """
+        if self._conn is not None:
+            return
+        if self.target is None:
+            raise NotConnected(f'{self.name} is not connected.')
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise NotConnected(f'{self.name} is disconnected, reconnecting in {self._retry_at - now:.0f} s.')
+        try:
+            with TRACER.span('reconnect', 'instrument', instrument=self.name):
+                self._conn = self._connect(self.target)
+                logging.info(f'Reconnected to {self.name}: {self._identify(self._conn)}')
+        except:
+            self._close()
+            self.failures += 1
+            self._retry_at = now + self._delay()
+            logging.warning(f'Unable to reconnect to {self.name}, trying again in {self._delay():.0f} s.')
+            raise NotConnected(f'{self.name} is disconnected.')
+        self.reconnects += 1
+
+    def _drop(self) -> None:
+        """
+        Close the connection after an error. Called with the lock held.
+        """
+        self._close()
+        self.failures += 1
+        # Reconnect right away after the first error, it may just have been a glitch.
+        self._retry_at = time.monotonic() + (self._delay() if self.failures > 1 else 0)
+
+    def _delay(self) -> float:
+        return min(RECONNECT_MAX, RECONNECT_MIN * 2 ** min(max(self.failures - 1, 0), 16))
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except:
+                logging.exception(f'Error closing the connection to {self.name}.')
+            self._conn = None
+
+    def _connect(self, target) -> Any:
+        raise NotImplementedError
+
+    def _identify(self, conn) -> str:
+        return str(self.target)
+
+    def _ping(self, conn) -> None:
+        pass
+
+
+class VNASession(Session):
+    """
+    Socket connection to a VNA, kept alive with *OPC? and TCP keepalive.
+    """
+
+    def open(self, host: str, port: int = VNA_PORT) -> str:
+        return super().open((host, port))
+
+    def _connect(self, target: Tuple[str, int]) -> socket.socket:
+        s = socket.create_connection(target, timeout=CONNECT_TIMEOUT)
+        try:
+            s.settimeout(IO_TIMEOUT)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPIDLE)
+        except:
+            s.close()
+            raise
+        return s
+
+    def _identify(self, conn: socket.socket) -> str:
+        return query(conn, '*IDN?')
+
+    def _ping(self, conn: socket.socket) -> None:
+        ping_vna(conn)
+
+
+class SerialSession(Session):
+    """
+    Serial connection to the temperature microcontroller. The connection is only reopened after
+    serial errors, not after a garbled reading.
+    """
+
+    drop_on = (serial.SerialException, OSError)
+
+    def _connect(self, port: str) -> serial.Serial:
+        return serial.Serial(port=port, baudrate=USB_BAUD_RATE, timeout=SERIAL_TIMEOUT)
+
+    @property
+    def port(self) -> Optional[str]:
+        return self.target
+
+
+class InstrumentManager:
+    """
+    Registry of the instruments: the microcontroller, with id 'temperature', and the VNAs declared
+    by the experiment, with ids 'vna1', 'vna2' and so on. Instruments are driven in parallel on a
+    bounded pool of workers, so a sweep takes as long as the slowest VNA rather than the sum of all
+    of them.
+    """
+
+    def __init__(self, vnas: Iterable[str] = DEFAULT_VNAS, max_workers: int = MAX_WORKERS):
+        """
+        :param vnas: Ids of the VNAs to register.
+        :param max_workers: Number of instruments driven at the same time.
+        """
+        self.temperature = SerialSession('the temperature microcontroller')
+
+        # Sessions of the VNAs by id, in numeric order. Replaced rather than modified, so it can be
+        # iterated without a lock.
+        self.vnas: Dict[str, VNASession] = {}
+
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='instrument')
+        self._lock = Lock()
+
+        # Whether close() was called, after which nothing is submitted to the pool.
+        self.closed = False
+        self.declare(vnas)
+
+    def declare(self, ids: Iterable[str]) -> None:
+        """
+        Register the VNAs among the ids that aren't registered yet. Sensor ids such as 'temp5' are
+        channels of the microcontroller and need no session.
+        """
+        with self._lock:
+            vnas = dict(self.vnas)
+            for instrument_id in ids:
+                if instrument_id.startswith('vna') and instrument_id not in vnas:
+                    vnas[instrument_id] = VNASession(f'VNA {instrument_id[3:]}')
+            self.vnas = dict(sorted(vnas.items(), key=lambda item: instrument_key(item[0])))
+
+    def get(self, instrument_id: str) -> Optional[Session]:
+        """
+        :return: The session of the instrument, None if it isn't registered.
+        """
+        if instrument_id == 'temperature':
+            return self.temperature
+        return self.vnas.get(instrument_id)
+
+    def sessions(self) -> Dict[str, Session]:
+        """
+        :return: Every session by instrument id.
+        """
+        return {'temperature': self.temperature, **self.vnas}
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Call a function on the pool of workers.
+
+        :raises NotConnected: If the instruments were closed.
+        :return: Future of the result.
+        """
+        with self._lock:
+            if self.closed:
+                raise NotConnected('The instruments are closed.')
+            return self.pool.submit(fn, *args)
+
+    def run(self, fn: Callable[[Session], Any], sessions: Iterable[Session]) -> List[Any]:
+        """
+        Call a function on each session in parallel.
+
+        :raises NotConnected: If the instruments were closed.
+        :return: The results, in the order of the sessions.
+        """
+        futures = [self.submit(fn, session) for session in sessions]
+        return [future.result() for future in futures]
+
+    def keepalive(self) -> None:
+        """
+        Ping the VNAs, reconnecting those that are due. The microcontroller is reconnected by the
+        next reading instead.
+        """
+        try:
+            self.run(VNASession.keepalive, self.vnas.values())
+        except NotConnected:
+            pass
+
+    def close(self) -> None:
+        """
+        Close every connection and stop the workers, waiting for the calls already submitted.
+        """
+        with self._lock:
+            self.closed = True
+        for session in self.sessions().values():
+            session.close()
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,198 @@
+"""
+Module for the ExportJobs class, which runs combined exports in the background.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+from threading import Lock
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import uuid
+
+from generate_excel import export, find_sweep_files
+
+
+# Bump when the export's output changes, so older cached results aren't reused.
+EXPORT_VERSION = 3
+
+# Number of jobs kept for the status endpoint.
+MAX_JOBS = 100
+
+# Read rate of a throttled export, in bytes per second.
+THROTTLED_RATE = 4_000_000
+
+# Processes parsing sweep files when throttled.
+THROTTLED_WORKERS = 1
+
+
+@dataclass
+class Job:
+    """
+    Dataclass for storing the status of an export job.
+    """
+    id: str
+    experiment: str
+    key: Optional[str] = None  # content hash of the inputs, computed once the job starts
+    state: str = 'queued'  # 'queued', 'running', 'done' or 'failed'
+    cached: bool = False  # whether the result was already there
+    sheets_done: int = 0
+    sheets_total: int = 0
+    bytes_done: int = 0
+    bytes_total: int = 0
+    throttled: bool = False
+    created: float = 0
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    path: Optional[str] = None  # path of the result once done
+
+
+class ExportJobs:
+    """
+    Runs combined Excel exports on a small pool of background threads. Results are stored under a
+    hash of the exported files' contents, so exporting unchanged data again returns right away.
+    """
+
+    def __init__(self, root: str = 'experiments', workers: int = 1,
+                 throttle: Callable[[], bool] = lambda: False):
+        """
+        :param root: Directory of the experiments.
+        :param workers: Number of exports run at the same time.
+        :param throttle: Returns whether exports should slow down, checked as they run.
+        """
+        self.root = root
+        self.throttle = throttle
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='export')
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = Lock()
+
+        # File digests by (path, size, mtime), so unchanged files aren't hashed again.
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+    def submit(self, experiment: str) -> Job:
+        """
+        Start exporting an experiment, unless it is already waiting to be exported. The files are
+        hashed by the job itself, so this returns right away.
+
+        :param experiment: Name of the experiment directory.
+        :return: The job.
+        """
+        with self._lock:
+            # Reuse a job that hasn't started yet, it will export the same data.
+            for job in self._jobs.values():
+                if job.experiment == experiment and job.state == 'queued':
+                    return job
+
+            job = Job(id=uuid.uuid4().hex, experiment=experiment, created=time.time())
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+
+        self._pool.submit(self._run, job, os.path.join(self.root, experiment))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        :return: The job with the given ID, None if there is none.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        """
+        :return: The most recent jobs, oldest first.
+        """
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self) -> None:
+        """
+        Wait for the running exports to finish, and cancel the queued ones.
+        """
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def content_key(self, target_dir: str) -> str:
+        """
+        :return: Hash of the contents of the files an export of the directory reads.
+        """
+        names = ['metadata.json', 'temperatures.csv'] + [f.name for f in find_sweep_files(target_dir)]
+        h = hashlib.sha256(f'v{EXPORT_VERSION}'.encode('utf-8'))
+        for name in names:
+            h.update(name.encode('utf-8'))
+            h.update(self._digest(os.path.join(target_dir, name)).encode('utf-8'))
+        return h.hexdigest()
+
+    def _digest(self, path: str) -> str:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return ''
+        memo = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(memo)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            with self._lock:
+                self._digests[memo] = digest
+        return digest
+
+    def _run(self, job: Job, target_dir: str) -> None:
+        job.state = 'running'
+        try:
+            key = self.content_key(target_dir)
+        except Exception as e:
+            logging.exception(f'Unable to read the files of {job.experiment}.')
+            job.error = str(e)
+            job.state = 'failed'
+            job.finished = time.time()
+            return
+        path = os.path.join(target_dir, 'exports', f'combined_{key[:16]}.xlsx')
+
+        with self._lock:
+            job.key = key
+            # Reuse the result of an earlier export of the same data.
+            if os.path.exists(path):
+                job.cached = True
+                job.path = path
+                job.state = 'done'
+                job.finished = time.time()
+                return
+
+        throttled = self.throttle()
+        job.throttled = throttled
+        start = time.monotonic()
+
+        def progress(done: int, total: int, done_bytes: int, total_bytes: int):
+            job.sheets_done, job.sheets_total = done, total
+            job.bytes_done, job.bytes_total = done_bytes, total_bytes
+
+            # Keep the read rate down while data is being collected, so the export doesn't
+            # compete with it for the disk.
+            job.throttled = self.throttle()
+            if job.throttled:
+                ahead = done_bytes / THROTTLED_RATE - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so a failed export is never mistaken for a result.
+            tmp = path.removesuffix('.xlsx') + '.tmp.xlsx'
+            export(target_dir, tmp, workers=THROTTLED_WORKERS if throttled else None,
+                   progress=progress, low_priority=throttled)
+            os.replace(tmp, path)
+            job.path = path
+            job.state = 'done'
+        except Exception as e:
+            logging.exception(f'Export of {job.experiment} failed.')
+            job.error = str(e)
+            job.state = 'failed'
+        finally:
+            job.finished = time.time()
@@ -2,10 +2,17 @@
 Main module for running the application.
 """
 
+import argparse
 from http.server import ThreadingHTTPServer
 
 from app_thread import AppThread
+from async_server import AsyncServer
 from handler import build_response_handler
+from tracing import TRACER
+
+
+# Address the server listens on.
+SERVER_ADDRESS = ('', 4951)
 
 
 def run_server(server_class, handler_class) -> None:
@@ -14,8 +21,7 @@ def run_server(server_class, handler_class) -> None:
     :param server_class: Type of server to run.
     :param handler_class: HTTP response handler.
     """
-    server_address = ('', 4951)
-    httpd = server_class(server_address, handler_class)
+    httpd = server_class(SERVER_ADDRESS, handler_class)
     httpd.serve_forever()
 
 
@@ -23,10 +29,23 @@ def main():
     """
     Main function.
     """
+    parser = argparse.ArgumentParser(description='Run the CryoInterface server.')
+    parser.add_argument('--async-server', action='store_true',
+                        help='serve on a single asyncio event loop instead of a thread per connection')
+    parser.add_argument('--trace', action='store_true',
+                        help='record spans of the acquisition from startup, dumped with /api/trace')
+    args = parser.parse_args()
+
     app_thread = AppThread()
+    app_thread.config.tracing = TRACER.enabled = args.trace
+    # Pick up experiments that were added or deleted while the server wasn't running.
+    app_thread.catalog.sync()
     app_thread.start()
     try:
-        run_server(ThreadingHTTPServer, build_response_handler(app_thread))
+        if args.async_server:
+            AsyncServer(app_thread, build_response_handler(app_thread)).serve_forever(SERVER_ADDRESS)
+        else:
+            run_server(ThreadingHTTPServer, build_response_handler(app_thread))
     except:
         # If the server runs raises an exception, stop the app thread.
         app_thread.stop()
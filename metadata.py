@@ -2,8 +2,21 @@
 Module for the Metadata class.
 """
 
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+import re
+from typing import Dict, List, Optional
+
+
+# Ids of the instruments an experiment can declare: VNAs and thermocouple channels, numbered from 1.
+INSTRUMENT_ID = re.compile(r'(vna|temp)([1-9][0-9]*)')
+
+
+def instrument_key(instrument_id: str):
+    """
+    Sort key putting instrument ids in numeric order, such as vna2 before vna10.
+    """
+    match = INSTRUMENT_ID.fullmatch(instrument_id)
+    return (match.group(1), int(match.group(2))) if match else (instrument_id, 0)
 
 
 @dataclass
@@ -21,3 +34,28 @@ class Metadata:
     vna2: Optional[str]
     vna1_temp: Optional[str]
     vna2_temp: Optional[str]
+    # Instruments besides the ones above, by id such as 'vna3' or 'temp5', each with a 'label' and,
+    # for VNAs, the 'temp' sensor its sweeps are matched with.
+    instruments: Dict[str, Dict[str, Optional[str]]] = field(default_factory=dict)
+
+    def vnas(self) -> Dict[str, Optional[str]]:
+        """
+        :return: The temperature sensor of each VNA used by the experiment, by VNA id.
+        """
+        vnas = {}
+        if self.vna1 is not None:
+            vnas['vna1'] = self.vna1_temp
+        if self.vna2 is not None:
+            vnas['vna2'] = self.vna2_temp
+        for instrument_id, spec in self.instruments.items():
+            if instrument_id.startswith('vna'):
+                vnas[instrument_id] = spec.get('temp')
+        return dict(sorted(vnas.items(), key=lambda item: instrument_key(item[0])))
+
+    def sensors(self) -> List[str]:
+        """
+        :return: Ids of the temperature sensors used by the experiment.
+        """
+        sensors = [s for s, label in [('temp1', self.temp1), ('temp2', self.temp2)] if label is not None]
+        sensors += [i for i in self.instruments if i.startswith('temp')]
+        return sorted(sensors, key=instrument_key)
@@ -0,0 +1,261 @@
+"""
+Module for the counters, gauges and histograms served at /metrics in the Prometheus text format.
+
+Metrics are defined at module level next to the code that updates them and registered in REGISTRY.
+Updating a metric only takes an uncontended lock of its own, and histograms have fixed buckets, so
+they can be updated from the acquisition path.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import math
+from threading import Lock
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# Content type of the Prometheus text format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the histogram buckets in seconds, from a fast HTTP request to a slow sweep.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Registry:
+    """
+    Metrics to be served at /metrics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, 'Metric'] = {}
+        self._lock = Lock()
+
+    def register(self, metric: 'Metric') -> None:
+        """
+        :raises ValueError: If a metric with the same name is already registered.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered.')
+            self._metrics[metric.name] = metric
+
+    def metrics(self) -> List['Metric']:
+        with self._lock:
+            return list(self._metrics.values())
+
+
+# Registry of the metrics defined by the application.
+REGISTRY = Registry()
+
+
+class Value:
+    """
+    Value of a counter or gauge with one set of label values.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        yield f'{name}{labels} {format_value(self.value)}\n'
+
+
+class HistogramValue:
+    """
+    Histogram of the observations with one set of label values.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+
+        # Observations in each bucket, not cumulative, the last one being +Inf.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """
+        Observe the seconds taken by the with block, unless it raises.
+        """
+        start = time.perf_counter()
+        yield
+        self.observe(time.perf_counter() - start)
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        # The bucket label goes after the metric's own labels.
+        prefix = labels[:-1] + ',' if labels else '{'
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + [math.inf], counts):
+            cumulative += count
+            yield f'{name}_bucket{prefix}le="{format_value(bound)}"}} {cumulative}\n'
+        yield f'{name}_sum{labels} {format_value(total)}\n'
+        yield f'{name}_count{labels} {cumulative}\n'
+
+
+class Metric:
+    """
+    Metric with a value for each combination of label values. A metric without labels is updated
+    directly, one with labels through labels().
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        """
+        :param name: Name of the metric, such as 'cryo_cycles_total'.
+        :param documentation: Help text of the metric.
+        :param labelnames: Names of the labels.
+        :param registry: Registry to add the metric to, None to not register it.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values) -> object:
+        """
+        :return: The value for the label values, in the order of the label names.
+        """
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} has labels {self.labelnames}, got {values}.')
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {escape_help(self.documentation)}\n'
+        yield f'# TYPE {self.name} {self.type}\n'
+        for values, child in list(self._children.items()):
+            labels = ','.join(f'{k}="{escape_label(v)}"' for k, v in zip(self.labelnames, values))
+            yield from child.samples(self.name, f'{{{labels}}}' if labels else '')
+
+
+class Counter(Metric):
+    """
+    Value that only goes up, such as a number of errors.
+    """
+
+    type = 'counter'
+
+    def _new_child(self) -> Value:
+        return Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, such as a queue depth.
+    """
+
+    type = 'gauge'
+
+    def _new_child(self) -> Value:
+        return Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observations, such as latencies, counted in fixed buckets.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        """
+        :param buckets: Upper bounds of the buckets, in increasing order, without +Inf.
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+def gauge(name: str, documentation: str, value: float) -> Gauge:
+    """
+    Build an unregistered gauge holding a value read when serving /metrics.
+    """
+    g = Gauge(name, documentation, registry=None)
+    g.set(value)
+    return g
+
+
+def counter(name: str, documentation: str, value: float) -> Counter:
+    """
+    Build an unregistered counter holding a total read when serving /metrics.
+    """
+    c = Counter(name, documentation, registry=None)
+    c.inc(value)
+    return c
+
+
+def render(metrics: Iterable[Metric]) -> bytes:
+    """
+    :return: The metrics in the Prometheus text format.
+    """
+    return ''.join(line for metric in metrics for line in metric.render()).encode('utf-8')
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def escape_help(s: str) -> str:
+    return s.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def escape_label(s: str) -> str:
+    return s.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
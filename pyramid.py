@@ -0,0 +1,232 @@
+"""
+Module for the Pyramid class, a multi-resolution min/max summary of the temperatures in an
+experiment store.
+
+Level 0 is the temperature table itself. Each row of level k + 1 summarizes FANOUT consecutive rows
+of level k with the first and last time, and the minimum and maximum of each sensor along with when
+they occurred. A time range can then be plotted from the coarsest level that still has enough rows,
+reading a number of rows bounded by the number of points wanted rather than by the length of the
+experiment.
+"""
+
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from downsample import minmax
+from table import Table
+
+
+# Rows of a level summarized by each row of the level above.
+FANOUT = 8
+
+# Temperature sensors, as named in the temperature table.
+SENSORS = ('temp1', 'temp2')
+
+# Columns of the levels above 0.
+BUCKET_COLUMNS = {name: ('<f8', ()) for name in
+                  ['time', 'end'] + [f'{x}_{s}' for s in SENSORS for x in ('min', 'max', 'tmin', 'tmax')]}
+
+
+def as_buckets(rows: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Turn temperature samples into buckets of a single sample.
+
+    :param rows: Arrays of the temperature table's columns.
+    """
+    buckets = {'time': rows['time'], 'end': rows['time']}
+    for s in SENSORS:
+        buckets[f'min_{s}'] = buckets[f'max_{s}'] = rows[s]
+        buckets[f'tmin_{s}'] = buckets[f'tmax_{s}'] = rows['time']
+    return buckets
+
+
+def aggregate(buckets: Dict[str, np.ndarray], fanout: int) -> Dict[str, np.ndarray]:
+    """
+    Summarize each group of fanout consecutive buckets into one bucket.
+
+    :param buckets: Bucket columns, with a multiple of fanout rows.
+    """
+    groups = {column: values.reshape(-1, fanout) for column, values in buckets.items()}
+    rows = np.arange(len(groups['time']))
+    out = {'time': groups['time'][:, 0], 'end': groups['end'][:, -1]}
+    for s in SENSORS:
+        # Missing values are never picked, unless the whole group is missing.
+        low = np.where(np.isnan(groups[f'min_{s}']), np.inf, groups[f'min_{s}'])
+        high = np.where(np.isnan(groups[f'max_{s}']), -np.inf, groups[f'max_{s}'])
+        i_low = np.argmin(low, axis=1)
+        i_high = np.argmax(high, axis=1)
+        out[f'min_{s}'] = groups[f'min_{s}'][rows, i_low]
+        out[f'max_{s}'] = groups[f'max_{s}'][rows, i_high]
+        out[f'tmin_{s}'] = groups[f'tmin_{s}'][rows, i_low]
+        out[f'tmax_{s}'] = groups[f'tmax_{s}'][rows, i_high]
+    return out
+
+
+def to_samples(buckets: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Turn buckets into plottable samples: one at the start and one at the end of each bucket, each
+    sensor's extremes in the order they occurred. Buckets of a single sample give one sample.
+
+    :return: Array of shape (3, n) with the time and temperatures, as returned by TimeSeries.
+    """
+    n = len(buckets['time'])
+    samples = np.empty((1 + len(SENSORS), 2 * n))
+    samples[0, 0::2] = buckets['time']
+    samples[0, 1::2] = buckets['end']
+    for i, s in enumerate(SENSORS, 1):
+        min_first = buckets[f'tmin_{s}'] <= buckets[f'tmax_{s}']
+        samples[i, 0::2] = np.where(min_first, buckets[f'min_{s}'], buckets[f'max_{s}'])
+        samples[i, 1::2] = np.where(min_first, buckets[f'max_{s}'], buckets[f'min_{s}'])
+    single = np.repeat(buckets['time'] == buckets['end'], 2)
+    single[0::2] = False
+    return samples[:, ~single]
+
+
+def concat(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {column: np.concatenate([p[column] for p in parts]) for column in parts[0]}
+
+
+def after(t: float) -> float:
+    """
+    :return: The smallest time greater than t.
+    """
+    return float(np.nextafter(t, np.inf))
+
+
+class Pyramid:
+    """
+    Min/max summary levels of a temperature table, built incrementally as samples are appended.
+    Only the rows that don't yet make up a whole bucket of the next level are kept in memory.
+    """
+
+    def __init__(self, directory: str, base: Table, fanout: int = FANOUT):
+        """
+        :param directory: Directory of the store.
+        :param base: Temperature table.
+        :param fanout: Rows of a level per row of the level above, for new pyramids.
+        """
+        self.directory = directory
+        self.base = base
+        self.fanout = fanout
+        self._lock = Lock()
+
+        # Tables of levels 1 and up.
+        self.levels: List[Table] = []
+        while True:
+            try:
+                self.levels.append(Table(directory, self._name(len(self.levels) + 1)))
+            except FileNotFoundError:
+                break
+
+        # Rows of each level not yet summarized by the level above, as buckets.
+        self._pending: List[Optional[Dict[str, np.ndarray]]] = [None] * (len(self.levels) + 1)
+
+        # Pick up the rows appended since the levels were last updated, from the top down so
+        # rows summarized while catching up aren't read again.
+        for level in range(len(self.levels), -1, -1):
+            self._push(level, self._tail(level))
+
+    @staticmethod
+    def _name(level: int) -> str:
+        return f'temperatures_L{level}'
+
+    def _table(self, level: int) -> Table:
+        if level == 0:
+            return self.base
+        while len(self.levels) < level:
+            self.levels.append(Table(self.directory, self._name(len(self.levels) + 1), BUCKET_COLUMNS))
+            self._pending.append(None)
+        return self.levels[level - 1]
+
+    def _read(self, level: int, start: Optional[float], end: Optional[float]) -> Dict[str, np.ndarray]:
+        rows = self._table(level).read(start, end)
+        return as_buckets(rows) if level == 0 else rows
+
+    def _tail(self, level: int) -> Optional[Dict[str, np.ndarray]]:
+        """
+        :return: Rows of the level after the last bucket of the level above.
+        """
+        start = None
+        if level < len(self.levels):
+            segments = self.levels[level].index['segments']
+            if segments and segments[-1]['rows']:
+                last = self.levels[level].read(segments[-1]['end'])
+                start = after(float(last['end'][-1]))
+        rows = self._read(level, start, None)
+        return rows if len(rows['time']) else None
+
+    def _push(self, level: int, rows: Optional[Dict[str, np.ndarray]]) -> None:
+        """
+        Add rows to a level's pending rows, and summarize every whole bucket into the level above.
+        """
+        if rows is None:
+            return
+        if self._pending[level] is not None:
+            rows = concat([self._pending[level], rows])
+        whole = len(rows['time']) // self.fanout * self.fanout
+        rest = {column: values[whole:].copy() for column, values in rows.items()}
+        self._pending[level] = rest if len(rest['time']) else None
+        if whole:
+            summary = aggregate({column: values[:whole] for column, values in rows.items()}, self.fanout)
+            self._table(level + 1).extend(summary)
+            self._push(level + 1, summary)
+
+    def extend(self, rows: Dict[str, np.ndarray]) -> None:
+        """
+        Update the levels with samples just appended to the temperature table.
+
+        :param rows: Arrays of the temperature table's columns.
+        """
+        with self._lock:
+            self._push(0, as_buckets({column: np.asarray(values, dtype=np.float64)
+                                      for column, values in rows.items()}))
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              max_points: int = 2000) -> Tuple[np.ndarray, int]:
+        """
+        Read the temperatures with start <= time < end, downsampled to at most max_points samples.
+
+        :return: Array of shape (3, n) with the time and temperatures, as returned by TimeSeries,
+        and the level the samples were read from.
+        """
+        with self._lock:
+            top = len(self.levels)
+
+        # The finest level with at most max_points rows in the range.
+        level = 0
+        while level < top and self._table(level).count(start, end) > max_points:
+            level += 1
+
+        parts: List[Dict[str, np.ndarray]] = []
+        self._collect(level, start, end, parts)
+        if not parts:
+            return np.empty((1 + len(SENSORS), 0)), level
+        return minmax(to_samples(concat(parts)), max_points), level
+
+    def _collect(self, level: int, start: Optional[float], end: Optional[float],
+                 parts: List[Dict[str, np.ndarray]]) -> None:
+        """
+        Gather the buckets covering start <= time < end from a level, filling in the parts of the
+        range not covered by whole buckets from the levels below.
+        """
+        if start is not None and end is not None and start >= end:
+            return
+
+        rows = self._read(level, start, end)
+        if level > 0 and end is not None:
+            # Only buckets that end within the range.
+            inside = rows['end'] < end
+            rows = {column: values[inside] for column, values in rows.items()}
+
+        if level == 0 or len(rows['time']) == 0:
+            if level > 0:
+                self._collect(level - 1, start, end, parts)
+            elif len(rows['time']):
+                parts.append(rows)
+            return
+
+        self._collect(level - 1, start, float(rows['time'][0]), parts)
+        parts.append(rows)
+        self._collect(level - 1, after(float(rows['end'][-1])), end, parts)
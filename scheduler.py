@@ -0,0 +1,139 @@
+"""
+Module for the Scheduler class.
+"""
+
+from dataclasses import dataclass
+from threading import Condition
+import time
+from typing import Dict, List, Optional
+
+
+@dataclass
+class CycleStats:
+    """
+    Dataclass for storing timing statistics of the acquisition cycles.
+    """
+    cycles: int = 0  # number of cycles run
+    overruns: int = 0  # cycles that took longer than the period
+    missed: int = 0  # deadlines skipped because a cycle overran
+    last_jitter: float = 0.0  # seconds between the deadline and the start of the last cycle
+    max_jitter: float = 0.0
+    mean_jitter: float = 0.0
+    last_duration: float = 0.0  # seconds the last cycle took
+    max_duration: float = 0.0
+
+
+class Scheduler:
+    """
+    Waits on monotonic deadlines instead of polling, and wakes up early when signaled.
+    """
+
+    def __init__(self):
+        # Condition used to sleep until the next deadline or until woken up.
+        self._cond = Condition()
+
+        # Whether wake() was called since the last wait().
+        self._signaled = False
+
+        # Deadlines by name, in time.monotonic() seconds.
+        self._deadlines: Dict[str, float] = {}
+
+        # Timing statistics of the acquisition cycles.
+        self.stats = CycleStats()
+
+    def schedule(self, name: str, deadline: float) -> None:
+        """
+        Set the deadline of a task.
+
+        :param name: Name of the task.
+        :param deadline: Time (from time.monotonic()) the task is next due.
+        """
+        with self._cond:
+            self._deadlines[name] = deadline
+            self._cond.notify_all()
+
+    def cancel(self, name: str) -> None:
+        """
+        Remove the deadline of a task.
+
+        :param name: Name of the task.
+        """
+        with self._cond:
+            self._deadlines.pop(name, None)
+
+    def deadline(self, name: str) -> Optional[float]:
+        """
+        :return: The deadline of the task, None if it is not scheduled.
+        """
+        with self._cond:
+            return self._deadlines.get(name)
+
+    def due(self, now: float) -> List[str]:
+        """
+        :return: Names of the tasks whose deadline has passed.
+        """
+        with self._cond:
+            return [name for name, deadline in self._deadlines.items() if deadline <= now]
+
+    def wake(self) -> None:
+        """
+        Wake up the thread blocked in wait().
+        """
+        with self._cond:
+            self._signaled = True
+            self._cond.notify_all()
+
+    def wait(self) -> None:
+        """
+        Block until the earliest deadline passes or wake() is called.
+        """
+        with self._cond:
+            while not self._signaled:
+                now = time.monotonic()
+                if self._deadlines:
+                    timeout = min(self._deadlines.values()) - now
+                    if timeout <= 0:
+                        break
+                else:
+                    timeout = None
+                self._cond.wait(timeout)
+            self._signaled = False
+
+    def next_deadline(self, deadline: float, period: float, now: float) -> float:
+        """
+        Compute the deadline following the given one without drifting. Deadlines that already
+        passed are skipped and counted as missed.
+
+        :param deadline: Deadline of the cycle that just ran.
+        :param period: Period of the cycle in seconds.
+        :param now: Current time (from time.monotonic()).
+        :return: The next deadline.
+        """
+        deadline += period
+        if period > 0 and deadline <= now:
+            missed = int((now - deadline) // period) + 1
+            self.stats.missed += missed
+            deadline += missed * period
+        return deadline
+
+    def record_cycle(self, deadline: float, started: float, finished: float, period: float) -> None:
+        """
+        Update the cycle statistics.
+
+        :param deadline: Time the cycle was scheduled to start.
+        :param started: Time the cycle actually started.
+        :param finished: Time the cycle finished.
+        :param period: Period of the cycle in seconds.
+        """
+        stats = self.stats
+        jitter = max(started - deadline, 0.0)
+        duration = finished - started
+
+        stats.cycles += 1
+        stats.last_jitter = jitter
+        stats.max_jitter = max(stats.max_jitter, jitter)
+        stats.mean_jitter += (jitter - stats.mean_jitter) / stats.cycles
+        stats.last_duration = duration
+        stats.max_duration = max(stats.max_duration, duration)
+        if duration > period:
+            stats.overruns += 1
@@ -0,0 +1,127 @@
+"""
+Module for the StaticAssets class.
+"""
+
+from dataclasses import dataclass, field
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Files whose name changes with their contents, so browsers can keep them for good.
+IMMUTABLE = {'plotly-2.19.1.min.js'}
+
+# Content types that are worth compressing.
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+@dataclass
+class Asset:
+    """
+    Dataclass for storing a static file and its precompressed variants.
+    """
+    content_type: str
+    cache_control: str
+    etag: str  # quoted strong ETag of the uncompressed file
+    variants: Dict[str, bytes] = field(default_factory=dict)  # contents by content coding
+
+    def select(self, accept_encoding: Optional[str]):
+        """
+        Pick the smallest variant the client accepts.
+
+        :param accept_encoding: Value of the request's Accept-Encoding header.
+        :return: Content coding ('identity' for none), contents and ETag of the variant.
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        coding = 'identity'
+        for candidate in ['br', 'gzip']:
+            if candidate in self.variants and candidate in accepted:
+                coding = candidate
+                break
+        etag = self.etag if coding == 'identity' else f'{self.etag[:-1]}-{coding}"'
+        return coding, self.variants[coding], etag
+
+
+def parse_accept_encoding(header: Optional[str]) -> List[str]:
+    """
+    :return: Content codings accepted by the client (those without q=0), '*' stands for all.
+    """
+    accepted = []
+    for item in (header or '').split(','):
+        coding, *params = [x.strip() for x in item.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+        if coding and q > 0:
+            accepted.append(coding.lower())
+    if '*' in accepted:
+        accepted.extend(['br', 'gzip'])
+    return accepted
+
+
+class StaticAssets:
+    """
+    Loads the files of a directory into memory once, with gzip (and brotli, if installed) variants
+    of the text files, so they can be served without touching the disk.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory of the files to serve.
+        """
+        self.assets: Dict[str, Asset] = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    self.assets[name] = self._build(name, f.read())
+
+    def get(self, name: str) -> Optional[Asset]:
+        """
+        :return: The asset with the given file name, None if there is none.
+        """
+        return self.assets.get(name)
+
+    def _build(self, name: str, data: bytes) -> Asset:
+        content_type = guess_content_type(name)
+        if name in IMMUTABLE:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            # The name stays the same when the file changes, so check with the ETag every time.
+            cache_control = 'no-cache'
+
+        asset = Asset(content_type=content_type,
+                      cache_control=cache_control,
+                      etag=f'"{hashlib.sha256(data).hexdigest()[:32]}"')
+        asset.variants['identity'] = data
+
+        if content_type.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                asset.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data)
+                if len(compressed) < len(data):
+                    asset.variants['br'] = compressed
+        return asset
+
+
+def guess_content_type(name: str) -> str:
+    """
+    :return: Content type of the file based on its name.
+    """
+    if name.endswith('.js'):
+        return 'application/javascript'
+    content_type, _ = mimetypes.guess_type(name)
+    return content_type or 'application/octet-stream'
@@ -0,0 +1,219 @@
+"""
+Module for the ExperimentStore class, an append-only binary store for experiment data.
+
+The temperatures and the sweeps of each VNA are kept in tables (see table.py), which can be read
+back as memory-mapped NumPy arrays.
+"""
+
+import argparse
+import os
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from align import TemperatureIndex
+from metadata import instrument_key
+from pyramid import Pyramid
+from sweep import Sweep
+from table import Table
+from utils import timestamp_name
+
+
+# Rows per sweep segment file, sweeps are much larger than temperature samples.
+SWEEP_SEGMENT_ROWS = 256
+
+# Columns of the temperature table.
+TEMPERATURE_COLUMNS = {
+    'time': ('<f8', ()),
+    'temp1': ('<f8', ()),
+    'temp2': ('<f8', ()),
+}
+
+
+def sweep_columns(points: int) -> Dict[str, Tuple[str, Tuple[int, ...]]]:
+    """
+    :return: Columns of a sweep table with the given number of points per sweep.
+    """
+    return {
+        'time': ('<f8', ()),
+        'freq': ('<f8', (points,)),
+        'formatted': ('<f8', (points,)),
+        'sparams': ('<c16', (4, points)),
+    }
+
+
+class ExperimentStore:
+    """
+    Stores the temperature samples and VNA sweeps of an experiment in binary tables.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory of the store, created if it doesn't exist.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.temperatures = Table(directory, 'temperatures', TEMPERATURE_COLUMNS)
+        self.pyramid = Pyramid(directory, self.temperatures)
+        self._sweeps: Dict[str, Table] = {}
+        self._lock = Lock()
+
+    def append_temperature(self, t: float, temp1: float, temp2: float) -> None:
+        """
+        Append a temperature sample.
+        """
+        self.extend_temperatures({'time': [t], 'temp1': [temp1], 'temp2': [temp2]})
+
+    def extend_temperatures(self, rows: Dict[str, np.ndarray]) -> None:
+        """
+        Append temperature samples, in time order.
+
+        :param rows: Arrays of the time, temp1 and temp2 columns.
+        """
+        with self._lock:
+            self.temperatures.extend(rows)
+            self.pyramid.extend(rows)
+
+    def import_temperatures(self, path: str) -> None:
+        """
+        Fill an empty temperature table from a temperatures.csv file, for experiments recorded
+        before the store existed.
+        """
+        index = TemperatureIndex.from_csv(path)
+        if len(index) == 0:
+            # Nothing was recorded, the experiment has an empty series.
+            return
+        # Older files may hold a single sensor.
+        temps = np.hstack([index.temps, np.full((len(index), 2), np.nan)])
+        self.extend_temperatures({'time': index.times, 'temp1': temps[:, 0], 'temp2': temps[:, 1]})
+        # Filled in one go, so write the indexes now.
+        self.close()
+
+    def query_temperatures(self, start: Optional[float] = None, end: Optional[float] = None,
+                           max_points: int = 2000) -> Tuple[np.ndarray, int]:
+        """
+        Read the temperatures with start <= time < end, downsampled to at most max_points samples
+        from the coarsest summary level that has enough of them.
+
+        :return: Array of shape (3, n) with the time and temperatures, and the level read from.
+        """
+        return self.pyramid.query(start, end, max_points)
+
+    def append_sweep(self, vna: str, t: float, sweep: Sweep) -> None:
+        """
+        Append a sweep.
+
+        :param vna: Name of the VNA, such as 'vna1'.
+        :param t: Timestamp of the sweep.
+        """
+        table = self.sweep_table(vna, len(sweep.freq), create=True)
+        table.append({'time': t, 'freq': sweep.freq, 'formatted': sweep.formatted, 'sparams': sweep.sparams})
+
+    def sweep_table(self, vna: str, points: int, create: bool = False) -> Optional[Table]:
+        """
+        :return: The table of the VNA's sweeps with the given number of points, None if there is none.
+        """
+        name = f'sweeps_{vna}_{points}'
+        with self._lock:
+            if name not in self._sweeps:
+                exists = os.path.exists(os.path.join(self.directory, f'{name}.index.json'))
+                if not exists and not create:
+                    return None
+                self._sweeps[name] = Table(self.directory, name, sweep_columns(points), SWEEP_SEGMENT_ROWS)
+            return self._sweeps[name]
+
+    def sweep_tables(self, vna: str) -> List[Table]:
+        """
+        :return: Tables of the VNA's sweeps, one per number of points.
+        """
+        prefix = f'sweeps_{vna}_'
+        suffix = '.index.json'
+        tables = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(prefix) and name.endswith(suffix):
+                tables.append(self.sweep_table(vna, int(name[len(prefix):-len(suffix)])))
+        return tables
+
+    def vnas(self) -> List[str]:
+        """
+        :return: Ids of the VNAs with sweeps in the store, such as 'vna1'.
+        """
+        vnas = set()
+        for name in os.listdir(self.directory):
+            if name.startswith('sweeps_') and name.endswith('.index.json'):
+                vnas.add(name.removeprefix('sweeps_').rsplit('_', 1)[0])
+        return sorted(vnas, key=instrument_key)
+
+    def flush(self) -> None:
+        """
+        Write the index of every table, so that the data appended so far is found when the store
+        is reopened.
+        """
+        for table in self._tables():
+            table.flush()
+
+    def close(self) -> None:
+        """
+        Write the index of every table and close their files.
+        """
+        for table in self._tables():
+            table.close()
+
+    def _tables(self) -> List[Table]:
+        with self._lock:
+            return [self.temperatures, *self.pyramid.levels, *self._sweeps.values()]
+
+    def read_temperatures(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        :return: Temperature samples with start <= time < end, arrays by column name.
+        """
+        return self.temperatures.read(start, end)
+
+    def iter_sweeps(self, vna: str, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Tuple[float, Sweep]]:
+        """
+        :return: Iterator of (timestamp, sweep) for the VNA's sweeps with start <= time < end.
+        """
+        for table in self.sweep_tables(vna):
+            for segment in table.segments(start, end):
+                for i in range(len(segment['time'])):
+                    yield float(segment['time'][i]), Sweep(freq=segment['freq'][i],
+                                                           formatted=segment['formatted'][i],
+                                                           sparams=segment['sparams'][i])
+
+    def export_legacy(self, target_dir: str) -> None:
+        """
+        Write the data in the directory layout used before the store: temperatures.csv plus a
+        {timestamp}_vnaN.csv and .s2p file per sweep.
+
+        :param target_dir: Directory to write to.
+        """
+        os.makedirs(target_dir, exist_ok=True)
+
+        temps = self.read_temperatures()
+        with open(os.path.join(target_dir, 'temperatures.csv'), 'w', encoding='utf-8') as wf:
+            for t, temp1, temp2 in zip(temps['time'].tolist(), temps['temp1'].tolist(), temps['temp2'].tolist()):
+                wf.write(f'{t},{temp1},{temp2}\n')
+
+        for vna in self.vnas():
+            for t, sweep in self.iter_sweeps(vna):
+                name = timestamp_name(t)
+                sweep.write_csv(os.path.join(target_dir, f'{name}_{vna}.csv'))
+                sweep.write_s2p(os.path.join(target_dir, f'{name}_{vna}.s2p'))
+
+
+def main():
+    """
+    Export a store to the legacy CSV/S2P layout.
+    """
+    parser = argparse.ArgumentParser(description='Export an experiment store to CSV and S2P files.')
+    parser.add_argument('store', help='directory of the store, such as experiments/<experiment>/store')
+    parser.add_argument('target', help='directory to write the files to')
+    args = parser.parse_args()
+
+    ExperimentStore(args.store).export_legacy(args.target)
+    print('Done!')
+
+
+if __name__ == '__main__':
+    main()
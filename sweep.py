@@ -0,0 +1,50 @@
+"""
+Module for the Sweep class.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Sweep:
+    """
+    Dataclass for storing a sweep transferred from a VNA in binary.
+    """
+    freq: np.ndarray  # frequencies in Hz, shape (points,)
+    formatted: np.ndarray  # formatted data of the active trace, shape (points,)
+    sparams: np.ndarray  # complex S11, S21, S12, S22, shape (4, points)
+
+    @property
+    def nbytes(self) -> int:
+        return self.freq.nbytes + self.formatted.nbytes + self.sparams.nbytes
+
+    def write_csv(self, fpath: str) -> None:
+        """
+        Write the formatted data in the layout of the VNA's MMEM:STOR:FDAT .csv files.
+
+        :param fpath: Path of the file to write.
+        """
+        with open(fpath, 'w', encoding='utf-8') as wf:
+            wf.write('!CSV A.01.01\n')
+            wf.write('BEGIN CH1_DATA\n')
+            wf.write('Freq(Hz),Formatted Data\n')
+            np.savetxt(wf, np.column_stack((self.freq, self.formatted)), fmt='%.12g', delimiter=',')
+            wf.write('END\n')
+
+    def write_s2p(self, fpath: str) -> None:
+        """
+        Write the S-parameters as a Touchstone .s2p file in real/imaginary format.
+
+        :param fpath: Path of the file to write.
+        """
+        # Touchstone orders the columns S11, S21, S12, S22 as real/imaginary pairs.
+        columns = [self.freq]
+        for s in self.sparams:
+            columns.extend((s.real, s.imag))
+
+        with open(fpath, 'w', encoding='utf-8') as wf:
+            wf.write('!Created by CryoInterface\n')
+            wf.write('# Hz S RI R 50\n')
+            np.savetxt(wf, np.column_stack(columns), fmt='%.12g', delimiter=' ')
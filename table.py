@@ -0,0 +1,244 @@
+"""
+Module for the Table class, an append-only table stored in columnar segment files.
+
+Each table is a set of segment files holding a fixed number of rows. Within a segment every column
+is stored contiguously, so a column of a segment can be memory-mapped as a NumPy array without
+copying. A small JSON index per table records the columns, and the number of rows and time span of
+each segment. The segment being appended to is kept open, and the index is only rewritten when a
+segment fills up or on flush() and close().
+"""
+
+import json
+import os
+from threading import Lock
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# Rows per segment file.
+SEGMENT_ROWS = 4096
+
+
+class Table:
+    """
+    Append-only table of fixed-size rows stored in columnar segment files.
+    """
+
+    def __init__(self, directory: str, name: str,
+                 columns: Optional[Dict[str, Tuple[str, Tuple[int, ...]]]] = None,
+                 segment_rows: int = SEGMENT_ROWS):
+        """
+        :param directory: Directory of the table's files.
+        :param name: Name of the table.
+        :param columns: Column names mapped to (dtype, shape of a value). Needed to create the
+        table, read from the index if the table exists.
+        :param segment_rows: Rows per segment file, for new tables.
+        """
+        self.directory = directory
+        self.name = name
+        self.index_path = os.path.join(directory, f'{name}.index.json')
+        self._lock = Lock()
+
+        # Segment file being appended to, opened on the first append.
+        self._file: Optional[BinaryIO] = None
+
+        # Whether rows were appended since the index was last written.
+        self._dirty = False
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+        else:
+            if columns is None:
+                raise FileNotFoundError(f'Table {name} does not exist.')
+            self.index = {
+                'columns': {k: [dtype, list(shape)] for k, (dtype, shape) in columns.items()},
+                'segment_rows': segment_rows,
+                'segments': [],
+            }
+
+        # Byte offset of each column within a segment file, and size of a value.
+        self.offsets: Dict[str, int] = {}
+        self.value_bytes: Dict[str, int] = {}
+        offset = 0
+        for column, (dtype, shape) in self.index['columns'].items():
+            self.offsets[column] = offset
+            self.value_bytes[column] = self._row_bytes(dtype, shape)
+            offset += self.index['segment_rows'] * self.value_bytes[column]
+        self.segment_bytes = offset
+
+    @staticmethod
+    def _row_bytes(dtype: str, shape: List[int]) -> int:
+        return np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return sum(s['rows'] for s in self.index['segments'])
+
+    def append(self, row: Dict[str, np.ndarray]) -> None:
+        """
+        Append a row. Rows must be appended in time order.
+
+        :param row: Value of every column.
+        """
+        self.extend({column: np.asarray(value)[None] for column, value in row.items()})
+
+    def extend(self, rows: Dict[str, np.ndarray]) -> None:
+        """
+        Append rows. Rows must be appended in time order.
+
+        :param rows: Values of every column, one row of each array per row.
+        """
+        columns = {}
+        for column, (dtype, shape) in self.index['columns'].items():
+            values = np.asarray(rows[column], dtype=dtype)
+            if values.shape[1:] != tuple(shape):
+                raise ValueError(f'Column {column} expects shape {tuple(shape)}, got {values.shape[1:]}.')
+            columns[column] = values
+        n = len(columns['time'])
+
+        with self._lock:
+            segments = self.index['segments']
+            done = 0
+            rolled = False
+            while done < n:
+                if not segments or segments[-1]['rows'] == self.index['segment_rows']:
+                    self._close_file()
+                    segments.append(self._new_segment(len(segments)))
+                    rolled = True
+                segment = segments[-1]
+                first = segment['rows']
+                count = min(n - done, self.index['segment_rows'] - first)
+
+                f = self._segment_file(segment)
+                for column, values in columns.items():
+                    part = values[done:done + count]
+                    f.seek(self.offsets[column] + first * self.value_bytes[column])
+                    f.write(part.tobytes())
+                # Hand the rows to the OS so that memory maps of the segment see them.
+                f.flush()
+
+                segment['rows'] = first + count
+                if segment['start'] is None:
+                    segment['start'] = float(columns['time'][done])
+                segment['end'] = float(columns['time'][done + count - 1])
+                done += count
+
+            if rolled:
+                self._save_index()
+            elif n:
+                self._dirty = True
+
+    def flush(self) -> None:
+        """
+        Write the index, so that the rows appended so far are found when the table is reopened.
+        """
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def close(self) -> None:
+        """
+        Write the index and close the segment file. Appending again reopens it.
+        """
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+            self._close_file()
+
+    def _segment_file(self, segment: Dict) -> BinaryIO:
+        if self._file is None:
+            self._file = open(os.path.join(self.directory, segment['file']), 'r+b')
+        return self._file
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _new_segment(self, number: int) -> Dict:
+        name = f'{self.name}.{number:06d}.seg'
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            # Reserve the whole segment, the file stays sparse until it is written.
+            f.truncate(self.segment_bytes)
+        return {'file': name, 'rows': 0, 'start': None, 'end': None}
+
+    def _save_index(self) -> None:
+        # Write to a temporary file first so readers never see a partial index.
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+        self._dirty = False
+
+    def segments(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Memory-map the rows with start <= time < end, one segment at a time, without copying.
+
+        :param start: Start of the time range, defaults to the first row.
+        :param end: End of the time range, defaults to the last row.
+        :return: Iterator of read-only arrays by column name, one dictionary per segment.
+        """
+        with self._lock:
+            segments = [dict(s) for s in self.index['segments']]
+
+        for segment in segments:
+            rows = segment['rows']
+            if rows == 0:
+                continue
+            if start is not None and segment['end'] < start:
+                continue
+            if end is not None and segment['start'] >= end:
+                continue
+
+            path = os.path.join(self.directory, segment['file'])
+            columns = {}
+            for column, (dtype, shape) in self.index['columns'].items():
+                columns[column] = np.memmap(path, dtype=dtype, mode='r', offset=self.offsets[column],
+                                            shape=(rows, *shape))
+
+            # Narrow down to the time range.
+            lo = 0 if start is None else int(np.searchsorted(columns['time'], start, side='left'))
+            hi = rows if end is None else int(np.searchsorted(columns['time'], end, side='left'))
+            if lo < hi:
+                yield {column: values[lo:hi] for column, values in columns.items()}
+
+    def count(self, start: Optional[float] = None, end: Optional[float] = None) -> int:
+        """
+        :return: Number of rows with start <= time < end.
+        """
+        with self._lock:
+            segments = [dict(s) for s in self.index['segments']]
+
+        count = 0
+        for segment in segments:
+            rows = segment['rows']
+            if rows == 0:
+                continue
+            if (start is not None and segment['end'] < start) or (end is not None and segment['start'] >= end):
+                continue
+            if (start is None or segment['start'] >= start) and (end is None or segment['end'] < end):
+                # The whole segment is in the range, no need to read it.
+                count += rows
+                continue
+            times = np.memmap(os.path.join(self.directory, segment['file']), dtype='<f8', mode='r',
+                              offset=self.offsets['time'], shape=(rows,))
+            lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+            hi = rows if end is None else int(np.searchsorted(times, end, side='left'))
+            count += max(hi - lo, 0)
+        return count
+
+    def read(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Read the rows with start <= time < end. The arrays are memory-mapped without copying when
+        the rows are in a single segment, and concatenated otherwise.
+
+        :return: Arrays by column name.
+        """
+        parts = list(self.segments(start, end))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return {column: np.empty((0, *shape), dtype=dtype)
+                    for column, (dtype, shape) in self.index['columns'].items()}
+        return {column: np.concatenate([p[column] for p in parts]) for column in parts[0]}
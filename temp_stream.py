@@ -0,0 +1,198 @@
+"""
+Module for the TemperatureStream class.
+"""
+
+import binascii
+from dataclasses import dataclass
+import logging
+import struct
+from threading import Thread
+import time
+from typing import Callable, Optional
+
+import serial
+
+
+# Baud rate the ESP32 starts with.
+USB_BAUD_RATE = 9600
+
+# Baud rate used while the ESP32 streams samples.
+STREAM_BAUD_RATE = 115200
+
+# Frames start with these two bytes.
+SYNC = b'\xa5\x5a'
+
+# Sequence number, device milliseconds, two temperatures and two fault registers.
+SAMPLE = struct.Struct('<IIffBB')
+
+# CRC-16/CCITT-FALSE of the sample.
+CRC = struct.Struct('<H')
+
+FRAME_SIZE = len(SYNC) + SAMPLE.size + CRC.size
+
+
+@dataclass
+class Sample:
+    """
+    Dataclass for storing a temperature sample pushed by the ESP32.
+    """
+    time: float  # host time of the sample, derived from the device clock
+    seq: int  # sequence number assigned by the device
+    device_ms: int  # device clock in milliseconds
+    temp1: float
+    temp2: float
+    fault1: int  # MAX31856 fault register of sensor 1
+    fault2: int  # MAX31856 fault register of sensor 2
+
+
+def decode_frames(buf: bytearray):
+    """
+    Decode the complete frames at the start of the buffer and remove them from it. Bytes that
+    can't start a valid frame are skipped.
+
+    :param buf: Bytes received from the ESP32.
+    :return: Decoded (seq, device_ms, temp1, temp2, fault1, fault2) tuples and the number of
+    frames with a bad CRC.
+    """
+    frames = []
+    bad_crc = 0
+    pos = 0
+    while True:
+        start = buf.find(SYNC, pos)
+        if start < 0:
+            # Keep a trailing first sync byte, the second one may not have arrived yet.
+            pos = len(buf) - 1 if buf.endswith(SYNC[:1]) else len(buf)
+            break
+        if start + FRAME_SIZE > len(buf):
+            pos = start
+            break
+
+        body = bytes(buf[start + len(SYNC):start + len(SYNC) + SAMPLE.size])
+        crc, = CRC.unpack_from(buf, start + len(SYNC) + SAMPLE.size)
+        if binascii.crc_hqx(body, 0xFFFF) == crc:
+            frames.append(SAMPLE.unpack(body))
+            pos = start + FRAME_SIZE
+        else:
+            # Not a real frame (or a corrupted one), look for the next sync bytes.
+            bad_crc += 1
+            pos = start + 1
+    del buf[:pos]
+    return frames, bad_crc
+
+
+class TemperatureStream(Thread):
+    """
+    Thread that puts the ESP32 in streaming mode and decodes the samples it pushes.
+    """
+
+    def __init__(self, con: serial.Serial, period: float, callback: Callable[[Sample], None],
+                 baud_rate: int = STREAM_BAUD_RATE):
+        """
+        :param con: Serial connection to the ESP32.
+        :param period: Seconds between samples.
+        :param callback: Function called with each sample, on this thread.
+        :param baud_rate: Baud rate to switch to while streaming.
+        """
+        super().__init__(daemon=True)
+        self.con = con
+        self.period = period
+        self.callback = callback
+        self.baud_rate = baud_rate
+
+        # Most recent sample.
+        self.latest: Optional[Sample] = None
+
+        # Samples lost, detected by gaps in the sequence numbers.
+        self.lost = 0
+
+        # Frames that failed the CRC check.
+        self.bad_crc = 0
+
+        # Host time minus device time, in seconds, smallest seen so far.
+        self._offset: Optional[float] = None
+
+        # Whether the stream has been stopped.
+        self.killed = False
+
+        # Exception that ended the stream, if any.
+        self.error: Optional[Exception] = None
+
+    def configure(self) -> None:
+        """
+        Ask the ESP32 to start streaming and switch to the streaming baud rate.
+
+        :raises RuntimeError: If the ESP32 doesn't accept the command.
+        """
+        period_ms = max(int(self.period * 1000), 1)
+        self.con.reset_input_buffer()
+        self.con.write(f'STREAM {period_ms} {self.baud_rate}\n'.encode('utf-8'))
+        self.con.flush()
+        reply = self.con.readline().decode('utf-8', errors='replace').strip()
+        if reply != 'OK':
+            raise RuntimeError(f'ESP32 did not start streaming: {reply!r}')
+        self.con.baudrate = self.baud_rate
+
+    def run(self):
+        """
+        Function that is run when the thread is started.
+        """
+        buf = bytearray()
+        last_seq: Optional[int] = None
+        # The device clock wraps around every 2**32 ms (about 49 days).
+        last_ms = 0
+        epoch_ms = 0
+        try:
+            self.configure()
+            while not self.killed:
+                # Block for at least one frame, but take everything that's already there.
+                data = self.con.read(max(self.con.in_waiting, FRAME_SIZE))
+                if not data:
+                    continue
+                buf += data
+                frames, bad_crc = decode_frames(buf)
+                self.bad_crc += bad_crc
+
+                now = time.time()
+                for seq, device_ms, temp1, temp2, fault1, fault2 in frames:
+                    if last_seq is not None and seq > last_seq + 1:
+                        self.lost += seq - last_seq - 1
+                    last_seq = seq
+
+                    if device_ms < last_ms - 2**31:
+                        epoch_ms += 2**32
+                    last_ms = device_ms
+                    device_s = (epoch_ms + device_ms) / 1000
+
+                    # Timestamp with the device clock, offset by the smallest delay seen, so
+                    # serial latency doesn't add jitter.
+                    offset = now - device_s
+                    if self._offset is None or offset < self._offset:
+                        self._offset = offset
+                    sample = Sample(time=self._offset + device_s,
+                                    seq=seq,
+                                    device_ms=device_ms,
+                                    temp1=temp1,
+                                    temp2=temp2,
+                                    fault1=fault1,
+                                    fault2=fault2)
+                    self.latest = sample
+                    self.callback(sample)
+        except Exception as e:
+            if not self.killed:
+                logging.exception('Temperature stream stopped.')
+                self.error = e
+
+    def stop(self) -> None:
+        """
+        Stop the thread and ask the ESP32 to stop streaming.
+        """
+        self.killed = True
+        try:
+            self.con.write(b'STOP\n')
+            self.con.flush()
+            # Wait for the pending read to time out, then discard frames sent before STOP.
+            self.join(self.con.timeout)
+            self.con.baudrate = USB_BAUD_RATE
+            self.con.reset_input_buffer()
+        except:
+            logging.exception('Error stopping the temperature stream.')
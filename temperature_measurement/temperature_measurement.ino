@@ -1,12 +1,72 @@
 #include <Adafruit_MAX31856.h>
 
+// One MAX31856 per channel, add more as wired. GET TEMP replies with every channel.
 std::array<Adafruit_MAX31856, 2> thermocouples = {
   Adafruit_MAX31856(27,14,12,13),
   Adafruit_MAX31856(21,19,18,5),
 };
 
+// Channels pushed in stream frames, the frame layout is fixed.
+const size_t STREAM_CHANNELS = 2;
+
+// Baud rate the host connects at.
+const unsigned long DEFAULT_BAUD = 9600;
+
+// Frames start with these two bytes.
+const uint8_t SYNC0 = 0xA5;
+const uint8_t SYNC1 = 0x5A;
+
+// Frame layout (little-endian) after the sync bytes:
+//   uint32 sequence number
+//   uint32 device time in milliseconds
+//   float32 x2 temperatures of the first two channels
+//   uint8 x2 MAX31856 fault registers
+//   uint16 CRC-16/CCITT-FALSE of the fields above
+struct __attribute__((packed)) Sample {
+  uint32_t seq;
+  uint32_t ms;
+  float temps[STREAM_CHANNELS];
+  uint8_t faults[STREAM_CHANNELS];
+};
+
+// Whether samples are pushed to the host.
+bool streaming = false;
+// Milliseconds between samples while streaming.
+unsigned long period_ms = 1000;
+// Time the next sample is due while streaming.
+unsigned long next_ms = 0;
+// Sequence number of the next sample.
+uint32_t seq = 0;
+
+uint16_t crc16(const uint8_t* data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int j = 0; j < 8; j++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendSample() {
+  Sample sample;
+  sample.seq = seq++;
+  sample.ms = millis();
+  for (size_t i = 0; i < STREAM_CHANNELS; i++) {
+    sample.temps[i] = thermocouples[i].readThermocoupleTemperature();
+    sample.faults[i] = thermocouples[i].readFault();
+  }
+  uint16_t crc = crc16((const uint8_t*)&sample, sizeof(sample));
+
+  Serial.write(SYNC0);
+  Serial.write(SYNC1);
+  Serial.write((const uint8_t*)&sample, sizeof(sample));
+  Serial.write((const uint8_t*)&crc, sizeof(crc));
+}
+
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(DEFAULT_BAUD);
   // Initialize the thermocouples.
   for (auto& tc : thermocouples) {
     tc.begin();
@@ -21,9 +81,38 @@ void loop() {
     if (rx.equals("*IDN?")) {
       Serial.println("ESP32");
     } else if (rx.equals("GET TEMP")) {
-      float temp0 = thermocouples[0].readThermocoupleTemperature();
-      float temp1 = thermocouples[1].readThermocoupleTemperature();
-      Serial.printf("%f,%f\n", temp0, temp1);
+      // Every channel in one reply, comma-separated. The chips convert continuously, so this
+      // only reads their registers.
+      for (size_t i = 0; i < thermocouples.size(); i++) {
+        Serial.printf(i ? ",%f" : "%f", thermocouples[i].readThermocoupleTemperature());
+      }
+      Serial.print("\n");
+    } else if (rx.startsWith("STREAM ")) {
+      // STREAM <period in ms> <baud rate>: reply OK at the current baud rate, then push frames
+      // at the new one.
+      unsigned long period = 0;
+      unsigned long baud = 0;
+      if (sscanf(rx.c_str(), "STREAM %lu %lu", &period, &baud) == 2 && period > 0 && baud > 0) {
+        Serial.println("OK");
+        Serial.flush();
+        Serial.updateBaudRate(baud);
+        period_ms = period;
+        seq = 0;
+        next_ms = millis();
+        streaming = true;
+      } else {
+        Serial.println("ERR");
+      }
+    } else if (rx.equals("STOP")) {
+      // Stop pushing frames and go back to the default baud rate.
+      streaming = false;
+      Serial.flush();
+      Serial.updateBaudRate(DEFAULT_BAUD);
     }
   }
+
+  if (streaming && (long)(millis() - next_ms) >= 0) {
+    next_ms += period_ms;
+    sendSample();
+  }
 }
@@ -0,0 +1,130 @@
+"""
+Tests for the data stream broker and the resumption of data streams with Last-Event-ID.
+"""
+
+import json
+import threading
+from types import SimpleNamespace
+
+from broker import Broker, format_event
+from handler import build_history_event, parse_stream_params
+from timeseries import TimeSeries
+
+
+def parse_event(payload: bytes):
+    """
+    :return: The ID, name and data of an encoded event.
+    """
+    fields = dict(line.split(': ', 1) for line in payload.decode('utf-8').strip().split('\n'))
+    event_id = int(fields['id']) if 'id' in fields else None
+    return event_id, fields['event'], json.loads(fields['data'])
+
+
+def test_format_event():
+    assert format_event('data', {'a': 1}, 7) == b'id: 7\nevent: data\ndata: {"a": 1}\n\n'
+    assert format_event('data', [1]) == b'event: data\ndata: [1]\n\n'
+
+
+def test_subscribers_read_from_their_cursor():
+    broker = Broker()
+    broker.publish('data', {'n': 0}, 0)
+
+    # Subscribers only get the events published after they subscribed.
+    first = broker.subscribe()
+    broker.publish('data', {'n': 1}, 1)
+    second = broker.subscribe()
+    broker.publish('data', {'n': 2}, 2)
+
+    assert [event_id for event_id, _ in first.get(timeout=0)] == [1, 2]
+    events = second.get(timeout=0)
+    assert [parse_event(payload) for _, payload in events] == [(2, 'data', {'n': 2})]
+
+    # Everything was read.
+    assert first.get(timeout=0) == []
+    assert broker.backlog() == [0, 0]
+
+
+def test_slow_subscriber_skips_events():
+    broker = Broker(backlog=4)
+    sub = broker.subscribe()
+    for i in range(10):
+        broker.publish('data', {'n': i}, i)
+
+    assert broker.backlog() == [10]
+    assert [event_id for event_id, _ in sub.get(timeout=0)] == [6, 7, 8, 9]
+    assert sub.dropped == 6
+
+
+def test_close_wakes_up_reader():
+    broker = Broker()
+    sub = broker.subscribe()
+    threading.Timer(0.05, sub.close).start()
+
+    assert sub.get(timeout=5) == []
+    assert broker.subscribers == 0
+
+
+def test_listener_called_on_publish():
+    broker = Broker()
+    calls = []
+
+    def listener():
+        calls.append(1)
+
+    broker.add_listener(listener)
+    broker.publish('data', {}, 0)
+    broker.remove_listener(listener)
+    broker.publish('data', {}, 1)
+
+    assert calls == [1]
+
+
+def test_parse_stream_params():
+    assert parse_stream_params({}, {}) == (2000, None)
+    assert parse_stream_params({'max_points': ['10']}, {'Last-Event-ID': '41'}) == (10, 41)
+
+
+def history_of(data: TimeSeries, last_event_id, max_points: int = 2000):
+    payload, last = build_history_event(SimpleNamespace(data=data), last_event_id, max_points)
+    return parse_event(payload), last
+
+
+def test_history_resumes_after_last_event_id():
+    data = TimeSeries(100)
+    for i in range(10):
+        data.append(float(i), 20.0 + i, 30.0)
+
+    # A reconnecting client only gets the samples after the last one it received.
+    (event_id, event, history), last = history_of(data, 6)
+    assert event == 'history'
+    assert history['reset'] is False
+    assert history['time'] == [7.0, 8.0, 9.0]
+    assert event_id == last == 9
+
+    # A client that is up to date gets nothing new.
+    (_, _, history), last = history_of(data, 9)
+    assert history['reset'] is False
+    assert history['time'] == []
+    assert last == 9
+
+
+def test_history_resets_new_or_stale_clients():
+    data = TimeSeries(4, spill_chunk=2)
+    for i in range(10):
+        data.append(float(i), 20.0, 30.0)
+
+    # A new client gets everything held.
+    (_, _, history), last = history_of(data, None)
+    assert history['reset'] is True
+    assert history['time'] == [6.0, 7.0, 8.0, 9.0]
+    assert last == 9
+
+    # So does a client whose last event was already dropped from memory, or is from the future.
+    for last_event_id in (2, 50):
+        (_, _, history), _ = history_of(data, last_event_id)
+        assert history['reset'] is True
+        assert history['time'] == [6.0, 7.0, 8.0, 9.0]
+
+    # And a client that missed more than it asked for gets the downsampled history.
+    (_, _, history), _ = history_of(data, 5, max_points=2)
+    assert history['reset'] is True
@@ -0,0 +1,80 @@
+"""
+Tests for the Excel export.
+"""
+
+import datetime
+import json
+import os
+import time
+import zipfile
+
+import numpy as np
+import openpyxl
+
+from generate_excel import export
+from sweep import Sweep
+from xlsx import render_rows
+
+
+# Time of the sweep written by write_experiment.
+SWEEP_TIME = time.mktime(datetime.datetime(2024, 1, 1, 12, 0, 0).timetuple())
+
+
+def write_experiment(directory: str, temperatures: str, title: str = 'Test') -> None:
+    """
+    Write an experiment with one sweep from VNA 1 and the given temperatures.csv contents.
+    """
+    metadata = {'title': title, 'name': 'Tester', 'cpa': 'cpa', 'date': '2024-01-01',
+                'temp1': 'Stage', 'temp2': None, 'vna1': 'VNA', 'vna2': None,
+                'vna1_temp': 'temp1', 'vna2_temp': None}
+    with open(os.path.join(directory, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+    with open(os.path.join(directory, 'temperatures.csv'), 'w', encoding='utf-8') as f:
+        f.write(temperatures)
+
+    freq = np.linspace(1e9, 2e9, 11)
+    sweep = Sweep(freq=freq, formatted=np.zeros(11), sparams=np.ones((4, 11), dtype=np.complex128))
+    sweep.write_csv(os.path.join(directory, '2024_01_01_12_00_00_vna1.csv'))
+    sweep.write_s2p(os.path.join(directory, '2024_01_01_12_00_00_vna1.s2p'))
+
+
+def test_export_without_temperatures(tmp_path):
+    # A VNA-only run leaves temperatures.csv empty.
+    write_experiment(str(tmp_path), '')
+
+    wb_path = export(str(tmp_path), workers=1)
+
+    with zipfile.ZipFile(wb_path) as wb:
+        sheets = [name for name in wb.namelist() if name.startswith('xl/worksheets/')]
+    assert len(sheets) == 2
+
+
+def test_export_opens_in_openpyxl(tmp_path):
+    write_experiment(str(tmp_path), f'{SWEEP_TIME},4.5,5.5\n')
+
+    wb = openpyxl.load_workbook(export(str(tmp_path), workers=1))
+
+    assert wb.sheetnames == ['Sheet', 'v1_1']
+    metadata = {row[0]: row[1] for row in wb['Sheet'].iter_rows(values_only=True)}
+    assert metadata['title'] == 'Test'
+    assert metadata['temp2'] is None
+    rows = list(wb['v1_1'].iter_rows(values_only=True))
+    assert rows[0] == ('Temperature (degC):', 4.5)
+    assert ('Freq(Hz)', 'Formatted Data') in rows
+    assert (2e9, 0.0) in rows
+
+
+def test_export_special_characters(tmp_path):
+    # Markup is escaped and characters XML doesn't allow are left out.
+    write_experiment(str(tmp_path), '', title='<a & "b">\x01\x0b\x1f é')
+
+    wb = openpyxl.load_workbook(export(str(tmp_path), workers=1))
+
+    assert wb['Sheet']['B1'].value == '<a & "b"> é'
+
+
+def test_render_rows_control_characters():
+    assert b'>ab<' in render_rows([['a\x01b']])
+    assert b'>1.5<' in render_rows([[1.5]])
+    # Missing values are left empty.
+    assert b'<c' not in render_rows([[None, float('nan')]])
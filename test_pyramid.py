@@ -0,0 +1,104 @@
+"""
+Tests for the min/max summary levels of the temperatures.
+"""
+
+import numpy as np
+
+from pyramid import Pyramid, aggregate, as_buckets, to_samples
+from store import TEMPERATURE_COLUMNS
+from table import Table
+
+
+def samples(n: int):
+    times = np.arange(n, dtype=np.float64)
+    # A sine wave with a spike and a dip that a plot must not lose.
+    temp1 = np.sin(times / 50)
+    temp1[1234] = 10.0
+    temp1[3456] = -10.0
+    return {'time': times, 'temp1': temp1, 'temp2': np.full(n, np.nan)}
+
+
+def open_pyramid(directory: str):
+    base = Table(directory, 'temperatures', TEMPERATURE_COLUMNS)
+    return base, Pyramid(directory, base, fanout=4)
+
+
+def test_aggregate_min_max():
+    buckets = as_buckets({'time': np.arange(8.0),
+                          'temp1': np.array([3.0, 1.0, 4.0, 1.5, 5.0, 9.0, 2.0, 6.0]),
+                          'temp2': np.array([np.nan, 2.0, np.nan, 1.0, np.nan, np.nan, np.nan, np.nan])})
+    out = aggregate(buckets, 4)
+
+    assert out['time'].tolist() == [0.0, 4.0]
+    assert out['end'].tolist() == [3.0, 7.0]
+    assert out['min_temp1'].tolist() == [1.0, 2.0]
+    assert out['tmin_temp1'].tolist() == [1.0, 6.0]
+    assert out['max_temp1'].tolist() == [4.0, 9.0]
+    assert out['tmax_temp1'].tolist() == [2.0, 5.0]
+    # Missing values are skipped, unless the whole bucket is missing.
+    assert out['min_temp2'][0] == 1.0 and out['max_temp2'][0] == 2.0
+    assert np.isnan(out['min_temp2'][1])
+
+
+def test_to_samples_in_time_order():
+    buckets = aggregate(as_buckets({'time': np.arange(4.0), 'temp1': np.array([1.0, 5.0, 0.0, 2.0]),
+                                    'temp2': np.zeros(4)}), 4)
+
+    # The maximum came before the minimum.
+    assert to_samples(buckets)[:2].tolist() == [[0.0, 3.0], [5.0, 0.0]]
+
+
+def test_query_keeps_extremes(tmp_path):
+    base, pyramid = open_pyramid(str(tmp_path))
+    rows = samples(5000)
+    for i in range(0, 5000, 700):
+        chunk = {column: values[i:i + 700] for column, values in rows.items()}
+        base.extend(chunk)
+        pyramid.extend(chunk)
+
+    data, level = pyramid.query(max_points=200)
+
+    assert level > 0
+    assert data.shape[1] <= 200
+    assert data[1].max() == 10.0
+    assert data[1].min() == -10.0
+    assert data[0].min() == 0.0
+    assert data[0].max() == 4999.0
+
+    # A narrow range is read at full resolution.
+    data, level = pyramid.query(100.0, 150.0, max_points=200)
+    assert level == 0
+    assert data[0].tolist() == list(range(100, 150))
+
+
+def test_query_range_mixes_levels(tmp_path):
+    base, pyramid = open_pyramid(str(tmp_path))
+    rows = samples(5000)
+    base.extend(rows)
+    pyramid.extend(rows)
+
+    data, _ = pyramid.query(1001.0, 3999.0, max_points=100)
+
+    assert data[0].min() >= 1001.0
+    assert data[0].max() < 3999.0
+    assert data[1].max() == 10.0
+    assert data[1].min() == -10.0
+
+
+def test_reopen_catches_up(tmp_path):
+    base, pyramid = open_pyramid(str(tmp_path))
+    rows = samples(5000)
+    base.extend({column: values[:3000] for column, values in rows.items()})
+    pyramid.extend({column: values[:3000] for column, values in rows.items()})
+    # Rows appended to the temperature table without updating the levels, as after a crash.
+    base.extend({column: values[3000:] for column, values in rows.items()})
+    base.close()
+    for table in pyramid.levels:
+        table.close()
+
+    base, pyramid = open_pyramid(str(tmp_path))
+    data, level = pyramid.query(max_points=200)
+
+    assert level > 0
+    assert data[0].max() == 4999.0
+    assert data[1].min() == -10.0
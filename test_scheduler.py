@@ -0,0 +1,72 @@
+"""
+Tests for the deadline scheduler.
+"""
+
+import threading
+import time
+
+from scheduler import Scheduler
+
+
+def test_due_in_deadline_order():
+    scheduler = Scheduler()
+    scheduler.schedule('sweep', 10.0)
+    scheduler.schedule('temperature', 5.0)
+    scheduler.schedule('keepalive', 20.0)
+
+    assert scheduler.due(4.0) == []
+    assert scheduler.due(5.0) == ['temperature']
+    assert sorted(scheduler.due(10.0)) == ['sweep', 'temperature']
+
+    # Rescheduling replaces the deadline, cancelling removes it.
+    scheduler.schedule('temperature', 15.0)
+    scheduler.cancel('sweep')
+    assert scheduler.due(12.0) == []
+    assert scheduler.deadline('sweep') is None
+    assert scheduler.deadline('temperature') == 15.0
+
+
+def test_next_deadline_does_not_drift():
+    scheduler = Scheduler()
+
+    # A cycle that finished on time is due one period after its deadline, not after it finished.
+    assert scheduler.next_deadline(100.0, 10.0, 104.0) == 110.0
+    assert scheduler.stats.missed == 0
+
+    # A cycle that overran skips the deadlines that already passed.
+    assert scheduler.next_deadline(100.0, 10.0, 125.0) == 130.0
+    assert scheduler.stats.missed == 2
+
+
+def test_record_cycle():
+    scheduler = Scheduler()
+    scheduler.record_cycle(100.0, 100.5, 101.0, 10.0)
+    scheduler.record_cycle(110.0, 110.0, 122.0, 10.0)
+
+    stats = scheduler.stats
+    assert stats.cycles == 2
+    assert stats.overruns == 1
+    assert stats.max_jitter == 0.5
+    assert stats.mean_jitter == 0.25
+    assert stats.last_duration == 12.0
+
+
+def test_wait_until_deadline():
+    scheduler = Scheduler()
+    scheduler.schedule('temperature', time.monotonic() + 0.05)
+
+    start = time.monotonic()
+    scheduler.wait()
+
+    assert time.monotonic() - start >= 0.04
+
+
+def test_wake_interrupts_wait():
+    scheduler = Scheduler()
+    scheduler.schedule('sweep', time.monotonic() + 60)
+    threading.Timer(0.05, scheduler.wake).start()
+
+    start = time.monotonic()
+    scheduler.wait()
+
+    assert time.monotonic() - start < 5
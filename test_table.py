@@ -0,0 +1,103 @@
+"""
+Tests for the columnar append-only tables of the experiment store.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from table import Table
+
+
+COLUMNS = {
+    'time': ('<f8', ()),
+    'value': ('<f8', ()),
+    'trace': ('<c16', (2,)),
+}
+
+
+def rows(start: int, end: int):
+    times = np.arange(start, end, dtype=np.float64)
+    return {'time': times, 'value': times * 10, 'trace': np.stack([times + 1j, times - 1j], axis=1)}
+
+
+def test_append_across_segments(tmp_path):
+    table = Table(str(tmp_path), 'data', COLUMNS, segment_rows=4)
+    for i in range(3):
+        table.append({column: values[0] for column, values in rows(i, i + 1).items()})
+    table.extend(rows(3, 10))
+
+    assert len(table) == 10
+    assert len(table.index['segments']) == 3
+    data = table.read()
+    assert data['time'].tolist() == list(range(10))
+    assert data['value'].tolist() == [10.0 * i for i in range(10)]
+    assert data['trace'][7].tolist() == [7 + 1j, 7 - 1j]
+
+
+def test_read_and_count_ranges(tmp_path):
+    table = Table(str(tmp_path), 'data', COLUMNS, segment_rows=4)
+    table.extend(rows(0, 10))
+
+    assert table.read(2.0, 6.0)['time'].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert table.read(20.0)['time'].shape == (0,)
+    assert table.count() == 10
+    assert table.count(2.0, 6.0) == 4
+    assert table.count(4.0, 8.0) == 4
+    assert [len(s['time']) for s in table.segments(3.0, 9.0)] == [1, 4, 1]
+
+
+def test_reopen(tmp_path):
+    table = Table(str(tmp_path), 'data', COLUMNS, segment_rows=4)
+    table.extend(rows(0, 6))
+    table.close()
+
+    # The columns come from the index.
+    reopened = Table(str(tmp_path), 'data')
+    assert len(reopened) == 6
+    reopened.extend(rows(6, 9))
+    reopened.close()
+
+    assert Table(str(tmp_path), 'data').read()['time'].tolist() == list(range(9))
+
+
+def test_index_written_on_rollover_and_flush(tmp_path):
+    table = Table(str(tmp_path), 'data', COLUMNS, segment_rows=4)
+
+    def rows_in_index():
+        with open(table.index_path, encoding='utf-8') as f:
+            return sum(s['rows'] for s in json.load(f)['segments'])
+
+    # Starting a segment writes the index, appending to it doesn't.
+    table.extend(rows(0, 2))
+    assert rows_in_index() == 2
+    table.extend(rows(2, 3))
+    assert rows_in_index() == 2
+    # Rows appended since are still read from the same process.
+    assert len(table.read()['time']) == 3
+
+    table.flush()
+    assert rows_in_index() == 3
+    # Filling a segment and starting the next one writes it with every row.
+    table.extend(rows(3, 5))
+    assert rows_in_index() == 5
+    table.extend(rows(5, 6))
+    assert rows_in_index() == 5
+    table.close()
+    assert rows_in_index() == 6
+
+
+def test_wrong_shape(tmp_path):
+    table = Table(str(tmp_path), 'data', COLUMNS)
+    bad = rows(0, 2)
+    bad['trace'] = np.zeros((2, 3), dtype=np.complex128)
+
+    with pytest.raises(ValueError):
+        table.extend(bad)
+    assert len(table) == 0
+
+
+def test_missing_table(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Table(str(tmp_path), 'missing')
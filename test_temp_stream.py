@@ -0,0 +1,92 @@
+"""
+Tests for decoding the binary temperature frames pushed by the ESP32.
+"""
+
+import binascii
+
+import pytest
+
+from temp_stream import CRC, FRAME_SIZE, SAMPLE, SYNC, decode_frames
+
+
+def frame(seq: int, temp1: float = 20.5, temp2: float = -196.0, fault1: int = 0, fault2: int = 0) -> bytes:
+    """
+    Encode a frame the way the ESP32 firmware does.
+    """
+    body = SAMPLE.pack(seq, seq * 100, temp1, temp2, fault1, fault2)
+    return SYNC + body + CRC.pack(binascii.crc_hqx(body, 0xFFFF))
+
+
+def test_frame_layout():
+    assert FRAME_SIZE == 22
+    # CRC-16/CCITT-FALSE check value.
+    assert binascii.crc_hqx(b'123456789', 0xFFFF) == 0x29B1
+
+
+def test_decode_complete_frames():
+    buf = bytearray(frame(1) + frame(2, fault2=4))
+
+    frames, bad_crc = decode_frames(buf)
+
+    assert [f[0] for f in frames] == [1, 2]
+    assert frames[0][1] == 100
+    assert frames[0][2:4] == (20.5, -196.0)
+    assert frames[1][5] == 4
+    assert bad_crc == 0
+    assert buf == bytearray()
+
+
+def test_partial_frame_kept_for_next_read():
+    data = frame(1) + frame(2)
+    buf = bytearray(data[:FRAME_SIZE + 10])
+
+    frames, _ = decode_frames(buf)
+    assert [f[0] for f in frames] == [1]
+    assert bytes(buf) == data[FRAME_SIZE:FRAME_SIZE + 10]
+
+    buf += data[FRAME_SIZE + 10:]
+    frames, _ = decode_frames(buf)
+    assert [f[0] for f in frames] == [2]
+    assert buf == bytearray()
+
+
+@pytest.mark.parametrize('split', range(1, FRAME_SIZE))
+def test_frame_split_anywhere(split):
+    data = frame(7)
+    buf = bytearray(data[:split])
+    assert decode_frames(buf)[0] == []
+
+    buf += data[split:]
+    frames, bad_crc = decode_frames(buf)
+    assert [f[0] for f in frames] == [7]
+    assert bad_crc == 0
+
+
+def test_resync_after_bad_crc():
+    corrupt = bytearray(frame(2))
+    corrupt[8] ^= 0xFF
+    buf = bytearray(frame(1) + bytes(corrupt) + frame(3))
+
+    frames, bad_crc = decode_frames(buf)
+
+    # The corrupted frame is skipped, the next one is found again.
+    assert [f[0] for f in frames] == [1, 3]
+    assert bad_crc >= 1
+    assert buf == bytearray()
+
+
+def test_resync_after_garbage():
+    # Noise, such as text left over from before streaming started, including a lone sync byte.
+    buf = bytearray(b'OK\r\n' + SYNC[:1] + b'\x00\x01' + frame(4) + b'\xff' + frame(5))
+
+    frames, _ = decode_frames(buf)
+
+    assert [f[0] for f in frames] == [4, 5]
+    assert buf == bytearray()
+
+
+def test_trailing_sync_byte_kept():
+    buf = bytearray(b'noise' + SYNC[:1])
+
+    assert decode_frames(buf) == ([], 0)
+    assert bytes(buf) == SYNC[:1]
@@ -0,0 +1,103 @@
+"""
+Tests for the temperature history ring buffer and its spill file.
+"""
+
+import os
+
+import numpy as np
+
+from config import Config
+from timeseries import TimeSeries, to_lists
+from writer import Writer
+
+
+def fill(data: TimeSeries, start: int, end: int) -> None:
+    for i in range(start, end):
+        data.append(float(i), 20.0 + i, 30.0 + i)
+
+
+def test_wraparound_keeps_newest():
+    data = TimeSeries(4, spill_chunk=1)
+    fill(data, 0, 10)
+
+    assert len(data) == 4
+    assert data.total == 10
+    assert data.first_seq == 6
+    samples, last = data.snapshot()
+    assert last == 9
+    assert samples[0].tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert samples[1].tolist() == [26.0, 27.0, 28.0, 29.0]
+
+
+def test_since_and_range():
+    data = TimeSeries(8, spill_chunk=2)
+    fill(data, 0, 12)
+
+    assert data.since(9)[0].tolist() == [9.0, 10.0, 11.0]
+    # Sequence numbers already dropped from memory start at the oldest sample held.
+    assert data.since(0)[0].tolist() == data.range()[0].tolist()
+    assert data.range(5.0, 7.0)[0].tolist() == [5.0, 6.0]
+    assert data.range(20.0).shape == (3, 0)
+
+
+def test_append_returns_sequence_numbers():
+    data = TimeSeries(2)
+    assert [data.append(float(i), 0.0, 0.0) for i in range(5)] == [0, 1, 2, 3, 4]
+
+    # Clearing keeps counting.
+    data.clear()
+    assert len(data) == 0
+    assert data.append(5.0, 0.0, 0.0) == 5
+
+
+def test_spill_keeps_evicted_samples(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    data = TimeSeries(4, spill_path=path, spill_chunk=2)
+    fill(data, 0, 20)
+
+    # Everything is still returned, from the spill file and then from memory.
+    assert len(data) <= 4
+    assert data.range()[0].tolist() == [float(i) for i in range(20)]
+    assert data.range(3.0, 9.0)[1].tolist() == [23.0, 24.0, 25.0, 26.0, 27.0, 28.0]
+    assert os.path.getsize(path) == (20 - len(data)) * 3 * 8
+
+
+def test_spill_on_writer(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    writer = Writer(Config(period=1))
+    writer.start()
+    try:
+        data = TimeSeries(4, spill_path=path, spill_chunk=2, writer=writer)
+        fill(data, 0, 20)
+
+        # Samples waiting for the writer are returned from memory.
+        assert data.range()[0].tolist() == [float(i) for i in range(20)]
+        writer.sync()
+        assert data.range()[0].tolist() == [float(i) for i in range(20)]
+        assert os.path.getsize(path) == (20 - len(data)) * 3 * 8
+    finally:
+        writer.stop()
+
+
+def test_reset_spill_starts_empty(tmp_path):
+    first = str(tmp_path / 'first.bin')
+    second = str(tmp_path / 'second.bin')
+    data = TimeSeries(4, spill_path=first, spill_chunk=2)
+    fill(data, 0, 10)
+
+    data.reset_spill(second)
+    fill(data, 10, 14)
+
+    # The first file is no longer read, and the second only holds samples evicted since.
+    assert data.range()[0].tolist() == [float(i) for i in range(6, 14)]
+    assert os.path.getsize(first) == 6 * 3 * 8
+    assert os.path.getsize(second) == 4 * 3 * 8
+
+    # Resetting to a file that exists empties it.
+    data.reset_spill(first)
+    assert not os.path.exists(first)
+
+
+def test_to_lists():
+    samples = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+    assert to_lists(samples) == {'time': [1.0, 2.0], 'temp1': [3.0, 4.0], 'temp2': [5.0, 6.0]}
@@ -0,0 +1,79 @@
+"""
+Tests for the VNA transfers, run against the simulated VNA.
+"""
+
+import socket
+
+import numpy as np
+import pytest
+
+from vna_funcs import ping_vna, vna_binary, vna_csv, vna_points, vna_s2p
+from vna_sim import SimConfig, VNASimulator
+
+
+@pytest.fixture
+def connect():
+    sims = []
+    sockets = []
+
+    def connect(**config) -> socket.socket:
+        sim = VNASimulator(port=0, config=SimConfig(**config))
+        sim.start()
+        sims.append(sim)
+        s = socket.create_connection(('127.0.0.1', sim.port), timeout=5)
+        sockets.append(s)
+        return s
+
+    yield connect
+    for s in sockets:
+        s.close()
+    for sim in sims:
+        sim.stop()
+
+
+@pytest.mark.parametrize('points', [101, 201])
+def test_file_transfer(connect, points):
+    s = connect(points=points)
+    ping_vna(s)
+
+    assert vna_points(s) == points
+    csv = vna_csv(s)
+    s2p = vna_s2p(s)
+
+    assert csv.count(b'BEGIN') == 4
+    assert s2p.startswith(b'!')
+    assert len([line for line in s2p.splitlines() if not line.startswith((b'!', b'#'))]) == points
+
+
+def test_s2p_wrong_point_count(connect):
+    s = connect(points=101)
+
+    with pytest.raises(ValueError):
+        vna_s2p(s, 201)
+
+
+def test_binary_transfer(connect):
+    s = connect(points=51)
+
+    sweep = vna_binary(s)
+
+    assert sweep.freq.shape == (51,)
+    assert sweep.freq[0] == 1e9 and sweep.freq[-1] == 3e9
+    assert sweep.formatted.shape == (51,)
+    assert sweep.sparams.shape == (4, 51)
+    assert np.allclose(np.abs(sweep.sparams), 0.5, atol=0.1)
+
+
+def test_fragmented_replies(connect):
+    # Replies trickle in a few bytes at a time, like a slow network.
+    s = connect(points=21, fragment=7)
+
+    assert len([line for line in vna_s2p(s).splitlines() if line[:1].isdigit()]) == 21
+    assert vna_binary(s).freq.shape == (21,)
+
+
+def test_truncated_transfer_raises(connect):
+    s = connect(points=201, truncate=1.0)
+
+    with pytest.raises((ConnectionError, OSError)):
+        vna_s2p(s, 201)
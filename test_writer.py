@@ -0,0 +1,119 @@
+"""
+Tests for the batching writer thread.
+"""
+
+import os
+import threading
+
+from config import Config
+from writer import Writer
+
+
+def start_writer(**kwargs) -> Writer:
+    config = Config(period=1)
+    config.flush_count = 1000
+    config.flush_interval = 60.0
+    for key, value in kwargs.items():
+        setattr(config, key, value)
+    writer = Writer(config)
+    writer.start()
+    return writer
+
+
+def test_stop_flushes_appends(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    writer = start_writer()
+    for i in range(50):
+        writer.append(path, f'{i}\n'.encode())
+
+    writer.stop()
+
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == ''.join(f'{i}\n' for i in range(50))
+    assert not writer.is_alive()
+    assert writer.stats.written == 50
+    assert writer.stats.errors == 0
+
+
+def test_flush_count_and_sync(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    writer = start_writer(flush_count=3)
+    try:
+        for _ in range(2):
+            writer.append(path, b'x')
+        assert writer.sync(timeout=5)
+        # sync() flushes whatever is pending.
+        assert os.path.getsize(path) == 2
+
+        flushes = writer.stats.flushes
+        for _ in range(3):
+            writer.append(path, b'y')
+        assert writer.sync(timeout=5)
+        assert writer.stats.flushes > flushes
+        assert os.path.getsize(path) == 5
+    finally:
+        writer.stop()
+
+
+def test_writes_in_order(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    whole = str(tmp_path / 'whole.json')
+    calls = []
+    writer = start_writer()
+    writer.append(path, b'a')
+    writer.write_file(whole, b'{}')
+    writer.call(lambda: calls.append(os.path.exists(whole)))
+    # Replacing a file appended to closes it first.
+    writer.write_file(path, b'b')
+    writer.append(path, b'c')
+    writer.stop()
+
+    assert calls == [True]
+    with open(path, 'rb') as f:
+        assert f.read() == b'bc'
+
+
+def test_writes_after_stop_run_inline(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    writer = start_writer()
+    writer.stop()
+
+    writer.append(path, b'late')
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'late'
+
+
+def test_errors_are_counted(tmp_path):
+    writer = start_writer()
+
+    def fail():
+        raise OSError('disk full')
+
+    writer.call(fail)
+    writer.append(str(tmp_path / 'missing' / 'data.csv'), b'x')
+    writer.stop()
+
+    assert writer.stats.errors == 2
+
+
+def test_full_queue_blocks(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    release = threading.Event()
+    config = Config(period=1)
+    writer = Writer(config, max_items=2)
+    writer.start()
+    try:
+        # Hold the writer in a call so the queue fills up.
+        writer.call(release.wait)
+        writer.append(path, b'1')
+        writer.append(path, b'2')
+        threading.Timer(0.1, release.set).start()
+        writer.append(path, b'3')
+
+        assert writer.stats.blocked >= 1
+    finally:
+        release.set()
+        writer.stop()
+    with open(path, 'rb') as f:
+        assert f.read() == b'123'
@@ -0,0 +1,251 @@
+"""
+Module for the TimeSeries class.
+"""
+
+import os
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from writer import Writer
+
+
+# Names of the columns, in storage order.
+COLUMNS = ('time', 'temp1', 'temp2')
+
+
+class TimeSeries:
+    """
+    Fixed capacity ring buffer of temperature samples stored as NumPy columns. When the buffer is
+    full the oldest samples are moved to a spill file (if one is set) or dropped. The spill file is
+    written without holding the buffer's lock, so appending and reading never wait on the disk.
+
+    Every sample gets a sequence number, counting from 0 in the order samples were appended.
+    """
+
+    def __init__(self, capacity: int, spill_path: Optional[str] = None, spill_chunk: Optional[int] = None,
+                 writer: Optional[Writer] = None):
+        """
+        :param capacity: Number of samples kept in memory.
+        :param spill_path: File to move evicted samples to, defaults to dropping them.
+        :param spill_chunk: Number of samples evicted at once, defaults to a quarter of the capacity.
+        :param writer: Writer to write the spill file on, defaults to writing it on the thread that
+        appended the samples, after releasing the lock.
+        """
+        if capacity <= 0:
+            raise ValueError('capacity must be positive.')
+
+        # One row per column, one column per sample.
+        self._buf = np.empty((len(COLUMNS), capacity), dtype=np.float64)
+        self._capacity = capacity
+
+        # Index of the oldest sample in the buffer.
+        self._head = 0
+
+        # Number of samples in the buffer.
+        self._count = 0
+
+        # Number of samples ever appended.
+        self._total = 0
+
+        # Number of samples in the spill file.
+        self._spilled = 0
+
+        # Evicted samples not written to their spill file yet, as (path, array of shape (3, n)),
+        # oldest first. They are still returned by range().
+        self._unspilled: List[Tuple[str, np.ndarray]] = []
+
+        self.spill_path = spill_path
+        self._spill_chunk = spill_chunk or max(capacity // 4, 1)
+        self._writer = writer
+
+        self._lock = Lock()
+
+        # Held while writing spill files, so blocks are written in order.
+        self._spill_lock = Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def total(self) -> int:
+        """
+        Number of samples ever appended, which is also the sequence number of the next sample.
+        """
+        with self._lock:
+            return self._total
+
+    @property
+    def first_seq(self) -> int:
+        """
+        Sequence number of the oldest sample held in memory.
+        """
+        with self._lock:
+            return self._total - self._count
+
+    def append(self, t: float, temp1: float, temp2: float) -> int:
+        """
+        Append a sample.
+
+        :return: Sequence number of the sample.
+        """
+        with self._lock:
+            spill = self._count == self._capacity and self._evict(self._spill_chunk)
+            idx = (self._head + self._count) % self._capacity
+            self._buf[0, idx] = t
+            self._buf[1, idx] = temp1
+            self._buf[2, idx] = temp2
+            self._count += 1
+            self._total += 1
+            seq = self._total - 1
+
+        if spill:
+            if self._writer:
+                self._writer.call(self._write_spill)
+            else:
+                self._write_spill()
+        return seq
+
+    def since(self, seq: int) -> np.ndarray:
+        """
+        Get the samples held in memory with a sequence number of at least seq.
+
+        :return: Array of shape (3, n) with the time, temp1 and temp2 columns.
+        """
+        with self._lock:
+            skip = max(seq - (self._total - self._count), 0)
+            return self._ordered()[:, skip:].copy()
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """
+        Get the samples with start <= time < end, including spilled samples.
+
+        :param start: Start of the time range, defaults to the oldest sample.
+        :param end: End of the time range, defaults to the newest sample.
+        :return: Array of shape (3, n) with the time, temp1 and temp2 columns.
+        """
+        with self._lock:
+            return self._range(start, end)
+
+    def snapshot(self) -> Tuple[np.ndarray, int]:
+        """
+        Get all samples, including spilled samples, together with the sequence number of the newest.
+
+        :return: Array of shape (3, n) and the sequence number of the last sample (-1 if empty).
+        """
+        with self._lock:
+            return self._range(None, None), self._total - 1
+
+    def reset_spill(self, spill_path: Optional[str]) -> None:
+        """
+        Move the samples evicted from now on to a new spill file, emptying it first. Samples in the
+        old spill file are no longer returned by range().
+
+        :param spill_path: File to move evicted samples to, None to drop them.
+        """
+        with self._spill_lock:
+            with self._lock:
+                self.spill_path = spill_path
+                self._spilled = 0
+                # Samples still waiting for the new file are from an earlier run of the experiment.
+                self._unspilled = [(path, block) for path, block in self._unspilled if path != spill_path]
+            if spill_path and os.path.exists(spill_path):
+                os.remove(spill_path)
+
+    def clear(self) -> None:
+        """
+        Remove all samples held in memory. The sequence numbers keep counting.
+        """
+        with self._lock:
+            self._head = 0
+            self._count = 0
+
+    def _range(self, start: Optional[float], end: Optional[float]) -> np.ndarray:
+        memory = self._ordered()
+        lo = 0 if start is None else np.searchsorted(memory[0], start, side='left')
+        hi = memory.shape[1] if end is None else np.searchsorted(memory[0], end, side='left')
+        parts = [memory[:, lo:hi].copy()]
+
+        # Only look at the evicted samples if the range starts before the samples in memory.
+        in_memory = memory.shape[1] and (start is not None and start >= memory[0, 0])
+        if not in_memory:
+            blocks = [block for path, block in self._unspilled if path == self.spill_path]
+            if self._spilled:
+                blocks.insert(0, self._read_spill())
+            for block in reversed(blocks):
+                lo = 0 if start is None else np.searchsorted(block[0], start, side='left')
+                hi = block.shape[1] if end is None else np.searchsorted(block[0], end, side='left')
+                parts.insert(0, np.array(block[:, lo:hi]))
+
+        return np.concatenate(parts, axis=1)
+
+    def _ordered(self) -> np.ndarray:
+        """
+        :return: The samples in memory, oldest first. This is a view unless the buffer wraps.
+        """
+        end = self._head + self._count
+        if end <= self._capacity:
+            return self._buf[:, self._head:end]
+        return np.concatenate((self._buf[:, self._head:], self._buf[:, :end - self._capacity]), axis=1)
+
+    def _evict(self, n: int) -> bool:
+        """
+        Remove the n oldest samples from the buffer, keeping them to be written to the spill file
+        if one is set.
+
+        :return: Whether samples need to be written with _write_spill().
+        """
+        n = min(n, self._count)
+        if self.spill_path:
+            self._unspilled.append((self.spill_path, self._ordered()[:, :n].copy()))
+        self._head = (self._head + n) % self._capacity
+        self._count -= n
+        return bool(self.spill_path)
+
+    def _write_spill(self) -> None:
+        """
+        Write the evicted samples to their spill files, in order. Called without the lock held.
+        """
+        with self._spill_lock:
+            with self._lock:
+                pending = list(self._unspilled)
+            for path, block in pending:
+                with open(path, 'ab') as wf:
+                    # Stored row by row so the file can be appended to and memory-mapped.
+                    np.ascontiguousarray(block.T, dtype='<f8').tofile(wf)
+            with self._lock:
+                del self._unspilled[:len(pending)]
+                self._spilled += sum(block.shape[1] for path, block in pending if path == self.spill_path)
+
+    def _read_spill(self) -> np.ndarray:
+        """
+        :return: Memory map of the samples written to the spill file as an array of shape (3, n).
+        """
+        return np.memmap(self.spill_path, dtype='<f8', mode='r',
+                         shape=(self._spilled, len(COLUMNS))).T
+
+
+def to_records(samples: np.ndarray) -> Iterator[Dict]:
+    """
+    Convert samples to the dictionaries sent to the data streams.
+
+    :param samples: Array of shape (3, n) as returned by TimeSeries.
+    """
+    for t, temp1, temp2 in samples.T.tolist():
+        yield {'time': t, 'temp1': temp1, 'temp2': temp2}
+
+
+
+def to_lists(samples: np.ndarray) -> Dict[str, List[float]]:
+    """
+    Convert samples to a dictionary of lists by column name.
+
+    :param samples: Array of shape (3, n) as returned by TimeSeries.
+    """
+    return {name: column.tolist() for name, column in zip(COLUMNS, samples)}
@@ -0,0 +1,226 @@
+"""
+Parsers for the Touchstone (.s2p) and formatted data (.csv) files saved for each sweep, and the
+SweepCache class.
+
+The numbers of a file are parsed in a single pass by NumPy rather than line by line.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import os
+import re
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+# Frequency units of the Touchstone option line, in Hz.
+FREQ_UNITS = {'HZ': 1.0, 'KHZ': 1e3, 'MHZ': 1e6, 'GHZ': 1e9}
+
+# Order of the S-parameters in a 2-port Touchstone file.
+SPARAMS = ('S11', 'S21', 'S12', 'S22')
+
+# Units of the S-parameters returned by ParsedSweep.columns.
+RI = 'ri'
+DB = 'db'
+
+# Bytes of parsed sweeps kept by default.
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+COMMENT = re.compile(rb'![^\n]*')
+OPTION_LINE = re.compile(rb'^[ \t]*#([^\n]*)', re.MULTILINE)
+CSV_BLOCK = re.compile(rb'BEGIN[^\n]*\n([^\n]*)\n(.*?)\bEND', re.DOTALL)
+
+
+@dataclass
+class ParsedSweep:
+    """
+    Dataclass for storing the contents of a sweep's files.
+    """
+    freq: np.ndarray  # frequencies in Hz, shape (points,)
+    sparams: Optional[np.ndarray] = None  # complex S11, S21, S12, S22, shape (4, points)
+    traces: Dict[str, np.ndarray] = field(default_factory=dict)  # formatted data by column name
+
+    @property
+    def nbytes(self) -> int:
+        return (self.freq.nbytes + (self.sparams.nbytes if self.sparams is not None else 0)
+                + sum(t.nbytes for t in self.traces.values()))
+
+    def columns(self, units: str = RI) -> Dict[str, np.ndarray]:
+        """
+        :param units: RI for the real and imaginary parts of the S-parameters, or DB for their
+        magnitude in dB and phase in degrees.
+        :return: Frequencies, S-parameters and formatted traces as named real columns.
+        """
+        columns = {'freq': self.freq}
+        if self.sparams is not None:
+            if units == DB:
+                a, b, suffixes = to_db(self.sparams), to_phase(self.sparams), ('db', 'deg')
+            else:
+                a, b, suffixes = self.sparams.real, self.sparams.imag, ('re', 'im')
+            for i, name in enumerate(SPARAMS):
+                columns[f'{name}_{suffixes[0]}'] = a[i]
+                columns[f'{name}_{suffixes[1]}'] = b[i]
+        columns.update(self.traces)
+        return columns
+
+
+def parse_numbers(data: bytes) -> np.ndarray:
+    """
+    :return: Every number in the text, separated by whitespace or commas, as a flat array.
+    """
+    text = data.replace(b',', b' ').decode('ascii', errors='replace')
+    return np.fromstring(text, dtype=np.float64, sep=' ')
+
+
+def parse_s2p(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a 2-port Touchstone file, in any of the RI, MA or DB formats.
+
+    :param data: Contents of the file.
+    :raises ValueError: If the file isn't a 2-port Touchstone file.
+    :return: Frequencies in Hz, shape (points,), and complex S11, S21, S12, S22, shape (4, points).
+    """
+    data = COMMENT.sub(b'', data)
+
+    # Defaults of the Touchstone format when there is no option line.
+    unit, fmt = 'GHZ', 'MA'
+    option = OPTION_LINE.search(data)
+    if option:
+        for word in option.group(1).decode('ascii', errors='replace').upper().split():
+            if word in FREQ_UNITS:
+                unit = word
+            elif word in ('RI', 'MA', 'DB'):
+                fmt = word
+        data = OPTION_LINE.sub(b'', data)
+
+    numbers = parse_numbers(data)
+    if len(numbers) % 9:
+        raise ValueError(f'Expected 9 numbers per frequency, got {len(numbers)} numbers.')
+    table = numbers.reshape(-1, 9).T
+
+    freq = table[0] * FREQ_UNITS[unit]
+    a, b = table[1::2], table[2::2]
+    if fmt == 'RI':
+        sparams = a + 1j * b
+    elif fmt == 'MA':
+        sparams = a * np.exp(1j * np.deg2rad(b))
+    else:
+        sparams = 10 ** (a / 20) * np.exp(1j * np.deg2rad(b))
+    return freq, sparams
+
+
+def parse_fdata_csv(data: bytes) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Parse a formatted data .csv file saved by the VNA (MMEM:STOR:FDAT) or by Sweep.write_csv. The
+    file may hold several BEGIN/END blocks, one per trace.
+
+    :param data: Contents of the file.
+    :raises ValueError: If the file has no data block.
+    :return: Frequencies in Hz, and the values of each trace by column name.
+    """
+    data = data.replace(b'\r\n', b'\n')
+    freq = None
+    traces: Dict[str, np.ndarray] = {}
+    for header, body in CSV_BLOCK.findall(data):
+        names = [name.strip() for name in header.decode('utf-8', errors='replace').split(',')]
+        table = parse_numbers(body)
+        if len(table) % len(names):
+            raise ValueError(f'Expected {len(names)} numbers per row.')
+        table = table.reshape(-1, len(names)).T
+        if freq is None:
+            freq = table[0]
+        for name, values in zip(names[1:], table[1:]):
+            traces[name] = values
+    if freq is None:
+        raise ValueError('No data block found.')
+    return freq, traces
+
+
+def to_db(sparams: np.ndarray) -> np.ndarray:
+    """
+    :return: Magnitude of the S-parameters in dB.
+    """
+    with np.errstate(divide='ignore'):
+        return 20 * np.log10(np.abs(sparams))
+
+
+def to_phase(sparams: np.ndarray) -> np.ndarray:
+    """
+    :return: Phase of the S-parameters in degrees.
+    """
+    return np.rad2deg(np.angle(sparams))
+
+
+class SweepCache:
+    """
+    Least recently used cache of parsed sweep files, bounded by the bytes of the parsed arrays.
+    Entries are keyed by path, size and modification time, so a file that changes is parsed again.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        """
+        :param max_bytes: Bytes of parsed arrays to keep.
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[str, int, int], ParsedSweep]' = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, csv_path: Optional[str], s2p_path: Optional[str]) -> ParsedSweep:
+        """
+        Parse the files of a sweep, or return them from the cache. Either file may be missing.
+
+        :raises FileNotFoundError: If neither file exists.
+        :raises ValueError: If a file can't be parsed.
+        """
+        key = (csv_path, s2p_path) + tuple(self._version(p) for p in (csv_path, s2p_path))
+        if key[2] is None and key[3] is None:
+            raise FileNotFoundError(f'No files for the sweep {csv_path or s2p_path}.')
+
+        with self._lock:
+            sweep = self._entries.get(key)
+            if sweep is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return sweep
+            self.misses += 1
+
+        sweep = self._parse(csv_path if key[2] else None, s2p_path if key[3] else None)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = sweep
+                self.bytes += sweep.nbytes
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+        return sweep
+
+    @staticmethod
+    def _version(path: Optional[str]) -> Optional[Tuple[int, int]]:
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _parse(csv_path: Optional[str], s2p_path: Optional[str]) -> ParsedSweep:
+        freq = None
+        sweep = ParsedSweep(freq=np.empty(0))
+        if s2p_path:
+            with open(s2p_path, 'rb') as f:
+                freq, sweep.sparams = parse_s2p(f.read())
+        if csv_path:
+            with open(csv_path, 'rb') as f:
+                csv_freq, sweep.traces = parse_fdata_csv(f.read())
+            if freq is None:
+                freq = csv_freq
+        sweep.freq = freq
+        return sweep
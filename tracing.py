@@ -0,0 +1,105 @@
+"""
+Module for the Tracer class, which records how long each phase of the acquisition takes.
+
+Spans are kept in a bounded ring in memory and dumped in the Chrome Trace Event format, which can
+be opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing. Tracing is off by default;
+a disabled span costs a single attribute check.
+"""
+
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from threading import current_thread, get_ident
+import time
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+
+# Number of spans kept in memory, about an hour of a busy experiment.
+DEFAULT_CAPACITY = 100000
+
+# Shared no-op context manager returned by span() while tracing is disabled.
+_DISABLED = nullcontext()
+
+
+class Tracer:
+    """
+    Records spans from any thread into a bounded ring. Once the ring is full, the oldest spans are
+    dropped.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        :param capacity: Number of spans kept in memory.
+        """
+        # Whether spans are recorded.
+        self.enabled = False
+
+        # Spans as (name, category, start, duration, thread id, args), times in perf_counter()
+        # seconds. Appending to a deque with a maxlen is atomic, so recording takes no lock.
+        self._spans: Deque[Tuple[str, str, float, float, int, Optional[Dict]]] = deque(maxlen=capacity)
+
+        # Names of the threads that recorded spans, by thread id.
+        self._threads: Dict[int, str] = {}
+
+        # Offset from perf_counter() to the epoch, so the trace shows wall-clock times.
+        self._epoch = time.time() - time.perf_counter()
+
+    def span(self, name: str, cat: str = 'app', **args):
+        """
+        Context manager recording the time taken by its with block, even if it raises.
+
+        :param name: Name of the span, such as 'sweep'.
+        :param cat: Category of the span, such as 'vna'.
+        :param args: Values shown with the span.
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._span(name, cat, args)
+
+    @contextmanager
+    def _span(self, name: str, cat: str, args: Dict) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, cat, start, time.perf_counter() - start, args)
+
+    def record(self, name: str, cat: str, start: float, duration: float, args: Optional[Dict] = None) -> None:
+        """
+        Record a span timed by the caller.
+
+        :param start: Start of the span, from time.perf_counter().
+        :param duration: Seconds the span took.
+        """
+        if not self.enabled:
+            return
+        # Thread ids are reused, so the name is updated every time.
+        tid = get_ident()
+        self._threads[tid] = current_thread().name
+        self._spans.append((name, cat, start, duration, tid, args or None))
+
+    def dump(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict:
+        """
+        :param start: Only include spans ending after this timestamp, defaults to the oldest span.
+        :param end: Only include spans starting before this timestamp, defaults to now.
+        :return: The spans in the Chrome Trace Event format, ready to be serialized to JSON.
+        """
+        events = []
+        for name, cat, span_start, duration, tid, args in list(self._spans):
+            t = self._epoch + span_start
+            if (start is not None and t + duration < start) or (end is not None and t > end):
+                continue
+            event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': t * 1e6, 'dur': duration * 1e6, 'pid': 1, 'tid': tid}
+            if args:
+                event['args'] = args
+            events.append(event)
+
+        # Name the threads so that the acquisition, VNA workers and HTTP handlers can be told apart.
+        for tid, thread_name in list(self._threads.items()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread_name}})
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 0, 'args': {'name': 'CryoInterface'}})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+# Tracer shared by the application, enabled with the 'tracing' configuration or --trace.
+TRACER = Tracer()
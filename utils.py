@@ -3,13 +3,8 @@ Utility functions used in various places throughout the program.
 """
 
 import dataclasses
-import glob
+from datetime import datetime
 import json
-import os
-import sys
-from typing import List
-
-import serial
 
 
 class EnhancedJSONEncoder(json.JSONEncoder):
@@ -22,41 +17,12 @@ class EnhancedJSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 
-def find_available_devices() -> List[str]:
-    """
-    Lists serial port names.
-    Based off of: https://stackoverflow.com/questions/12090503/listing-available-com-ports-with-python
-
-    :raises EnvironmentError: On unsupported or unknown platforms
-    :returns: A list of the serial ports available on the system
+def timestamp_name(t: float) -> str:
     """
-    if sys.platform.startswith('win'):
-        ports = ['COM%s' % (i + 1) for i in range(256)]
-    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-        # this excludes your current terminal "/dev/tty"
-        ports = glob.glob('/dev/tty[A-Za-z]*')
-    elif sys.platform.startswith('darwin'):
-        ports = glob.glob('/dev/tty.*')
-    else:
-        raise EnvironmentError('Unsupported platform')
+    Build the timestamp part of the name of a sweep's files.
 
-    result: List[str] = []
-    for port in ports:
-        s = None
-        try:
-            s = serial.Serial(port)
-            s.close()
-            result.append(port)
-        except Exception:
-            if s:
-                s.close()
-    return result
-
-
-def find_previous_experiments() -> List[str]:
-    """
-    Find what previous experiments are available.
-    
-    :returns: List of directories (experiment names)
+    :param t: Timestamp of the sweep.
+    :returns: The local time as YYYY_MM_DD_HH_MM_SS.
     """
-    return next(os.walk('experiments/'))[1]
+    dt = datetime.fromtimestamp(t)
+    return f'{dt.year}_{dt.month:02d}_{dt.day:02d}_{dt.hour:02d}_{dt.minute:02d}_{dt.second:02d}'
@@ -1,9 +1,14 @@
-
 import socket
+from typing import BinaryIO
+
+import numpy as np
 
 
 VNA_PORT = 5025
 
+# Size of the buffer used to receive blocks from the VNA.
+CHUNK_SIZE = 64 * 1024
+
 
 def build_cmd(cmd: str) -> bytes:
     cmd = cmd + '\n'
@@ -15,3 +20,158 @@ def send_cmd(s: socket.socket, cmd: str):
     bytes_sent = s.send(encoded)
     if bytes_sent != len(encoded):
         raise RuntimeError('Not all data was sent.')
+
+
+def drain(s: socket.socket) -> int:
+    """
+    Discard any bytes left in the socket, such as unread replies to earlier queries.
+
+    :return: Number of bytes discarded.
+    """
+    timeout = s.gettimeout()
+    s.setblocking(False)
+    drained = 0
+    try:
+        while True:
+            recv = s.recv(CHUNK_SIZE)
+            if not recv:
+                break
+            drained += len(recv)
+    except (BlockingIOError, InterruptedError):
+        pass
+    finally:
+        s.settimeout(timeout)
+    return drained
+
+
+def recv_exactly(s: socket.socket, view: memoryview) -> None:
+    """
+    Fill the buffer with bytes from the socket.
+
+    :raises ConnectionError: If the connection is closed before the buffer is full.
+    """
+    received = 0
+    while received < len(view):
+        n = s.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError('Connection closed in the middle of a transfer.')
+        received += n
+
+
+def read_line(s: socket.socket) -> bytes:
+    """
+    Read a reply terminated by a newline character.
+
+    :return: The reply without the trailing newline.
+    """
+    line = bytearray()
+    while True:
+        c = s.recv(1)
+        if not c:
+            raise ConnectionError('Connection closed in the middle of a reply.')
+        if c == b'\n':
+            return bytes(line).rstrip(b'\r')
+        line += c
+
+
+def query(s: socket.socket, cmd: str) -> str:
+    """
+    Send a query and read its reply.
+
+    :return: The decoded reply.
+    """
+    send_cmd(s, cmd)
+    return read_line(s).decode('utf-8')
+
+
+def read_block_header(s: socket.socket) -> int:
+    """
+    Read the header of an IEEE 488.2 definite-length block (#<n><length>).
+
+    :raises ValueError: If the reply is not a definite-length block.
+    :return: Length of the block in bytes.
+    """
+    # Skip anything before the start of the block.
+    c = s.recv(1)
+    while c != b'#':
+        if not c:
+            raise ConnectionError('Connection closed before the block started.')
+        c = s.recv(1)
+
+    digits = bytearray(1)
+    recv_exactly(s, memoryview(digits))
+    n = int(digits.decode('ascii'))
+    if n == 0:
+        raise ValueError('Indefinite-length blocks are not supported.')
+
+    length = bytearray(n)
+    recv_exactly(s, memoryview(length))
+    return int(length.decode('ascii'))
+
+
+def read_block(s: socket.socket, wf: BinaryIO) -> int:
+    """
+    Read an IEEE 488.2 definite-length block and write its contents to a file.
+
+    :param s: Socket to read the block from.
+    :param wf: Binary file to write the contents to.
+    :return: Number of bytes written.
+    """
+    length = read_block_header(s)
+
+    buf = bytearray(min(length, CHUNK_SIZE))
+    view = memoryview(buf)
+    remaining = length
+    while remaining:
+        chunk = view[:min(remaining, len(buf))]
+        recv_exactly(s, chunk)
+        wf.write(chunk)
+        remaining -= len(chunk)
+
+    # Consume the newline terminating the reply.
+    read_line(s)
+
+    return length
+
+
+def query_block(s: socket.socket, cmd: str, wf: BinaryIO) -> int:
+    """
+    Send a query that replies with a definite-length block and write the block to a file.
+    Stale bytes are drained from the socket first so they aren't mistaken for the reply.
+
+    :return: Number of bytes written.
+    """
+    drain(s)
+    send_cmd(s, cmd)
+    return read_block(s, wf)
+
+
+def read_binary_block(s: socket.socket) -> np.ndarray:
+    """
+    Read an IEEE 488.2 definite-length block of big-endian 64-bit floats (FORM:DATA REAL,64
+    with FORM:BORD NORM) straight into a NumPy array.
+
+    :return: Array of the values in the block.
+    """
+    length = read_block_header(s)
+    if length % 8:
+        raise ValueError(f'Block of {length} bytes does not hold 64-bit floats.')
+
+    values = np.empty(length // 8, dtype='>f8')
+    recv_exactly(s, memoryview(values).cast('B'))
+
+    # Consume the newline terminating the reply.
+    read_line(s)
+
+    return values
+
+
+def query_binary(s: socket.socket, cmd: str) -> np.ndarray:
+    """
+    Send a query that replies with a block of 64-bit floats and read it.
+
+    :return: Array of the values in the reply.
+    """
+    drain(s)
+    send_cmd(s, cmd)
+    return read_binary_block(s)
@@ -1,121 +1,115 @@
-
-import csv
+import io
 import logging
 import socket
-import time
+from typing import Optional
+
+import numpy as np
+
+from sweep import Sweep
+from tracing import TRACER
+from vna import drain, query, query_binary, query_block
+
+
+def ping_vna(s: socket.socket) -> None:
+    """
+    Check that the VNA still answers, with *OPC? which is cheaper than *IDN?.
+
+    :raises ValueError: If the reply is not the expected one.
+    """
+    # Discard anything left over so the reply lines up with the query.
+    drain(s)
+    with TRACER.span('*OPC?', 'vna'):
+        reply = query(s, '*OPC?')
+    if reply.strip() != '1':
+        raise ValueError(f'Unexpected reply to *OPC?: {reply!r}')
+
+
+def vna_points(s: socket.socket) -> int:
+    """
+    :return: Number of points per sweep the VNA is set to.
+    """
+    with TRACER.span('SENS:SWE:POIN?', 'vna'):
+        return int(float(query(s, 'SENS:SWE:POIN?')))
+
+
+def vna_s2p(s: socket.socket, points: Optional[int] = None) -> bytes:
+    """
+    Copy the current sweep's .s2p file from the VNA.
 
-from vna import send_cmd
+    :param points: Number of points per sweep, read from the VNA by default.
+    :raises ValueError: If the file doesn't hold a line per point.
+    """
+    if points is None:
+        points = vna_points(s)
+
+    # Save trace into .s2p file on the VNA and wait for the write to complete.
+    send_cmd_and_wait(s, 'MMEM:STOR:SNP "CryoIntS.s2p"')
+
+    # The reply is a definite-length block, so it is read in full without guessing. It is kept
+    # in memory and left to the caller to write, so the transfer doesn't wait on the disk.
+    buf = io.BytesIO()
+    with TRACER.span('MMEM:DATA? "CryoIntS.s2p"', 'vna'):
+        query_block(s, 'MMEM:DATA? "CryoIntS.s2p"', buf)
+    data = buf.getvalue()
+
+    # Count the data lines, skipping the comments ('!') and the option line ('#').
+    lines = sum(1 for line in data.splitlines() if line.strip() and line.lstrip()[:1] not in (b'!', b'#'))
+
+    if lines != points:
+        raise ValueError(f'Expected {points} data lines in the .s2p file, got {lines}.')
+
+    logging.debug(f'Transferred CryoIntS.s2p, {len(data)} bytes.')
+    return data
+
+
+def vna_csv(s: socket.socket) -> bytes:
+    # Save the formatted data into a .csv file on the VNA and wait for the write to complete.
+    send_cmd_and_wait(s, 'MMEM:STOR:FDAT "CryoIntC.csv"')
 
+    # The reply is a definite-length block, so it is read in full without guessing.
+    buf = io.BytesIO()
+    with TRACER.span('MMEM:DATA? "CryoIntC.csv"', 'vna'):
+        query_block(s, 'MMEM:DATA? "CryoIntC.csv"', buf)
 
-def ping_vna(s: socket.socket) -> bool:
+    logging.debug(f'Transferred CryoIntC.csv, {buf.tell()} bytes.')
+    return buf.getvalue()
+
+
+def send_cmd_and_wait(s: socket.socket, cmd: str) -> None:
     """
-    :return: True if the VNA could be pinged, False otherwise.
+    Send a command and block until the VNA has finished executing it.
+    """
+    drain(s)
+    with TRACER.span(cmd, 'vna'):
+        query(s, f'{cmd};*OPC?')
+
+
+def vna_binary(s: socket.socket) -> Sweep:
+    """
+    Transfer the current sweep as binary 64-bit floats, without storing files on the VNA.
+
+    :return: The sweep's frequencies, formatted data and S-parameters.
     """
-    try:
-        # Ask the VNA to identify itself.
-        send_cmd(s, cmd='*IDN?')
-        # Read the response back.
-        recv = s.recv(2048)
-        return True
-    except:
-        logging.exception('Error.')
-        try:
-            s.close()
-        except:
-            logging.exception('Error closing connection.')
-        return False
-
-def vna_s2p(s: socket.socket, resolution: int, fpath: str) -> bool:
-    # copy s2p file to computer
-    # Example resolution input = 201 (number of data points)
-
-    # 12 additional rows for data
-    expected_size = resolution + 12
-
-    # Save trace into .s2p file on the VNA
-    send_cmd(s, cmd='MMEM:STOR:SNP "CryoIntS.s2p"')
-
-    # The transfer of data is an inconsistent task. This while loop was put in place to repeat it until the data is successfully written into a file
-    for _ in range(10):
-        send_cmd(s, cmd='MMEM:DATA? "CryoIntS.s2p"')
-
-        recv = s.recv(1000000) #recv data, arg sets max number of bytes
-        contents = recv.decode('utf-8')
-
-        try:
-            idx = contents.index('!')
-            contents = contents[idx:]
-        except ValueError:
-            time.sleep(1)
-            print('Trying again...')
-            continue
-
-        lines = contents.rstrip().split('\r\n')
-        
-        # print(f'expected={expected_size}; actual={len(lines)}')
-
-        with open(fpath, 'w', encoding='utf-8') as wf:
-            for line in lines:
-                wf.write(line+'\n')
-
-        if len(lines) == expected_size:
-            print('Success!')
-            return True
-        else:
-            time.sleep(1)
-            print('Trying again...')
-            continue
-
-    # return True #transfer is good, return True
-    print('Failed after 10 tries.')
-    return False
-
-
-def vna_csv(s: socket.socket, fpath: str) -> bool:
-    send_cmd(s, cmd='MMEM:STOR:FDAT "CryoIntC.csv"')
-    print('Sent command: MMEM:STOR:FDAT "CryoIntC.csv"')
-
-    for _ in range(10):
-
-        # The transfer of data is an inconsistent task. This while loop was put in place to repeat it until the data is successfully written into a file
-        # while True:
-        send_cmd(s, cmd='MMEM:DATA? "CryoIntC.csv"')
-        print('Sent command: MMEM:DATA? "CryoIntC.csv"')
-
-        recv = s.recv(20000000) #recv data, arg sets max number of bytes
-        contents = recv.decode('utf-8')
-
-        try:
-            idx = contents.index('!')
-            contents = contents[idx:]
-        except ValueError:
-            time.sleep(1)
-            continue
-
-        bc = contents.count('BEGIN')
-        ec = contents.count('END')
-        if bc != 4 or ec != 4:
-            print(f'BEGIN COUNT: {bc}; END COUNT: {ec}')
-            print('File did not fully transfer.')
-            time.sleep(1)
-            continue
-
-        # The transfer would first write some artifact type number usually something like #533281.
-        # The following code removes the characters before the first '!' which marks the start of the information we want
-        try:
-            begin_idx = contents.index('BEGIN')
-            end_idx = contents.rindex('END')
-        except ValueError:
-            time.sleep(1)
-            continue
-        contents = contents[0:end_idx+3]
-
-        with open(fpath, 'w', encoding='utf-8') as csv_wf:
-            for line in contents.split('\n'):
-                csv_wf.write(line)
-
-        print('Success!')
-        return True
-    
-    print('Failed after 10 retries.')
-    return False
+    # Transfer numbers as big-endian 64-bit floats, and S-parameters as real/imaginary pairs.
+    # This is chained with the first query so that it doesn't go out as a separate small packet
+    # held back by Nagle's algorithm.
+    with TRACER.span('SENS:FREQ:DATA?', 'vna'):
+        freq = query_binary(s, 'FORM:DATA REAL,64;:FORM:BORD NORM;:MMEM:STOR:TRAC:FORM:SNP RI;:SENS:FREQ:DATA?')
+
+    # Formatted data comes as (primary, secondary) pairs, the secondary value is only used by
+    # complex formats like Smith charts.
+    with TRACER.span('CALC:DATA? FDATA', 'vna'):
+        formatted = query_binary(s, 'CALC:DATA? FDATA').reshape(-1, 2)[:, 0]
+
+    # The S-parameters come one column at a time: frequency, then real and imaginary parts of
+    # S11, S21, S12 and S22.
+    with TRACER.span('CALC:DATA:SNP? 2', 'vna'):
+        snp = query_binary(s, 'CALC:DATA:SNP? 2').reshape(9, -1)
+    sparams = snp[1::2] + 1j * snp[2::2]
+
+    if not len(freq) == len(formatted) == sparams.shape[1]:
+        raise ValueError('The VNA returned traces of different lengths.')
+
+    return Sweep(freq=freq.astype(np.float64),
+                 formatted=formatted.astype(np.float64),
+                 sparams=sparams)
@@ -0,0 +1,262 @@
+"""
+Local simulator of a VNA's SCPI socket interface, used to test and benchmark the acquisition
+path without a physical instrument.
+
+Run it with: python vna_sim.py [--port 5025] [--points 201] [--latency 0.0] ...
+"""
+
+import argparse
+from dataclasses import dataclass
+import random
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from vna import VNA_PORT
+
+
+@dataclass
+class SimConfig:
+    """
+    Dataclass for storing the simulator's behavior.
+    """
+    points: int = 201  # points per sweep
+    latency: float = 0.0  # seconds before each reply
+    fragment: int = 0  # bytes per send() call, 0 sends each reply at once
+    fragment_delay: float = 0.0  # seconds between fragments
+    truncate: float = 0.0  # probability of closing the connection in the middle of a block
+
+
+class VNASimulator(socketserver.ThreadingTCPServer):
+    """
+    TCP server speaking the subset of SCPI used by vna_funcs.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = VNA_PORT, config: Optional[SimConfig] = None, host: str = '127.0.0.1'):
+        super().__init__((host, port), SimHandler)
+
+        # Behavior of the simulator.
+        self.config = config or SimConfig()
+
+        # Files stored with MMEM:STOR, by name.
+        self.files: Dict[str, bytes] = {}
+
+        # Bytes sent to all clients.
+        self.bytes_sent = 0
+
+        # Number of transfers cut short on purpose.
+        self.truncated = 0
+
+        # Lock for the counters.
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        """
+        Port the simulator is listening on.
+        """
+        return self.server_address[1]
+
+    def start(self) -> threading.Thread:
+        """
+        Serve in a background thread.
+
+        :return: The thread serving requests.
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        """
+        Stop serving and close the listening socket.
+        """
+        self.shutdown()
+        self.server_close()
+
+    def sweep(self):
+        """
+        :return: Frequencies and S-parameters of a synthetic sweep.
+        """
+        points = self.config.points
+        freq = np.linspace(1e9, 3e9, points)
+        phase = np.linspace(0, 8 * np.pi, points)
+        noise = np.random.normal(0, 0.01, (4, points))
+        sparams = (0.5 + noise) * np.exp(1j * (phase + np.arange(4)[:, None]))
+        return freq, sparams
+
+    def fdat_csv(self) -> bytes:
+        """
+        :return: Contents of a formatted data .csv file with a trace per S-parameter.
+        """
+        freq, sparams = self.sweep()
+        lines = ['!CSV A.01.01', '!Simulated VNA']
+        for i, name in enumerate(['S11', 'S21', 'S12', 'S22']):
+            lines.append(f'BEGIN CH1_DATA_{name}')
+            lines.append(f'Freq(Hz),{name} Log Mag(dB)')
+            db = 20 * np.log10(np.abs(sparams[i]))
+            lines.extend(f'{f:.0f},{v:.6e}' for f, v in zip(freq, db))
+            lines.append('END')
+        return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+    def snp(self) -> bytes:
+        """
+        :return: Contents of a Touchstone .s2p file with 12 header lines.
+        """
+        freq, sparams = self.sweep()
+        lines = [f'!Simulated VNA line {i}' for i in range(11)]
+        lines.append('# Hz S RI R 50')
+        for j, f in enumerate(freq):
+            values = ' '.join(f'{s[j].real:.6e} {s[j].imag:.6e}' for s in sparams)
+            lines.append(f'{f:.0f} {values}')
+        return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+class SimHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one client connection to the simulator.
+    """
+
+    server: VNASimulator
+
+    # Send small replies right away like an instrument would.
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # Whether numbers are transferred as binary 64-bit floats.
+        self.binary = False
+
+        for line in self.rfile:
+            # Commands can be chained with ';', a leading ':' resets the command tree.
+            for cmd in line.decode('utf-8').strip().split(';'):
+                cmd = cmd.strip().lstrip(':')
+                if not cmd:
+                    continue
+                if not self.execute(cmd):
+                    return
+
+    def execute(self, cmd: str) -> bool:
+        """
+        Execute a single command.
+
+        :return: False if the connection was closed, True otherwise.
+        """
+        server = self.server
+        header, _, arg = cmd.partition(' ')
+        header = header.upper()
+        arg = arg.strip().strip('"')
+
+        if header == '*IDN?':
+            return self.reply(b'Simulated,VNA,0,1.0\n')
+        elif header == '*OPC?':
+            return self.reply(b'1\n')
+        elif header == 'FORM:DATA':
+            self.binary = arg.upper().startswith('REAL')
+        elif header == 'MMEM:STOR:FDAT':
+            server.files[arg] = server.fdat_csv()
+        elif header == 'MMEM:STOR:SNP':
+            server.files[arg] = server.snp()
+        elif header == 'MMEM:DATA?':
+            return self.reply_block(server.files.get(arg, b''))
+        elif header == 'SENS:SWE:POIN?':
+            return self.reply(f'{server.config.points}\n'.encode('ascii'))
+        elif header == 'SENS:FREQ:DATA?':
+            freq, _ = server.sweep()
+            return self.reply_values(freq)
+        elif header == 'CALC:DATA?':
+            freq, sparams = server.sweep()
+            db = 20 * np.log10(np.abs(sparams[0]))
+            return self.reply_values(np.column_stack((db, np.zeros_like(db))).ravel())
+        elif header == 'CALC:DATA:SNP?':
+            freq, sparams = server.sweep()
+            columns: List[np.ndarray] = [freq]
+            for s in sparams:
+                columns.extend((s.real, s.imag))
+            return self.reply_values(np.concatenate(columns))
+        # Other commands (FORM:BORD, MMEM:STOR:TRAC:FORM:SNP, ...) are accepted and ignored.
+        return True
+
+    def reply_values(self, values: np.ndarray) -> bool:
+        """
+        Reply with numbers in the current data format.
+        """
+        if self.binary:
+            return self.reply_block(values.astype('>f8').tobytes())
+        return self.reply((','.join(f'{v:.12g}' for v in values) + '\n').encode('utf-8'))
+
+    def reply_block(self, data: bytes) -> bool:
+        """
+        Reply with an IEEE 488.2 definite-length block.
+        """
+        length = str(len(data)).encode('ascii')
+        payload = b'#' + str(len(length)).encode('ascii') + length + data + b'\n'
+
+        if random.random() < self.server.config.truncate:
+            # Send part of the block and hang up.
+            with self.server.lock:
+                self.server.truncated += 1
+            self.reply(payload[:random.randrange(1, len(payload))])
+            return False
+
+        return self.reply(payload)
+
+    def reply(self, payload: bytes) -> bool:
+        """
+        Send a reply, applying the configured latency and fragmentation.
+        """
+        config = self.server.config
+        if config.latency:
+            time.sleep(config.latency)
+
+        try:
+            if config.fragment:
+                for i in range(0, len(payload), config.fragment):
+                    self.wfile.write(payload[i:i+config.fragment])
+                    self.wfile.flush()
+                    if config.fragment_delay:
+                        time.sleep(config.fragment_delay)
+            else:
+                self.wfile.write(payload)
+                self.wfile.flush()
+        except OSError:
+            return False
+
+        with self.server.lock:
+            self.server.bytes_sent += len(payload)
+        return True
+
+
+def main():
+    """
+    Main function.
+    """
+    parser = argparse.ArgumentParser(description='Simulate a VNA on a local TCP port.')
+    parser.add_argument('--port', type=int, default=VNA_PORT)
+    parser.add_argument('--points', type=int, default=201, help='points per sweep')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each reply')
+    parser.add_argument('--fragment', type=int, default=0, help='bytes per send() call')
+    parser.add_argument('--fragment-delay', type=float, default=0.0, help='seconds between fragments')
+    parser.add_argument('--truncate', type=float, default=0.0, help='probability of cutting a transfer short')
+    args = parser.parse_args()
+
+    config = SimConfig(points=args.points,
+                       latency=args.latency,
+                       fragment=args.fragment,
+                       fragment_delay=args.fragment_delay,
+                       truncate=args.truncate)
+    server = VNASimulator(port=args.port, config=config)
+    print(f'Simulated VNA listening on port {server.port}.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
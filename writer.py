@@ -0,0 +1,279 @@
+"""
+Module for the Writer class, which takes disk writes off the acquisition path.
+
+Writes are queued and carried out in order on the writer's own thread. Everything queued while the
+previous batch was being written goes out as the next batch, and appended files are only flushed
+(and optionally fsynced) once enough writes have piled up or enough time has passed, so a slow disk
+delays when data becomes durable instead of when it is acquired.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+import logging
+import os
+from threading import Condition, Event, Lock, Thread
+import time
+from typing import BinaryIO, Callable, Deque, Dict, List, Optional, Tuple
+
+from config import Config
+from tracing import TRACER
+
+
+# Most writes waiting in the queue before writers have to wait.
+MAX_QUEUE_ITEMS = 10000
+
+# Most bytes waiting in the queue before writers have to wait.
+MAX_QUEUE_BYTES = 64 * 1024 * 1024
+
+APPEND = 'append'
+WRITE_FILE = 'write_file'
+CALL = 'call'
+CLOSE = 'close'
+SYNC = 'sync'
+
+
+@dataclass
+class WriterStats:
+    """
+    Dataclass for storing the statistics of the writer.
+    """
+    queued: int = 0  # writes waiting in the queue
+    queued_bytes: int = 0
+    max_queued: int = 0
+    written: int = 0  # writes carried out
+    bytes_written: int = 0
+    batches: int = 0
+    flushes: int = 0
+    fsyncs: int = 0
+    blocked: int = 0  # writes that had to wait for room in the queue
+    blocked_time: float = 0.0  # seconds spent waiting for room
+    errors: int = 0
+    last_latency: float = 0.0  # seconds from queuing the oldest write of the last batch to writing it
+    max_latency: float = 0.0
+
+
+class Writer(Thread):
+    """
+    Thread carrying out queued writes in batches. The queue is bounded, so if the disk can't keep up
+    the threads queuing writes eventually wait rather than using more memory; that wait shows up in
+    the blocked statistics.
+    """
+
+    def __init__(self, config: Config, max_items: int = MAX_QUEUE_ITEMS, max_bytes: int = MAX_QUEUE_BYTES):
+        """
+        :param config: Configuration holding the flush policy, read before each flush.
+        :param max_items: Most writes waiting in the queue.
+        :param max_bytes: Most bytes waiting in the queue.
+        """
+        super().__init__(daemon=True, name='writer')
+        self.config = config
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.stats = WriterStats()
+
+        # Queued writes as (kind, args, size, time queued).
+        self._queue: Deque[Tuple[str, Tuple, int, float]] = deque()
+        self._cond = Condition()
+        self._stopping = False
+
+        # Files being appended to, kept open between batches.
+        self._files: Dict[str, BinaryIO] = {}
+
+        # Appends not flushed yet, and when the first of them was written.
+        self._unflushed = 0
+        self._unflushed_since: Optional[float] = None
+
+        # Held while writing, so writes after stop() don't overlap with the last batch.
+        self._io_lock = Lock()
+
+    def append(self, path: str, data: bytes) -> None:
+        """
+        Append to a file, which is kept open until close_file().
+        """
+        self._put(APPEND, (path, data), len(data))
+
+    def write_file(self, path: str, data: bytes) -> None:
+        """
+        Replace the contents of a file.
+        """
+        self._put(WRITE_FILE, (path, data), len(data))
+
+    def call(self, fn: Callable, *args, size: int = 0) -> None:
+        """
+        Call a function that writes to disk, in order with the other writes. Errors are logged.
+
+        :param size: Bytes the function holds on to while queued, for the queue's limit.
+        """
+        self._put(CALL, (fn, args), size)
+
+    def close_file(self, path: str) -> None:
+        """
+        Flush and close a file appended to.
+        """
+        self._put(CLOSE, (path,), 0)
+
+    def sync(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far is written and flushed.
+
+        :return: False if the timeout expired first.
+        """
+        done = Event()
+        self._put(SYNC, (done,), 0)
+        return done.wait(timeout)
+
+    def stop(self) -> None:
+        """
+        Write everything still queued, close the files and stop the thread.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
+
+    def _put(self, kind: str, args: Tuple, size: int) -> None:
+        with self._cond:
+            if self._stopping:
+                # Nothing will pick it up anymore, so write it right away.
+                with self._io_lock:
+                    self._process([(kind, args, size, time.monotonic())])
+                    self._close_all()
+                return
+
+            blocked_at = None
+            while self._queue and (len(self._queue) >= self.max_items or
+                                   self.stats.queued_bytes + size > self.max_bytes):
+                if blocked_at is None:
+                    blocked_at = time.monotonic()
+                    self.stats.blocked += 1
+                self._cond.wait()
+            if blocked_at is not None:
+                self.stats.blocked_time += time.monotonic() - blocked_at
+
+            self._queue.append((kind, args, size, time.monotonic()))
+            self.stats.queued = len(self._queue)
+            self.stats.queued_bytes += size
+            self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+            self._cond.notify_all()
+
+    def run(self):
+        """
+        Function that is run when the thread is started.
+        """
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    timeout = self._flush_due_in()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                batch = list(self._queue)
+                self._queue.clear()
+                self.stats.queued = 0
+                self.stats.queued_bytes = 0
+                stopping = self._stopping
+                # Let waiting writers queue the next batch while this one is written.
+                self._cond.notify_all()
+
+            with self._io_lock, TRACER.span('write_batch', 'disk', writes=len(batch)):
+                self._process(batch)
+                self._flush(force=stopping)
+                if stopping:
+                    self._close_all()
+            if stopping:
+                return
+
+    def _flush_due_in(self) -> Optional[float]:
+        """
+        :return: Seconds until the appended files are due to be flushed, None if nothing is pending.
+        """
+        if self._unflushed_since is None:
+            return None
+        return self._unflushed_since + self.config.flush_interval - time.monotonic()
+
+    def _process(self, batch: List[Tuple[str, Tuple, int, float]]) -> None:
+        """
+        Carry out a batch of writes, in order.
+        """
+        if not batch:
+            return
+        for kind, args, size, _ in batch:
+            try:
+                if kind == APPEND:
+                    path, data = args
+                    f = self._files.get(path)
+                    if f is None:
+                        f = self._files[path] = open(path, 'ab')
+                    f.write(data)
+                    self._unflushed += 1
+                    if self._unflushed_since is None:
+                        self._unflushed_since = time.monotonic()
+                elif kind == WRITE_FILE:
+                    path, data = args
+                    self._close(path)
+                    with open(path, 'wb') as f:
+                        f.write(data)
+                        if self.config.fsync:
+                            f.flush()
+                            os.fsync(f.fileno())
+                            self.stats.fsyncs += 1
+                elif kind == CALL:
+                    fn, fn_args = args
+                    fn(*fn_args)
+                elif kind == CLOSE:
+                    self._close(args[0])
+                elif kind == SYNC:
+                    self._flush(force=True)
+                    args[0].set()
+                self.stats.written += 1
+                self.stats.bytes_written += size
+            except:
+                self.stats.errors += 1
+                logging.exception(f'Error writing ({kind}).')
+
+        latency = time.monotonic() - batch[0][3]
+        self.stats.batches += 1
+        self.stats.last_latency = latency
+        self.stats.max_latency = max(self.stats.max_latency, latency)
+
+    def _flush(self, force: bool = False) -> None:
+        """
+        Flush the appended files if the policy says they are due.
+        """
+        if not self._unflushed:
+            return
+        due = (self._unflushed >= self.config.flush_count or
+               time.monotonic() - self._unflushed_since >= self.config.flush_interval)
+        if not (force or due):
+            return
+        for path, f in list(self._files.items()):
+            try:
+                f.flush()
+                if self.config.fsync:
+                    os.fsync(f.fileno())
+                    self.stats.fsyncs += 1
+            except:
+                self.stats.errors += 1
+                logging.exception(f'Error flushing {path}.')
+        self.stats.flushes += 1
+        self._unflushed = 0
+        self._unflushed_since = None
+
+    def _close(self, path: str) -> None:
+        f = self._files.pop(path, None)
+        if f is not None:
+            f.flush()
+            if self.config.fsync:
+                os.fsync(f.fileno())
+                self.stats.fsyncs += 1
+            f.close()
+
+    def _close_all(self) -> None:
+        self._flush(force=True)
+        for path in list(self._files):
+            try:
+                self._close(path)
+            except:
+                self.stats.errors += 1
+                logging.exception(f'Error closing {path}.')
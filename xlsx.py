@@ -0,0 +1,164 @@
+"""
+Minimal streaming writer for .xlsx workbooks.
+
+Worksheets are written as plain SpreadsheetML with inline strings, so the rows of a sheet can be
+rendered once, kept as an XML fragment and copied into any number of workbooks later.
+"""
+
+import math
+import re
+import shutil
+from typing import BinaryIO, Iterable, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+import zipfile
+
+
+# Deflate level of the workbook's parts, favoring speed since sheets are mostly numbers.
+COMPRESS_LEVEL = 1
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+SHEET_START = (XML_HEADER + f'<worksheet xmlns="{MAIN_NS}"><sheetData>').encode('utf-8')
+SHEET_END = b'</sheetData></worksheet>'
+
+STYLES = (XML_HEADER + f'<styleSheet xmlns="{MAIN_NS}">'
+          '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+          '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+          '<borders count="1"><border/></borders>'
+          '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+          '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+          '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+          '</styleSheet>')
+
+# Characters not allowed in XML 1.0 documents, such as most control characters.
+ILLEGAL_XML_CHARS = re.compile('[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+
+def column_letter(index: int) -> str:
+    """
+    :param index: Column index, starting at 0.
+    :return: The column's letters, such as 'A' or 'AB'.
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def xml_text(value) -> str:
+    """
+    :return: The value as text escaped for XML, without the characters XML doesn't allow.
+    """
+    return escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+
+
+def render_rows(rows: Iterable[Sequence], first_row: int = 1) -> bytes:
+    """
+    Render rows as the <row> elements of a worksheet.
+
+    :param rows: Rows of cell values: numbers, strings, booleans or None for an empty cell.
+    :param first_row: Number of the first row, starting at 1.
+    :return: The XML fragment.
+    """
+    parts: List[str] = []
+    for r, row in enumerate(rows, first_row):
+        parts.append(f'<row r="{r}">')
+        for c, value in enumerate(row):
+            ref = f'{column_letter(c)}{r}'
+            if value is None or (isinstance(value, float) and not math.isfinite(value)):
+                continue
+            if isinstance(value, bool):
+                parts.append(f'<c r="{ref}" t="b"><v>{int(value)}</v></c>')
+            elif isinstance(value, (int, float)):
+                parts.append(f'<c r="{ref}"><v>{value!r}</v></c>')
+            else:
+                parts.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{xml_text(value)}</t></is></c>')
+        parts.append('</row>')
+    return ''.join(parts).encode('utf-8')
+
+
+class WorkbookWriter:
+    """
+    Writes the sheets of a workbook one at a time, straight to the .xlsx file.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of the workbook.
+        """
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL)
+        self._sheets: List[str] = []
+
+    def add_sheet(self, name: str, rows: Optional[bytes] = None, fragments: Iterable[BinaryIO] = ()) -> None:
+        """
+        Add a worksheet made of rendered rows, followed by the contents of fragment files.
+
+        :param name: Name of the sheet.
+        :param rows: Rows rendered with render_rows.
+        :param fragments: Open files holding more rendered rows, copied in order.
+        """
+        self._sheets.append(name)
+        part = f'xl/worksheets/sheet{len(self._sheets)}.xml'
+        with self._zip.open(part, 'w', force_zip64=True) as f:
+            f.write(SHEET_START)
+            if rows:
+                f.write(rows)
+            for fragment in fragments:
+                shutil.copyfileobj(fragment, f)
+            f.write(SHEET_END)
+
+    def close(self) -> None:
+        """
+        Write the parts describing the workbook and close the file.
+        """
+        overrides = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(self._sheets) + 1))
+        self._write('[Content_Types].xml',
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                    '<Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" '
+                    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/styles.xml" '
+                    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                    f'{overrides}</Types>')
+        self._write('_rels/.rels',
+                    f'<Relationships xmlns="{PKG_REL_NS}">'
+                    f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+                    '</Relationships>')
+
+        sheets = ''.join(f'<sheet name={quoteattr(ILLEGAL_XML_CHARS.sub("", name))} sheetId="{i}" r:id="rId{i}"/>'
+                         for i, name in enumerate(self._sheets, 1))
+        self._write('xl/workbook.xml',
+                    f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>{sheets}</sheets></workbook>')
+
+        rels: List[Tuple[str, str]] = [(f'{REL_NS}/worksheet', f'worksheets/sheet{i}.xml')
+                                       for i in range(1, len(self._sheets) + 1)]
+        rels.append((f'{REL_NS}/styles', 'styles.xml'))
+        self._write('xl/_rels/workbook.xml.rels',
+                    f'<Relationships xmlns="{PKG_REL_NS}">'
+                    + ''.join(f'<Relationship Id="rId{i}" Type="{t}" Target="{target}"/>'
+                              for i, (t, target) in enumerate(rels, 1))
+                    + '</Relationships>')
+        self._zip.writestr('xl/styles.xml', STYLES)
+        self._zip.close()
+
+    def _write(self, name: str, xml: str) -> None:
+        self._zip.writestr(name, XML_HEADER + xml)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave out the parts describing the workbook, so the file doesn't open as a valid one.
+            self._zip.close()